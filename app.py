@@ -12,49 +12,195 @@ BASE_DIR = Path(__file__).parent
 DATA_DIR = BASE_DIR / "data"
 TEAM_FILE = DATA_DIR / "team_advanced.json"
 PLAYER_FILE = DATA_DIR / "player_advanced.json"
-SCHEDULE_FILE = DATA_DIR / "schedule_raw.json"  # 賽程（沒有比分）
-SCORE_FILE = DATA_DIR / "tpbl_crawler_raw.json"  # 比分（有 home_score / away_score）
+SCHEDULE_FILE = DATA_DIR / "schedule_raw.json"  # 統一賽程表（賽程資訊 + home_score / away_score）
 GAMES_FILE = DATA_DIR / "tpbl_crawler_raw.json"
 
+# 資料表讀取（有 Parquet 只讀需要的欄位，沒有就讀 JSON）
+sys.path.insert(0, str(BASE_DIR / "src"))
+import player_advanced  # noqa: E402
+import storage  # noqa: E402
+import team_rolling  # noqa: E402
+import warehouse  # noqa: E402
+
+storage.DATA_DIR = DATA_DIR
+warehouse.DB_PATH = DATA_DIR / "tpbl.sqlite"
+
+# 賽程頁 / 首頁用到的賽程欄位
+SCHEDULE_COLUMNS = (
+    "game_id", "date", "time", "datetime", "venue", "status", "is_live",
+    "home_team_id", "home_team_name", "home_score",
+    "away_team_id", "away_team_name", "away_score",
+)
+
+
+# ===== 讀檔（cache key 帶檔案的 mtime）=====
+# pipeline / live_poller 改寫資料檔後 mtime 變了，下一次 rerun 就會重讀，不用重開 server；
+# 檔案沒變就直接用 cache。
+
+def file_version(*paths):
+    """每個檔案的 mtime（ns，不存在是 None），當 cache key 用。"""
+    versions = []
+    for p in paths:
+        try:
+            versions.append(p.stat().st_mtime_ns)
+        except OSError:
+            versions.append(None)
+    return tuple(versions)
+
+
+def table_version(name):
+    """資料表的 JSON 與 Parquet 檔的 mtime。"""
+    return file_version(storage.json_path(name), storage.parquet_path(name))
+
+
+def db_version():
+    """SQLite 資料庫的 mtime（WAL 模式：寫入先進 -wal 檔，兩個都看）。"""
+    return file_version(warehouse.DB_PATH, warehouse.DB_PATH.with_name(warehouse.DB_PATH.name + "-wal"))
+
 
-@st.cache_data
 def load_team_advanced():
+    return _load_team_advanced(file_version(TEAM_FILE))
+
+
+@st.cache_data(max_entries=2)
+def _load_team_advanced(version):
     """讀取球隊進階數據 team_advanced.json"""
-    if not TEAM_ADV_PATH.exists():
+    if not TEAM_FILE.exists():
         return pd.DataFrame()
-    with TEAM_ADV_PATH.open("r", encoding="utf-8") as f:
+    with TEAM_FILE.open("r", encoding="utf-8") as f:
         data = json.load(f)
     return pd.DataFrame(data)
 
 
-@st.cache_data
 def load_games():
+    return _load_games(file_version(GAMES_FILE))
+
+
+@st.cache_data(max_entries=2)
+def _load_games(version):
     """讀取賽程／比分資料 games.json，用來計算互打戰績"""
-    if not GAMES_PATH.exists():
+    if not GAMES_FILE.exists():
         return pd.DataFrame()
-    with GAMES_PATH.open("r", encoding="utf-8") as f:
+    with GAMES_FILE.open("r", encoding="utf-8") as f:
         data = json.load(f)
     return pd.DataFrame(data)
 
 
-@st.cache_data
-def load_json_to_df(path: Path) -> pd.DataFrame:
-    """讀取 JSON 檔並轉成 DataFrame，若找不到檔案就回傳空表。"""
-    if not path.exists():
-        return pd.DataFrame()
-    with path.open("r", encoding="utf-8") as f:
-        data = json.load(f)
-    if isinstance(data, dict):
-        data = [data]
-    return pd.DataFrame(data)
+def load_table(name: str, columns=None) -> pd.DataFrame:
+    """讀 data/ 的資料表（storage.SCHEMAS 的表名），columns 給了就只讀這些欄位。"""
+    return _load_table(name, tuple(columns) if columns else None, table_version(name))
 
 
-def load_json_to_df(path: Path) -> pd.DataFrame:
-    if not path.exists():
-        return pd.DataFrame()
-    with path.open("r", encoding="utf-8") as f:
-        data = json.load(f)
-    return pd.DataFrame(data)
+@st.cache_data(max_entries=64)
+def _load_table(name, columns, version):
+    return storage.read_frame(name, columns=list(columns) if columns else None)
+
+
+def load_team_windows():
+    """球隊近況查詢（team_rolling.TeamWindows，建一次之後 slider 怎麼拉都是直接查）；沒資料回傳 None。"""
+    return _load_team_windows(table_version("team_stats_raw") + table_version("schedule_raw"))
+
+
+@st.cache_resource(max_entries=1)
+def _load_team_windows(version):
+    return team_rolling.load_windows()
+
+
+def load_schedule(team_id=None) -> pd.DataFrame:
+    return _load_schedule(team_id, db_version() + table_version("schedule_raw"))
+
+
+@st.cache_data(max_entries=32)
+def _load_schedule(team_id, version) -> pd.DataFrame:
+    """
+    賽程表（可以只看某隊）。SQLite 的 games 表有資料就用 warehouse 查（走 team_id 索引），
+    沒有就退回讀 schedule_raw 再篩選。
+    """
+    if warehouse.has_rows("games"):
+        rows = warehouse.games(team_id=team_id)
+        if not rows:
+            return pd.DataFrame()
+        return pd.DataFrame(rows)[list(SCHEDULE_COLUMNS)]
+
+    df = load_table("schedule_raw", SCHEDULE_COLUMNS)
+    if team_id is not None and not df.empty:
+        df = df[(df["home_team_id"] == team_id) | (df["away_team_id"] == team_id)]
+    return df
+
+
+def load_teams() -> list:
+    return _load_teams(db_version() + table_version("schedule_raw"))
+
+
+@st.cache_data(max_entries=2)
+def _load_teams(version) -> list:
+    """所有球隊 [{"team_id", "team_name"}]，給篩選選單用。"""
+    if warehouse.has_rows("games"):
+        return warehouse.teams()
+    df = load_table("schedule_raw", ("home_team_id", "home_team_name"))
+    if df.empty:
+        return []
+    df = df.drop_duplicates().sort_values("home_team_id")
+    return [{"team_id": int(r.home_team_id), "team_name": r.home_team_name} for r in df.itertuples()]
+
+
+def load_player_info() -> dict:
+    return _load_player_info(db_version() + file_version(DATA_DIR / "players_master_raw.json"))
+
+
+@st.cache_data(max_entries=2)
+def _load_player_info(version) -> dict:
+    """
+    球員基本資料 + 照片，回傳 name -> info 的 map。
+    SQLite 的 players 表有資料就查它，沒有就讀 players_master_raw.json。
+    """
+    info_map = {}
+    if warehouse.has_rows("players"):
+        for p in warehouse.players():
+            if not p.get("name"):
+                continue
+            info_map[p["name"]] = {
+                "img_url": p.get("img_url"),
+                "number": p.get("number"),
+                "position": p.get("position"),
+                "alt_name": p.get("alt_name"),
+                "height": p.get("height"),
+                "weight": p.get("weight"),
+            }
+        return info_map
+
+    master_path = DATA_DIR / "players_master_raw.json"
+    if not master_path.exists():
+        return info_map
+    with master_path.open("r", encoding="utf-8") as f:
+        master_players = json.load(f)
+
+    for p in master_players:
+        name = p.get("name")
+        if not name:
+            continue
+
+        meta = p.get("meta") or {}
+        images = p.get("images") or []
+
+        img_url = None
+        # 優先用 key == "md"，沒有就第一張
+        for img in images:
+            if img.get("key") == "md":
+                img_url = img.get("url")
+                break
+        if not img_url and images:
+            img_url = images[0].get("url")
+
+        info_map[name] = {
+            "img_url": img_url,
+            "number": p.get("number"),
+            "position": meta.get("position"),
+            "alt_name": meta.get("alt_name"),
+            "height": meta.get("height"),
+            "weight": meta.get("weight"),
+        }
+    return info_map
 
 
 # ========================
@@ -137,8 +283,8 @@ def show_home_page():
         st.selectbox("Season", ["2025-26"], index=0)
 
     # ---- 讀取球隊進階數據 ----
-    team_df = load_json_to_df(TEAM_FILE)
-    player_df_raw = load_json_to_df(PLAYER_FILE)  # 提前讀取球員數據
+    team_df = load_table("team_advanced")
+    player_df_raw = load_table("player_advanced")  # 提前讀取球員數據
 
     if team_df.empty:
         st.warning("找不到 data/team_advanced.json，請先執行球隊進階分析程式。")
@@ -397,7 +543,7 @@ def show_home_page():
     #     unsafe_allow_html=True,
     # )
 
-    games_df = load_json_to_df(SCHEDULE_FILE)
+    games_df = load_schedule()
     if not games_df.empty:
         if "datetime" in games_df.columns:
             games_df["datetime"] = pd.to_datetime(games_df["datetime"], errors="coerce")
@@ -509,6 +655,71 @@ def show_home_page():
 #       球隊頁面
 # ========================
 
+def show_team_form():
+    """球隊近況：最近 N 場 / 日期區間的 OffRtg、DefRtg、Net、Pace、eFG%，加上每場的 Net 走勢。"""
+    windows = load_team_windows()
+    if windows is None:
+        st.info("找不到 data/team_stats_raw.json，無法計算近況。")
+        return
+
+    form_mode = st.radio(
+        "區間", ["最近 N 場", "日期區間"], horizontal=True, key="team_form_mode"
+    )
+    if form_mode == "最近 N 場":
+        max_games = int((windows.ends - windows.starts).max())
+        last_n = st.slider(
+            "最近幾場",
+            min_value=1,
+            max_value=max(max_games, 2),
+            value=min(team_rolling.ROLLING_WINDOWS[0], max_games),
+            key="team_form_n",
+        )
+        form_df = windows.last_n(last_n)
+    else:
+        all_dates = sorted({d for d in windows.dates if d})
+        if not all_dates:   # 賽程表沒有日期（schedule_raw 不在 / 是空的）
+            st.info("找不到比賽日期（data/schedule_raw.json），無法用日期區間查詢。")
+            return
+        date_from, date_to = st.select_slider(
+            "日期區間",
+            options=all_dates,
+            value=(all_dates[0], all_dates[-1]),
+            key="team_form_dates",
+        )
+        form_df = windows.date_range(date_from, date_to)
+
+    form_df = form_df.sort_values("net_rtg", ascending=False, na_position="last")
+    st.dataframe(
+        form_df.rename(columns={
+            "team_name": "球隊", "games": "場數", "date_from": "從", "date_to": "到",
+            "off_rtg": "OffRtg", "def_rtg": "DefRtg", "net_rtg": "Net",
+            "pace": "Pace", "efg": "eFG%",
+        }).drop(columns=["team_id"]),
+        use_container_width=True,
+        hide_index=True,
+    )
+
+    # 走勢：預先算好的每場「最近 N 場」Net（team_rolling.json）
+    rolling_df = load_table("team_rolling")
+    if not rolling_df.empty:
+        trend_window = st.selectbox(
+            "走勢圖：每場打完時的最近幾場 Net",
+            sorted(rolling_df["window"].unique().tolist()),
+            key="team_form_trend_window",
+        )
+        trend_df = rolling_df[rolling_df["window"] == trend_window]
+        fig_trend = px.line(
+            trend_df,
+            x="game_no",
+            y="net_rtg",
+            color="team_name",
+            markers=True,
+            hover_data=["date", "games", "off_rtg", "def_rtg"],
+            labels={"game_no": "第幾場", "net_rtg": "Net", "team_name": "球隊"},
+        )
+        st.plotly_chart(fig_trend, use_container_width=True)
+
+
 def show_team_page():
     st.markdown(
         """
@@ -524,7 +735,7 @@ def show_team_page():
     st.header("球隊進階數據 Team Advanced Stats")
 
     # 讀球隊進階數據
-    df = load_json_to_df(TEAM_FILE)
+    df = load_table("team_advanced")
     if df.empty:
         st.warning("找不到 data/team_advanced.json，請先跑一次分析程式再回來喔～")
         return
@@ -705,9 +916,9 @@ def show_team_page():
 
     # 🚨 這裡重新讀一次 team_advanced.json
     try:
-        chart_src = load_json_to_df(TEAM_FILE)
+        chart_src = load_table("team_advanced")
     except NameError:
-        # 由於檔案載入函數 load_json_to_df 在您的程式碼中是有效的，這裡保持原樣
+        # 保險起見：讀取失敗就當作沒有資料
         chart_src = pd.DataFrame()
 
     if chart_src.empty:
@@ -876,6 +1087,15 @@ def show_team_page():
 
     st.markdown("---")
 
+    # ==========================================================
+    # 📅 近況：最近 N 場 / 日期區間的 OffRtg、DefRtg、Net、Pace、eFG%
+    # ==========================================================
+    st.markdown("### 球隊近況 (Recent form)")
+
+    show_team_form()
+
+    st.markdown("---")
+
     # ===========================
     #  全部球隊列表
     # ===========================
@@ -894,8 +1114,6 @@ def show_team_page():
 
 def show_player_page():
     import math
-    import json
-    from pathlib import Path
 
     import pandas as pd
     import plotly.graph_objects as go
@@ -915,7 +1133,7 @@ def show_player_page():
     )
 
     # 讀進階數據
-    df = load_json_to_df(PLAYER_FILE)
+    df = load_table("player_advanced")
     if df.empty:
         st.warning(
             "找不到 data/player_advanced.json，請先跑 player_advanced.py 再回來喔～"
@@ -923,42 +1141,12 @@ def show_player_page():
         return
 
     # ------------------------------------------------
-    # 讀取球員基本資料 + 照片：players_master_raw.json
+    # 讀取球員基本資料 + 照片（SQLite players 表，沒有就讀 players_master_raw.json）
     # 建一個 name -> info 的 map
     # ------------------------------------------------
     master_info_map = {}
     try:
-        master_path = Path("data/players_master_raw.json")
-        if master_path.exists():
-            with master_path.open("r", encoding="utf-8") as f:
-                master_players = json.load(f)
-
-            for p in master_players:
-                name = p.get("name")
-                if not name:
-                    continue
-
-                meta = p.get("meta") or {}
-                images = p.get("images") or []
-
-                img_url = None
-                # 優先用 key == "md"，沒有就第一張
-                for img in images:
-                    if img.get("key") == "md":
-                        img_url = img.get("url")
-                        break
-                if not img_url and images:
-                    img_url = images[0].get("url")
-
-                info = {
-                    "img_url": img_url,
-                    "number": p.get("number"),
-                    "position": meta.get("position"),
-                    "alt_name": meta.get("alt_name"),
-                    "height": meta.get("height"),
-                    "weight": meta.get("weight"),
-                }
-                master_info_map[name] = info
+        master_info_map = load_player_info()
     except Exception as e:
         st.caption(f"⚠️ 讀取球員基本資料時發生錯誤：{e}")
 
@@ -1189,27 +1377,67 @@ def show_player_page():
                 st.metric("USG%", f"{row['usage_share']*100:.1f}%")
 
     # ------------ 右邊：雷達圖 ------------
+    # 畫聯盟百分位（player_advanced.py 預先算好的 player_percentiles 表，直接查、不用現場排序），
+    # 滑鼠移上去看原始數值與名次；沒有百分位表時退回畫原始數值。
+    radar_metrics = [
+        ("pts", "PTS", 1.0, "{:.1f}"),
+        ("reb", "REB", 1.0, "{:.1f}"),
+        ("ast", "AST", 1.0, "{:.1f}"),
+        ("ts_official", "TS%", 100.0, "{:.1f}%"),
+        ("efg_official", "eFG%", 100.0, "{:.1f}%"),
+        ("usage_share", "Usage", 100.0, "{:.1f}%"),
+    ]
+    pool_labels = {
+        "all": "全聯盟",
+        "position": "同位置",
+        "qualified": f"場均 {player_advanced.MIN_QUALIFIED_MPG:g} 分鐘以上",
+    }
+    percentile_df = load_table("player_percentiles")
+
     radar_labels = []
     radar_values = []
+    radar_hover = []
+    pct_row = None
 
-    def safe_add(col_name, label, scale=1.0):
-        if col_name in row.index:
-            v = row[col_name]
-            if valid_num(v):
-                radar_labels.append(label)
-                radar_values.append(float(v) * scale)
+    with col_radar:
+        if not percentile_df.empty:
+            radar_pool = st.radio(
+                "跟誰比（百分位）",
+                player_advanced.PERCENTILE_POOLS,
+                format_func=pool_labels.get,
+                horizontal=True,
+                key="player_radar_pool",
+            )
+            matches = percentile_df[
+                (percentile_df["player_id"] == row.get("player_id"))
+                & (percentile_df["pool"] == radar_pool)
+            ]
+            if matches.empty:
+                st.caption(f"這位球員不在「{pool_labels[radar_pool]}」的比較池裡，改畫原始數值。")
+            else:
+                pct_row = matches.iloc[0]
 
-    safe_add("pts", "PTS")
-    safe_add("reb", "REB")
-    safe_add("ast", "AST")
-    safe_add("ts_official", "TS%")
-    safe_add("efg_official", "eFG%")
-    safe_add("usage_share", "Usage")
+    for col_name, label, scale, fmt in radar_metrics:
+        if col_name not in row.index or not valid_num(row[col_name]):
+            continue
+        raw_text = fmt.format(float(row[col_name]) * scale)
+        if pct_row is None:
+            radar_labels.append(label)
+            radar_values.append(float(row[col_name]) * scale)
+            radar_hover.append(raw_text)
+        elif valid_num(pct_row.get(f"{col_name}_pct")):
+            radar_labels.append(label)
+            radar_values.append(float(pct_row[f"{col_name}_pct"]))
+            radar_hover.append(
+                f"{raw_text}（第 {int(pct_row[f'{col_name}_rank'])} / {int(pct_row['pool_size'])} 名，"
+                f"PR {pct_row[f'{col_name}_pct']:.0f}）"
+            )
 
     with col_radar:
         if len(radar_labels) >= 3:
             radar_values.append(radar_values[0])
             radar_labels.append(radar_labels[0])
+            radar_hover.append(radar_hover[0])
 
             fig_radar = go.Figure()
             fig_radar.add_trace(
@@ -1218,10 +1446,15 @@ def show_player_page():
                     theta=radar_labels,
                     fill="toself",
                     name=name_display,
+                    customdata=radar_hover,
+                    hovertemplate="%{theta}：%{customdata}<extra></extra>",
                 )
             )
+            radial_axis = dict(visible=True)
+            if pct_row is not None:
+                radial_axis["range"] = [0, 100]
             fig_radar.update_layout(
-                polar=dict(radialaxis=dict(visible=True)),
+                polar=dict(radialaxis=radial_axis),
                 showlegend=False,
                 margin=dict(l=0, r=0, t=20, b=10),
             )
@@ -1366,7 +1599,8 @@ def show_schedule_page():
         with st.spinner("正在爬取最新 TPBL 賽程資料..."):
             try:
                 result = subprocess.run(
-                    [sys.executable, str(BASE_DIR / "tpbl_crawler.py")],
+                    [sys.executable, str(BASE_DIR / "src" / "tpbl_crawler.py")],
+                    cwd=BASE_DIR,
                     capture_output=True,
                     text=True,
                     timeout=300,
@@ -1385,33 +1619,26 @@ def show_schedule_page():
                 st.error("爬蟲執行逾時（Timeout），請稍後再試。")
             finally:
                 st.cache_data.clear()
+                _load_team_windows.clear()
                 st.rerun()
 
     st.markdown("<br>", unsafe_allow_html=True)
 
-    # 讀 schedule（基本賽程）+ scores（比分）
-    schedule_df = load_json_to_df(SCHEDULE_FILE)
-    scores_df = load_json_to_df(SCORE_FILE)
+    # 依球隊篩選（有資料庫時直接用 team_id 索引查，不用載入整季再過濾）
+    team_options = {"(All)": None}
+    for t in load_teams():
+        team_options[t["team_name"]] = t["team_id"]
+    selected_team = st.selectbox("選擇球隊 (Filter by team)", list(team_options))
+
+    # 統一賽程表：賽程資訊跟比分已經在同一張表，不用再合併
+    games_df = load_schedule(team_options[selected_team])
 
-    if schedule_df.empty:
+    if games_df.empty:
         st.info(
             "目前沒有賽程資料，請先確認 data/schedule_raw.json 是否存在，或按上方按鈕重新抓取。"
         )
         return
 
-    # 合併比分：schedule_df.game_id ↔ scores_df.id
-    games_df = schedule_df.copy()
-    if not scores_df.empty:
-        if "id" in scores_df.columns and "game_id" in games_df.columns:
-            score_cols = ["id", "home_score", "away_score"]
-            score_cols = [c for c in score_cols if c in scores_df.columns]
-            games_df = games_df.merge(
-                scores_df[score_cols],
-                left_on="game_id",
-                right_on="id",
-                how="left",
-            )
-
     # ===== 日期處理 + 排序選項 =====
     if "date" in games_df.columns:
         games_df["date"] = pd.to_datetime(games_df["date"], errors="coerce")
@@ -0,0 +1,145 @@
+# bench_crawlers.py
+# 功能：用 src/replay_server.py 的假 API 量測每支爬蟲的吞吐量
+#
+# 每支爬蟲都在同一個 process 裡直接呼叫（不經過 subprocess），
+# 工作目錄換到暫存資料夾，不會動到專案的 data/；快取一律關掉，每個 request 都真的打到 server。
+# 回報：request 數、錯誤 / 重試次數、requests/sec、p50 / p99 延遲、總耗時。
+#
+# 用法（在專案根目錄）：
+#   python benchmarks/bench_crawlers.py
+#   python benchmarks/bench_crawlers.py --latency-ms 40 --jitter-ms 20 --workers 1 4 8
+#   python benchmarks/bench_crawlers.py --error-rate 0.05 --rate-429 0.02 --json bench.json
+
+import argparse
+import contextlib
+import io
+import json
+import os
+from pathlib import Path
+import sys
+import tempfile
+import time
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+DEFAULT_PORT = 8765
+
+
+def run_case(name, func, http_client):
+    """跑一支爬蟲，回傳這次的統計；爬蟲自己的 print 不顯示。"""
+    http_client.stats.reset()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        func()
+    wall = time.perf_counter() - start
+
+    snap = http_client.stats.snapshot()
+    return {
+        "case": name,
+        "requests": snap["requests"],
+        "errors": snap["errors"],
+        "retries": snap["retries"],
+        "wall_seconds": round(wall, 3),
+        "requests_per_sec": round(snap["requests"] / wall, 1) if wall > 0 else 0.0,
+        "p50_ms": round(snap["p50_seconds"] * 1000, 1),
+        "p99_ms": round(snap["p99_seconds"] * 1000, 1),
+    }
+
+
+def run_benchmarks(workers_list, repeat=1):
+    import http_client
+    import player_stats_crawler
+    import schedule_crawler
+    import stats_crawler
+    import tpbl_crawler
+
+    def games():
+        schedule_crawler.crawl_all_games(season_ids=[tpbl_crawler.SEASON_ID], refresh_all=True)
+
+    cases = [("tpbl_crawler", games)]
+    for w in workers_list:
+        # rate 設很高，量的是 workers 與 server 的上限，而不是 token bucket
+        cases.append((
+            f"stats_crawler (workers={w})",
+            lambda w=w: stats_crawler.crawl_all_team_stats(max_in_flight=w, rate=1000.0, resume=False),
+        ))
+    cases += [
+        ("division_players", stats_crawler.crawl_division_players),
+        # 分隊平行抓要知道有哪些隊，前面 tpbl_crawler 那個 case 已經寫好賽程了
+        ("player_stats (single)", lambda: player_stats_crawler.fetch_player_stats(partitioned=False)),
+        ("player_stats (per team)", player_stats_crawler.fetch_player_stats),
+        ("schedule_crawler", lambda: schedule_crawler.crawl_all_games(refresh_all=True)),
+    ]
+
+    results = []
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="tpbl_bench_") as tmp:
+        os.chdir(tmp)
+        try:
+            for _ in range(repeat):
+                for name, func in cases:
+                    r = run_case(name, func, http_client)
+                    results.append(r)
+                    print(
+                        f"{r['case']:<28} {r['requests']:>5} req  "
+                        f"{r['requests_per_sec']:>8.1f} req/s  "
+                        f"p50 {r['p50_ms']:>7.1f} ms  p99 {r['p99_ms']:>7.1f} ms  "
+                        f"wall {r['wall_seconds']:>7.2f} s  "
+                        f"(錯誤 {r['errors']}、重試 {r['retries']})"
+                    )
+        finally:
+            os.chdir(cwd)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="對本機 replay server 量測各爬蟲的吞吐量")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8],
+                        help="stats_crawler 要測的同時 request 數（預設 1 4 8）")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="server 每個 request 的延遲")
+    parser.add_argument("--jitter-ms", type=float, default=10.0, help="延遲的隨機抖動")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="server 回 500 的機率")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="server 回 429 的機率")
+    parser.add_argument("--repeat", type=int, default=1, help="每個 case 跑幾次")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="replay server 的 port")
+    parser.add_argument("--data-dir", default=str(ROOT / "data"), help="replay server 讀的 data/ 目錄")
+    parser.add_argument("--json", metavar="PATH", help="把結果另外存成 JSON")
+    args = parser.parse_args()
+
+    # http_client.API_BASE 在 import 時就決定了，所以環境變數要在 import 任何爬蟲（含 replay_server）之前設好
+    os.environ["TPBL_API_BASE"] = f"http://127.0.0.1:{args.port}/api"
+    os.environ["TPBL_NO_CACHE"] = "1"
+    import replay_server
+
+    server, base_url = replay_server.start_in_thread(
+        port=args.port, data_dir=args.data_dir,
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate, rate_429=args.rate_429,
+    )
+    print(
+        f"replay server：{base_url}（延遲 {args.latency_ms:.0f}±{args.jitter_ms:.0f} ms，"
+        f"500 機率 {args.error_rate}，429 機率 {args.rate_429}）\n"
+    )
+    try:
+        results = run_benchmarks(args.workers, repeat=args.repeat)
+    finally:
+        server.shutdown()
+
+    if args.json:
+        report = {
+            "server": {
+                "latency_ms": args.latency_ms,
+                "jitter_ms": args.jitter_ms,
+                "error_rate": args.error_rate,
+                "rate_429": args.rate_429,
+            },
+            "results": results,
+        }
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n已寫入 {args.json}")
+
+
+if __name__ == "__main__":
+    main()
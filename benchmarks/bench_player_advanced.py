@@ -0,0 +1,82 @@
+# bench_player_advanced.py
+# 功能：量測 player_advanced 的進階數據計算在大量球員下的耗時
+#
+# 用 data/player_stats_raw.json 複製成 ×1 / ×100 / ×1000 份（×1000 約 11.5 萬位球員），
+# 每一份當成另一個 division（player_id / team_id 重新編號，球隊數也跟著變多），分四段計時：
+#   攤平    ：巢狀的 raw players → player_stats 表的 DataFrame（storage.player_stats_columns）
+#   計算    ：build_player_advanced_frame（team usage 分組加總 + 各指標整欄運算）
+#   轉 dict ：結果 DataFrame → list[dict]（寫 JSON 用）
+#   百分位  ：build_percentiles（全聯盟 / 同位置 / 上場時間達標三個池子的百分位與名次）
+# 只量計算本身，不含讀檔與寫檔。
+#
+# 用法（在專案根目錄）：
+#   python benchmarks/bench_player_advanced.py
+#   python benchmarks/bench_player_advanced.py --scales 1 10 100 --repeat 5
+
+import argparse
+import json
+from pathlib import Path
+import sys
+import time
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+import player_advanced  # noqa: E402
+import storage  # noqa: E402
+
+
+def make_players(base, scale):
+    """把 base 複製 scale 份，每份的 player_id / team_id 往後加（當成另一個 division）。"""
+    player_step = max(p["player"]["id"] for p in base) + 1
+    team_step = max(p["team"]["id"] for p in base) + 1
+    players = []
+    for i in range(scale):
+        for p in base:
+            players.append(dict(
+                p,
+                player=dict(p["player"], id=p["player"]["id"] + i * player_step),
+                team=dict(p["team"], id=p["team"]["id"] + i * team_step),
+            ))
+    return players
+
+
+def main():
+    parser = argparse.ArgumentParser(description="球員進階數據計算的速度")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 100, 1000],
+                        help="球員數是目前 player_stats_raw.json 的幾倍（預設 1 100 1000）")
+    parser.add_argument("--repeat", type=int, default=3, help="每個 case 跑幾次取最快")
+    args = parser.parse_args()
+
+    path = ROOT / "data" / "player_stats_raw.json"
+    with path.open("r", encoding="utf-8") as f:
+        base = json.load(f)
+    print(f"{path.name}：{len(base)} 位球員\n")
+    print(f"{'倍數':>6} {'球員':>8} {'攤平':>10} {'計算':>10} {'轉 dict':>10} {'百分位':>10} {'合計':>10}")
+
+    for scale in args.scales:
+        raw = make_players(base, scale)
+        best = None
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            df = player_advanced.players_frame(
+                storage.player_stats_columns(raw, player_advanced.INPUT_COLUMNS))
+            t1 = time.perf_counter()
+            result = player_advanced.build_player_advanced_frame(df)
+            t2 = time.perf_counter()
+            player_advanced.to_records(result)
+            t3 = time.perf_counter()
+            player_advanced.build_percentiles(result, df["position"])
+            t4 = time.perf_counter()
+            if best is None or t4 - t0 < sum(best):
+                best = (t1 - t0, t2 - t1, t3 - t2, t4 - t3)
+
+        flatten_s, compute_s, records_s, percentiles_s = best
+        print(
+            f"{'×' + str(scale):>6} {len(raw):>8} {flatten_s * 1000:>8.1f}ms {compute_s * 1000:>8.1f}ms "
+            f"{records_s * 1000:>8.1f}ms {percentiles_s * 1000:>8.1f}ms {sum(best) * 1000:>8.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
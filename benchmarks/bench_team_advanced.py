@@ -0,0 +1,135 @@
+# bench_team_advanced.py
+# 功能：量測 analyze_team_advanced 實際的進入點（compute_advanced / apply_game_rows）在大量 team-game rows 下的耗時
+#
+# 用 data/team_stats_raw.json 複製成 ×1 / ×1000 / ×5000 份（×5000 約 38 萬筆），
+# 每一份當成另一個賽季（game_id 重新編號、球隊不變，跟真的多打幾季一樣；
+# --new-teams 則把每份當成不同 division，team_id 也重新編號，球隊數跟輸出檔會跟著變大），
+# 寫進一個暫存的 data/ 目錄（JSON + 有 pyarrow 時的 Parquet），在那裡跑：
+#   重建  ：compute_advanced(rebuild=True)——讀表、整欄加總、存累計狀態、寫 team_advanced.json
+#   沒變  ：compute_advanced()——沒有變動記錄、team_stats_raw 也沒被改過，直接用累計狀態
+#   改一場：最後一場的數據被更正（兩隊各多 2 分），跟 stats_crawler 一樣記下這場後再跑 compute_advanced()
+#           ——只讀這一場的 rows
+#   沒記錄：一樣改一場，但沒有變動記錄（手動改檔）——讀整張表、每場 digest 跟累計狀態比對
+#   live  ：apply_game_rows({game_id: rows})——live_poller 每輪走的路，不讀 team_stats_raw
+#   寫輸出：上面每個 case 都含的 write_outputs（指標 + team_advanced.json / Parquet），單獨量一次當參考
+# 每個 case 都含讀檔與寫檔（終端機的排行榜不印）；準備資料（寫 team_stats_raw）不計時。
+#
+# 用法（在專案根目錄）：
+#   python benchmarks/bench_team_advanced.py
+#   python benchmarks/bench_team_advanced.py --scales 1 100 1000 10000 --repeat 5
+
+import argparse
+import contextlib
+import io
+import json
+import os
+from pathlib import Path
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+import analyze_team_advanced  # noqa: E402
+import storage  # noqa: E402
+
+
+def make_frame(base, scale, new_teams=False):
+    """把 base 複製 scale 份，每份的 game_id 往後加（當成另一個賽季）；new_teams 的話 team_id 也往後加。"""
+    df = pd.DataFrame(base)
+    team_step = int(df["team_id"].max()) + 1 if new_teams else 0
+    game_step = int(df["game_id"].max()) + 1
+    frames = []
+    for i in range(scale):
+        part = df.copy()
+        part["team_id"] += i * team_step
+        part["game_id"] += i * game_step
+        frames.append(part)
+    return pd.concat(frames, ignore_index=True)
+
+
+def write_raw(rows, changed_ids=None):
+    """rows 寫成目前目錄下的 data/team_stats_raw.json（+ Parquet）；有給 changed_ids 就跟 stats_crawler 一樣記下變動。"""
+    with analyze_team_advanced.TEAM_STATS_PATH.open("w", encoding="utf-8") as f:
+        json.dump(rows, f, ensure_ascii=False)
+    storage.write_table("team_stats_raw", rows)
+    if changed_ids is not None:
+        storage.record_changes("team_stats_raw", changed_ids)
+
+
+def timed(func, repeat, before=None):
+    """跑 repeat 次取最快（秒）；before(i) 在每次之前呼叫、不計時。不印東西。"""
+    best = None
+    for i in range(repeat):
+        if before:
+            before(i)
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="球隊進階數據計算的速度")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 1000, 5000],
+                        help="資料量是目前 team_stats_raw.json 的幾倍（預設 1 1000 5000）")
+    parser.add_argument("--repeat", type=int, default=3, help="每個 case 跑幾次取最快")
+    parser.add_argument("--new-teams", action="store_true",
+                        help="每份複製都當成不同 division（球隊數跟著倍數變多，寫輸出會變成主要的成本）")
+    args = parser.parse_args()
+
+    path = ROOT / "data" / "team_stats_raw.json"
+    with path.open("r", encoding="utf-8") as f:
+        base = json.load(f)
+    print(f"{path.name}：{len(base)} 筆\n")
+    print(
+        f"{'倍數':>6} {'rows':>10} {'球隊':>7} {'重建':>10} {'沒變':>10} {'改一場':>10} "
+        f"{'沒記錄':>10} {'live':>10} {'寫輸出':>10}"
+    )
+
+    cwd = os.getcwd()
+    for scale in args.scales:
+        rows = make_frame(base, scale, args.new_teams).to_dict("records")
+        last_game = rows[-1]["game_id"]
+        game_rows = [r for r in rows[-2:] if r["game_id"] == last_game]
+        fixed_rows = [dict(r, points_for=r["points_for"] + 2) for r in game_rows]
+        versions = [rows, rows[:-len(game_rows)] + fixed_rows]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            try:
+                Path("data").mkdir()
+                write_raw(rows)
+                rebuild_s = timed(lambda: analyze_team_advanced.compute_advanced(rebuild=True), args.repeat)
+                warm_s = timed(analyze_team_advanced.compute_advanced, args.repeat)
+                # 每次之前把最後一場換成另一個版本，compute_advanced 一定有一場要換
+                changed_s = timed(analyze_team_advanced.compute_advanced, args.repeat,
+                                  before=lambda i: write_raw(versions[(i + 1) % 2], [last_game]))
+                unrecorded_s = timed(analyze_team_advanced.compute_advanced, args.repeat,
+                                     before=lambda i: write_raw(versions[i % 2]))
+                # live：累計狀態先停在 fixed_rows，之後每次都換成另一個版本
+                with contextlib.redirect_stdout(io.StringIO()):
+                    analyze_team_advanced.apply_game_rows({last_game: fixed_rows})
+                live_updates = iter([{last_game: [game_rows, fixed_rows][i % 2]} for i in range(args.repeat)])
+                live_s = timed(lambda: analyze_team_advanced.apply_game_rows(next(live_updates)), args.repeat)
+                state = analyze_team_advanced.TeamTotals.load()
+                output_s = timed(lambda: analyze_team_advanced.write_outputs(state), args.repeat)
+                with analyze_team_advanced.OUTPUT_PATH.open("r", encoding="utf-8") as f:
+                    teams = len(json.load(f))
+            finally:
+                os.chdir(cwd)
+
+        print(
+            f"{'×' + str(scale):>6} {len(rows):>10} {teams:>7} {rebuild_s * 1000:>8.1f}ms "
+            f"{warm_s * 1000:>8.1f}ms {changed_s * 1000:>8.1f}ms {unrecorded_s * 1000:>8.1f}ms "
+            f"{live_s * 1000:>8.1f}ms {output_s * 1000:>8.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -2,179 +2,591 @@
 # 功能：
 # 讀取 data/team_stats.json，將每支球隊在所有已完成比賽中的數據加總，
 # 並計算一些進階指標（eFG%、TS%、OffRtg、DefRtg），
+# 每筆 row 依 game_id 配上同一場的對手（pair_opponents），所以也有真正的對手回合數、
+# 防守端的 four factors（對手 eFG% / TOV% / FT Rate）、OREB% / DRB% 與場均分差，
+# 加總與指標都用 pandas / NumPy 整欄計算（幾十萬筆 team-game rows 也不到一秒），
 # 存成 data/team_advanced.json，並在終端機印出一個排行榜。
+#
+# 每隊的累計數據另外存成 data/team_advanced_state.npz（TeamTotals，全部是 NumPy array）：
+# 第一次（或 --rebuild）用 aggregate_teams 同一套整欄加總建好；之後只讀 stats_crawler 記下有變動的
+# 比賽（storage.record_changes）那幾場的 rows，把舊的數字扣掉、新的加進去（也是整欄運算），
+# 不讀整張表、也不用整個重新加總；沒有變動記錄、team_stats_raw.json 卻被改過（手動改 / git checkout）
+# 才退回整張表逐場比對 digest。live_poller 每輪直接把有變化的比賽換進去，不必重讀 team_stats_raw.json。
 #好耶
 
+import argparse
 import json
+import os
 from pathlib import Path
-from math import isnan
 
-TEAM_STATS_PATH = Path("data/team_stats_raw.json")
-OUTPUT_PATH = Path("data/team_advanced.json")
-
-
-def load_team_stats():
-    if not TEAM_STATS_PATH.exists():
-        print("找不到 data/team_stats.json，請先跑 stats_crawler.py")
-        return []
+import numpy as np
+import pandas as pd
 
-    with TEAM_STATS_PATH.open("r", encoding="utf-8") as f:
-        rows = json.load(f)
-
-    return rows
+import storage
 
+TEAM_STATS_PATH = Path("data/team_stats_raw.json")
+OUTPUT_PATH = Path("data/team_advanced.json")
+STATE_PATH = Path("data/team_advanced_state.npz")
 
-def safe_div(num, den):
-    if den is None or den == 0:
-        return None
-    return num / den
+# 計算只用到這些欄位（有 Parquet 時只讀這幾欄）；game_id + team_side 是一筆 row 的 key
+INPUT_COLUMNS = [
+    "game_id", "team_side", "team_id", "team_name", "points_for", "points_against",
+    "fgm", "fga", "three_pm", "three_pa", "ftm", "fta", "oreb", "dreb", "tov",
+]
 
+# 每隊要加總的欄位
+SUM_COLUMNS = [
+    "points_for", "points_against", "fgm", "fga", "three_pm", "three_pa", "ftm", "fta",
+    "oreb", "dreb", "tov",
+]
 
-def compute_advanced():
-    rows = load_team_stats()
-    if not rows:
-        return
+# 同一場對手的這些欄位也要加總（對手回合數、防守端 four factors、籃板率），加總後叫 opp_{欄位}
+OPP_COLUMNS = ["fgm", "fga", "three_pm", "fta", "oreb", "dreb", "tov"]
 
-    # 聚合每隊的累計數據（目前 rows 一筆 = 一場比賽的某隊數據）
-    teams = {}  # team_id -> dict
-
-    for r in rows:
-        team_id = r["team_id"]
-        team = teams.setdefault(
-            team_id,
-            {
-                "team_id": team_id,
-                "team_name": r["team_name"],
-                "games": 0,
-                "points_for": 0,
-                "points_against": 0,
-                "fgm": 0,
-                "fga": 0,
-                "three_pm": 0,
-                "three_pa": 0,
-                "ftm": 0,
-                "fta": 0,
-                "oreb": 0,
-                "tov": 0,
-                "possessions_for": 0.0,
-                "possessions_against": 0.0,
-            },
-        )
-
-        # 有些未完成比賽可能是 None，小心處理
-        pf = r.get("points_for") or 0
-        pa = r.get("points_against") or 0
-        fgm = r.get("fgm") or 0
-        fga = r.get("fga") or 0
-        three_pm = r.get("three_pm") or 0
-        three_pa = r.get("three_pa") or 0
-        ftm = r.get("ftm") or 0
-        fta = r.get("fta") or 0
-        oreb = r.get("oreb") or 0
-        tov = r.get("tov") or 0
-
-        # 估計進攻回合數 (常見籃球公式)
-        # possessions_raw ≈ FGA + 0.44 * FTA − OREB + TOV
-        poss_for_raw = fga + 0.44 * fta - oreb + tov
-
-        team["games"] += 1
-        team["points_for"] += pf
-        team["points_against"] += pa
-        team["fgm"] += fgm
-        team["fga"] += fga
-        team["three_pm"] += three_pm
-        team["three_pa"] += three_pa
-        team["ftm"] += ftm
-        team["fta"] += fta
-        team["oreb"] += oreb
-        team["tov"] += tov
-        team["possessions_for"] += poss_for_raw
-
-    # 先假設：長期下我方回合 ≈ 對手回合
-    for t in teams.values():
-        t["possessions_against"] = t["possessions_for"]
+TOTAL_COLUMNS = SUM_COLUMNS + ["opp_" + c for c in OPP_COLUMNS]
 
-    # === 🔧 校正回合數：讓聯盟平均 Pace ≈ 90 回合/場 ===
-    raw_paces = []
-    for t in teams.values():
-        if t["games"] > 0 and t["possessions_for"] > 0:
-            raw_paces.append(t["possessions_for"] / t["games"])
+# 累計狀態裡每筆 row 的編號與數值（單場 box score 跟比賽 / 球隊編號都遠小於 2^31，用 int32 存檔小一半）
+ROW_DTYPE = np.int32
 
-    if raw_paces:
-        league_raw_pace = sum(raw_paces) / len(raw_paces)
-    else:
-        league_raw_pace = 1.0  # 避免除以 0
+# 目標：聯盟平均 Pace ≈ 90（NBA / FIBA 常見區間）
+TARGET_PACE = 90.0
 
-    # 目標：聯盟平均 Pace ≈ 90（NBA / FIBA 常見區間）
-    TARGET_PACE = 90.0
-    pace_scale = TARGET_PACE / league_raw_pace if league_raw_pace > 0 else 1.0
 
-    # 計算進階指標
-    result = []
-    for t in teams.values():
-        games = t["games"] or 1
+def load_team_stats(game_ids=None):
+    """讀 team_stats_raw（只讀 INPUT_COLUMNS）；game_ids 給了就只讀這幾場。"""
+    if not TEAM_STATS_PATH.exists():
+        print("找不到 data/team_stats.json，請先跑 stats_crawler.py")
+        return pd.DataFrame(columns=INPUT_COLUMNS)
 
-        fgm = t["fgm"]
-        fga = t["fga"]
-        three_pm = t["three_pm"]
-        ftm = t["ftm"]
-        fta = t["fta"]
-        pf = t["points_for"]
-        pa = t["points_against"]
+    df = storage.read_frame("team_stats_raw", columns=INPUT_COLUMNS, game_ids=game_ids)
+    return df if not df.empty else pd.DataFrame(columns=INPUT_COLUMNS)
 
-        poss_for_raw = t["possessions_for"]
-        poss_against_raw = t["possessions_against"]
 
-        # 套用 Pace 校正係數（把 poss 拉回合理尺度）
-        poss_for = poss_for_raw * pace_scale
-        poss_against = poss_against_raw * pace_scale
+def safe_div(num, den):
+    """逐欄除法：分母是 0 的位置回傳 NaN（輸出時變成 None）。"""
+    num = np.asarray(num, dtype=np.float64)
+    den = np.asarray(den, dtype=np.float64)
+    out = np.full(np.broadcast(num, den).shape, np.nan)
+    np.divide(num, den, out=out, where=den != 0)
+    return out
+
+
+def possessions(fga, fta, oreb, tov):
+    """
+    估計進攻回合數 (常見籃球公式)：possessions_raw ≈ FGA + 0.44 * FTA − OREB + TOV
+    參數可以是數字或整欄（NumPy array / Series）。
+    """
+    return fga + 0.44 * fta - oreb + tov
+
+
+def pair_opponents(df):
+    """
+    每筆 team-game row 配上同一場的對手（另一個 team_side），一次 O(n)：
+    game_id 用 factorize（hash）編號，每場記下 home / away 是第幾列，再用編號整欄取對手那一列。
+
+    回傳 df 的副本，多了：
+      opp_{c}（OPP_COLUMNS）：對手這場的數據（None 當 0）；找不到對手（只有一邊的資料）是 NaN
+      margin：這場的分差（得分 − 失分）
+      possessions / opp_possessions：這場我方 / 對手的回合數（未校正）
+    """
+    out = df.copy()
+    codes, game_ids = pd.factorize(out["game_id"], sort=False)
+    side = out["team_side"].to_numpy()
+    home, away = side == "home", side == "away"
+    rows = np.arange(len(out))
+
+    home_row = np.full(len(game_ids), -1)
+    away_row = np.full(len(game_ids), -1)
+    home_row[codes[home]] = rows[home]
+    away_row[codes[away]] = rows[away]
+
+    # codes 是 -1（沒有 game_id）時不能拿去查，直接當沒有對手
+    known = codes >= 0
+    opp_row = np.full(len(out), -1)
+    opp_row[home & known] = away_row[codes[home & known]]
+    opp_row[away & known] = home_row[codes[away & known]]
+    has_opp = opp_row >= 0
+
+    for c in OPP_COLUMNS:
+        values = out[c].fillna(0).to_numpy(dtype=np.float64)
+        out["opp_" + c] = np.where(has_opp, values[opp_row], np.nan)
+
+    out["margin"] = out["points_for"] - out["points_against"]
+    out["possessions"] = possessions(
+        *(out[c].fillna(0).to_numpy(dtype=np.float64) for c in ("fga", "fta", "oreb", "tov")))
+    out["opp_possessions"] = possessions(
+        *(out["opp_" + c].to_numpy() for c in ("fga", "fta", "oreb", "tov")))
+    return out
+
+
+def contribution_values(paired):
+    """pair_opponents 的結果 → 每筆 row 要加進累計的值（TOTAL_COLUMNS 各一欄，int64；None / 沒有對手當 0）。"""
+    return paired[TOTAL_COLUMNS].fillna(0).to_numpy(dtype=np.int64)
+
+
+def team_sums(codes, values, n):
+    """
+    依球隊編號加總：回傳 (n, 1 + len(TOTAL_COLUMNS)) 的 int64，第 0 欄是場數。
+    每一欄用 np.bincount（依 row 順序相加；都是整數，float64 在 2^53 以內是精確的）。
+    """
+    sums = np.empty((n, 1 + values.shape[1]), dtype=np.int64)
+    sums[:, 0] = np.bincount(codes, minlength=n)
+    for i in range(values.shape[1]):
+        sums[:, i + 1] = np.bincount(codes, weights=values[:, i], minlength=n).astype(np.int64)
+    return sums
+
+
+def totals_to_frame(team_ids, team_names, sums):
+    """每隊的 id / 名字 / team_sums 結果 → 累計 DataFrame（一隊一列，含 possessions）。"""
+    totals = pd.DataFrame({"team_id": team_ids, "team_name": team_names, "games": sums[:, 0]})
+    for i, c in enumerate(TOTAL_COLUMNS):
+        totals[c] = sums[:, i + 1]
+    return add_possessions(totals)
+
+
+def group_teams(paired):
+    """team_id 分組一次（factorize）：回傳 (每列的球隊編號, 球隊 id, 球隊名字)，順序是第一次出現的順序。"""
+    codes, team_ids = pd.factorize(paired["team_id"], sort=False, use_na_sentinel=False)
+    _, first_rows = np.unique(codes, return_index=True)
+    return codes, team_ids.to_numpy(), paired["team_name"].to_numpy(dtype=object)[first_rows]
+
+
+def aggregate_teams(df):
+    """
+    把每隊的累計數據加總起來（一筆 row = 一場比賽的某隊數據），一隊一列，順序是第一次出現的順序。
+
+    用 team_id 分組一次（factorize），每一欄再用 np.bincount 加總；
+    opp_* 欄位先用 pair_opponents 配好對手（找不到對手的場次當 0 算）。
+    """
+    paired = pair_opponents(df)
+    codes, team_ids, team_names = group_teams(paired)
+    return totals_to_frame(team_ids, team_names, team_sums(codes, contribution_values(paired), len(team_ids)))
+
+
+def add_possessions(totals):
+    """
+    由每隊（與對手）的 FGA / FTA / OREB / TOV 總和算出 possessions_for / possessions_against。
+
+    用加總後的整數算（數學上等於每場回合數的和），累計狀態加加減減也不會有小數誤差。
+    """
+    def column(c):
+        return totals[c].to_numpy(dtype=np.float64)
+
+    totals["possessions_for"] = possessions(column("fga"), column("fta"), column("oreb"), column("tov"))
+    totals["possessions_against"] = possessions(
+        column("opp_fga"), column("opp_fta"), column("opp_oreb"), column("opp_tov"))
+    return totals
+
+
+def _hash_column(values):
+    """一欄（Series 或 array）的每個值 → uint64 hash。字串 / object 先 factorize，只 hash 不重複的值（幾十萬筆隊名也很快）。"""
+    if values.dtype.kind in "iub":
+        return pd.util.hash_array(np.asarray(values))
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    return pd.util.hash_array(np.asarray(uniques, dtype=object))[codes]
+
+
+def game_digests(paired, values, game_codes, n_games):
+    """
+    每場比賽一個 digest（uint64）：這場每筆 row（team_side、球隊、加進累計的值，含對手的 opp_*）的 hash 相加。
+    相加跟 row 順序無關；數字或球隊有任何改變 digest 就不同（碰撞機率可以忽略）。
+    """
+    columns = [paired[c] for c in ["team_side", "team_id", "team_name"]] + list(values.T)
+    row_hashes = np.zeros(len(paired), dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for col in columns:
+            # uint64 溢位就繞回去（mod 2^64），欄位順序不同結果也不同
+            row_hashes = row_hashes * np.uint64(1000003) + _hash_column(col)
+        digests = np.zeros(n_games, dtype=np.uint64)
+        np.add.at(digests, game_codes, row_hashes)
+    return digests
+
+
+class TeamTotals:
+    """
+    每隊累計數據的持久化狀態（data/team_advanced_state.npz），全部是整欄的 array：
+
+    球隊：team_ids / team_names（順序是第一次出現的順序）、sums（team_sums 格式：場數 + TOTAL_COLUMNS 的總和）
+    比賽：game_ids、digests（game_digests）
+    rows：每筆 team-game row 當初加進去的數字——row_game / row_team（比賽 / 球隊編號）、
+          row_values（TOTAL_COLUMNS，含同一場對手的 opp_*）；比賽數據更正時靠它把舊的扣掉。
+    source：上次跟狀態對齊時 team_stats_raw.json 的 storage.source_stamp（沒記錄是 None）。
+    一場比賽的兩隊一定一起換，因為對手的數字也算在自己的累計裡。
+    加總都是整數，扣掉再加回去一定回到原本的值，跟整個重新加總（aggregate_teams）的結果一模一樣。
+    """
+
+    def __init__(self):
+        self.team_ids = np.zeros(0, dtype=object)
+        self.team_names = np.zeros(0, dtype=object)
+        self.sums = np.zeros((0, 1 + len(TOTAL_COLUMNS)), dtype=np.int64)
+        self.game_ids = np.zeros(0, dtype=object)
+        self.digests = np.zeros(0, dtype=np.uint64)
+        self.row_game = np.zeros(0, dtype=ROW_DTYPE)
+        self.row_team = np.zeros(0, dtype=ROW_DTYPE)
+        self.row_values = np.zeros((0, len(TOTAL_COLUMNS)), dtype=ROW_DTYPE)
+        self.source = None
+
+    @staticmethod
+    def _prepare(df):
+        """team rows → (配好對手的 DataFrame, row_values, 比賽編號, game_ids, 每場的 digest)。"""
+        paired = pair_opponents(df)
+        values = contribution_values(paired)
+        game_codes, game_ids = pd.factorize(paired["game_id"], sort=False, use_na_sentinel=False)
+        digests = game_digests(paired, values, game_codes, len(game_ids))
+        return paired, values, game_codes, game_ids.to_numpy(), digests
+
+    @classmethod
+    def build(cls, df):
+        """整張 team_stats_raw 一次建好（跟 aggregate_teams 同一套整欄加總）。"""
+        paired, values, game_codes, game_ids, digests = cls._prepare(df)
+        state = cls()
+        team_codes, state.team_ids, state.team_names = group_teams(paired)
+        state.sums = team_sums(team_codes, values, len(state.team_ids))
+        state.game_ids = game_ids
+        state.digests = digests
+        state.row_game = game_codes.astype(ROW_DTYPE)
+        state.row_team = team_codes.astype(ROW_DTYPE)
+        state.row_values = values.astype(ROW_DTYPE)
+        return state
+
+    def _apply(self, df, removed=(), complete=False):
+        """
+        把 df 裡的比賽換進累計狀態：digest 一樣的不動，新的 / 變了的先扣掉舊的 rows 再加上新的。
+        removed：要整場拿掉的 game_id；complete=True 表示 df 是整張表，狀態裡有、df 沒有的比賽也拿掉。
+        換掉的 rows 直接寫回原本的位置（不用複製整個狀態），只有多出來 / 少掉的 rows 才要接在後面 / 壓縮。
+        回傳有變動（新增 / 更新 / 拿掉）的場數。
+        """
+        paired, values, game_codes, game_ids, digests = self._prepare(df)
+
+        # 目前的比賽 ↔ 狀態裡的比賽（hash index，一次查完）
+        old_index = pd.Index(self.game_ids)
+        old_pos = old_index.get_indexer(game_ids)
+        known = old_pos >= 0
+        same = np.zeros(len(game_ids), dtype=bool)
+        same[known] = self.digests[old_pos[known]] == digests[known]
+        changed = ~same
+        updated = known & changed     # 狀態裡有、數據變了：比賽編號不變，rows 換掉
+
+        drop_game = np.ones(len(self.game_ids), dtype=bool) if complete else np.zeros(len(self.game_ids), dtype=bool)
+        drop_game[old_pos[same]] = False
+        drop_game[old_pos[updated]] = True
+        if removed:
+            gone = old_index.get_indexer(list(removed))
+            drop_game[gone[gone >= 0]] = True
+        remove_game = drop_game.copy()  # 整場拿掉（不會再加回來）的比賽
+        remove_game[old_pos[updated]] = False
+        n_changed = int(changed.sum()) + int(remove_game.sum())
+
+        # 扣掉舊的
+        drop_rows = drop_game[self.row_game]
+        if drop_rows.any():
+            self.sums -= team_sums(self.row_team[drop_rows], self.row_values[drop_rows], len(self.team_ids))
+
+        # 新的比賽接在比賽清單後面；變了的比賽沿用原本的編號、換 digest
+        added = np.flatnonzero(changed & ~known)
+        code_of = old_pos.copy()
+        code_of[added] = len(self.game_ids) + np.arange(len(added))
+        self.game_ids = np.concatenate([self.game_ids, game_ids[added]])
+        self.digests = np.concatenate([self.digests, digests[added]])
+        self.digests[old_pos[updated]] = digests[updated]
+
+        # 加上新的（沒看過的球隊接在後面）
+        add_rows = changed[game_codes]
+        new_game = code_of[game_codes[add_rows]]
+        new_values = values[add_rows].astype(self.row_values.dtype)
+        if add_rows.any():
+            new_team_ids = paired["team_id"].to_numpy()[add_rows]
+            new_team = pd.Index(self.team_ids).get_indexer(new_team_ids)
+            missing = new_team < 0
+            if missing.any():
+                extra_ids, first = pd.factorize(new_team_ids[missing], sort=False, use_na_sentinel=False)
+                _, first_rows = np.unique(extra_ids, return_index=True)
+                names = paired["team_name"].to_numpy(dtype=object)[add_rows][missing][first_rows]
+                new_team[missing] = len(self.team_ids) + extra_ids
+                self.team_ids = np.concatenate([self.team_ids, first])
+                self.team_names = np.concatenate([self.team_names, names])
+                self.sums = np.vstack([self.sums, np.zeros((len(first), self.sums.shape[1]), dtype=np.int64)])
+            self.sums += team_sums(new_team, new_values, len(self.team_ids))
+        else:
+            new_team = np.zeros(0, dtype=np.int64)
+
+        # rows：新的先填進扣掉的位置，多的接在後面，剩下沒用到的位置再壓縮掉
+        slots = np.flatnonzero(drop_rows)
+        k = min(len(slots), len(new_game))
+        self.row_game[slots[:k]] = new_game[:k]
+        self.row_team[slots[:k]] = new_team[:k]
+        self.row_values[slots[:k]] = new_values[:k]
+        if len(new_game) > k:
+            self.row_game = np.concatenate([self.row_game, new_game[k:].astype(self.row_game.dtype)])
+            self.row_team = np.concatenate([self.row_team, new_team[k:].astype(self.row_team.dtype)])
+            self.row_values = np.vstack([self.row_values, new_values[k:]])
+        elif len(slots) > k:
+            keep_rows = np.ones(len(self.row_game), dtype=bool)
+            keep_rows[slots[k:]] = False
+            self.row_game = self.row_game[keep_rows]
+            self.row_team = self.row_team[keep_rows]
+            self.row_values = self.row_values[keep_rows]
+
+        # 整場拿掉的比賽從比賽清單刪掉（它們的 rows 上面已經用掉 / 壓縮掉了），比賽編號重新排
+        if remove_game.any():
+            keep_game = np.concatenate([~remove_game, np.ones(len(added), dtype=bool)])
+            self.game_ids = self.game_ids[keep_game]
+            self.digests = self.digests[keep_game]
+            self.row_game = (np.cumsum(keep_game) - 1)[self.row_game].astype(self.row_game.dtype)
+
+        self._drop_empty_teams()
+        return n_changed
+
+    def _drop_empty_teams(self):
+        """比賽全部被扣掉的球隊拿掉（球隊編號重新排）。"""
+        keep = self.sums[:, 0] > 0
+        if keep.all():
+            return
+        self.team_ids = self.team_ids[keep]
+        self.team_names = self.team_names[keep]
+        self.sums = self.sums[keep]
+        self.row_team = (np.cumsum(keep) - 1)[self.row_team].astype(ROW_DTYPE)
+
+    def sync(self, df):
+        """
+        讓累計狀態跟整張 team_stats_raw（DataFrame）一致：digest 變了的比賽換掉、已經不在表裡的比賽扣掉。
+        回傳有變動的場數。
+        """
+        return self._apply(df, complete=True)
+
+    def replace_games(self, updates):
+        """
+        只換這幾場比賽（live_poller / 數據更正）：updates 是 {game_id: 這場的 team rows（list[dict]）}，
+        rows 是空的就把這場拿掉。跟目前記錄的一樣就不動。回傳有變動的場數。
+        """
+        rows = [r for game_rows in updates.values() for r in game_rows]
+        return self.replace_frame(pd.DataFrame(rows, columns=INPUT_COLUMNS), list(updates))
+
+    def replace_frame(self, df, game_ids):
+        """只換 game_ids 這幾場：df 是這幾場目前的 team rows（DataFrame），df 裡沒有的比賽就拿掉。回傳有變動的場數。"""
+        present = set(df["game_id"].tolist())
+        return self._apply(df, removed=[game_id for game_id in game_ids if game_id not in present])
+
+    def totals_frame(self):
+        """目前的累計 → aggregate_teams 同樣格式的 DataFrame（一隊一列）。"""
+        return totals_to_frame(self.team_ids, self.team_names, self.sums)
+
+    # -------- 存檔 / 讀檔 --------
+
+    @classmethod
+    def load(cls, path=STATE_PATH):
+        """讀回累計狀態；沒有檔案、讀不了、或欄位跟目前的 TOTAL_COLUMNS 不同（程式改過）就回傳 None。"""
+        if not path.exists():
+            return None
+        try:
+            with np.load(path) as data:
+                if data["columns"].tolist() != TOTAL_COLUMNS:
+                    return None
+                state = cls()
+                state.team_ids = _load_values(data, "team_ids")
+                state.team_names = _load_values(data, "team_names")
+                state.game_ids = _load_values(data, "game_ids")
+                state.sums = data["sums"]
+                state.digests = data["digests"]
+                state.row_game = data["row_game"].astype(ROW_DTYPE, copy=False)
+                state.row_team = data["row_team"].astype(ROW_DTYPE, copy=False)
+                state.row_values = data["row_values"].astype(ROW_DTYPE, copy=False)
+                if "source_stamp" in data:
+                    state.source = tuple(data["source_stamp"].tolist())
+        except (OSError, ValueError, KeyError):
+            return None
+        return state
+
+    def save(self, path=STATE_PATH):
+        """先寫暫存檔再 os.replace，寫到一半當掉也不會留下壞掉的狀態檔。"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with tmp.open("wb") as f:
+            np.savez(
+                f,
+                columns=np.array(TOTAL_COLUMNS),
+                **_saved_values("team_ids", self.team_ids),
+                **_saved_values("team_names", self.team_names),
+                **_saved_values("game_ids", self.game_ids),
+                sums=self.sums,
+                digests=self.digests,
+                row_game=self.row_game,
+                row_team=self.row_team,
+                row_values=self.row_values,
+                **({} if self.source is None else {"source_stamp": np.array(self.source, dtype=np.int64)}),
+            )
+        os.replace(tmp, path)
+
+
+def _saved_values(name, values):
+    """
+    id / 名字存進 npz 的方式：整數直接存 array；字串、None 混在一起的（object）存成 UTF-8 JSON，
+    兩種都不用 pickle。
+    """
+    values = np.asarray(values)
+    if values.dtype.kind in "iu":
+        return {name: values}
+    plain = [None if v is None or v != v else (v.item() if hasattr(v, "item") else v) for v in values]
+    return {name + "_json": np.frombuffer(json.dumps(plain, ensure_ascii=False).encode("utf-8"), dtype=np.uint8)}
+
+
+def _load_values(data, name):
+    if name in data:
+        return data[name]
+    values = json.loads(data[name + "_json"].tobytes())
+    out = np.empty(len(values), dtype=object)   # 保持 object，不讓 NumPy 把字串 / 數字混在一起轉型
+    out[:] = values
+    return out
+
+
+def pace_scale(games, poss_for_raw):
+    """
+    回合數的校正係數：乘上之後聯盟平均 Pace（每隊 possessions / 場數的平均）≈ TARGET_PACE。
+    games / poss_for_raw 是每隊一個值的 array（team_rolling 的視窗也用同一個係數）。
+    """
+    games = np.asarray(games)
+    poss_for_raw = np.asarray(poss_for_raw, dtype=np.float64)
+    # 依球隊順序逐一相加（跟原本的 sum() 一樣），不用 np.sum 的 pairwise 加總
+    raw_paces = (poss_for_raw / np.where(games > 0, games, 1))[(games > 0) & (poss_for_raw > 0)]
+    league_raw_pace = sum(raw_paces.tolist()) / len(raw_paces) if len(raw_paces) else 1.0  # 避免除以 0
+    return TARGET_PACE / league_raw_pace if league_raw_pace > 0 else 1.0
+
+
+def compute_metrics(totals):
+    """每隊的累計數據 → 進階指標（全部是整欄運算），依 OffRtg 由高到低排序。"""
+    games = totals["games"].to_numpy()
+    poss_for_raw = totals["possessions_for"].to_numpy()
+    poss_against_raw = totals["possessions_against"].to_numpy()
 
+    # === 🔧 校正回合數：讓聯盟平均 Pace ≈ 90 回合/場 ===
+    scale = pace_scale(games, poss_for_raw)
+
+    games = np.where(games > 0, games, 1)
+    pf = totals["points_for"].to_numpy()
+    pa = totals["points_against"].to_numpy()
+    fga = totals["fga"].to_numpy()
+    fta = totals["fta"].to_numpy()
+    oreb = totals["oreb"].to_numpy()
+    dreb = totals["dreb"].to_numpy()
+    opp_fga = totals["opp_fga"].to_numpy()
+
+    # 套用 Pace 校正係數（把 poss 拉回合理尺度）
+    poss_for = poss_for_raw * scale
+    poss_against = poss_against_raw * scale
+
+    result = pd.DataFrame({
+        "team_id": totals["team_id"],
+        "team_name": totals["team_name"],
+        "games": games,
+        "points_for_total": pf,
+        "points_against_total": pa,
+        "points_for_avg": pf / games,
+        "points_against_avg": pa / games,
         # eFG% = (FGM + 0.5 * 3PM) / FGA
-        efg = safe_div(fgm + 0.5 * three_pm, fga)
-
+        "efg": safe_div(totals["fgm"].to_numpy() + 0.5 * totals["three_pm"].to_numpy(), fga),
         # TS% = PTS / (2 * (FGA + 0.44 * FTA))
-        ts = safe_div(pf, 2 * (fga + 0.44 * fta))
-
+        "ts": safe_div(pf, 2 * (fga + 0.44 * fta)),
         # OffRtg = 每 100 回合得分（已校正 possessions）
-        off_rtg = safe_div(pf * 100, poss_for)
-
-        # DefRtg = 每 100 回合失分
-        def_rtg = safe_div(pa * 100, poss_against)
-
+        "off_rtg": safe_div(pf * 100, poss_for),
+        # DefRtg = 每 100 個對手回合失分（對手回合數是真的算出來的，不再假設跟我方一樣）
+        "def_rtg": safe_div(pa * 100, poss_against),
         # Pace = 每場平均回合數（已校正）
-        pace = safe_div(poss_for, games)
-
+        "pace": safe_div(poss_for, games),
         # TOV% = TOV / possessions
-        tov_pct = safe_div(t["tov"], poss_for)
-
+        "tov_pct": safe_div(totals["tov"].to_numpy(), poss_for),
         # FT Rate = FTA / FGA
-        ft_rate = safe_div(fta, fga)
-
-        summary = {
-            "team_id": t["team_id"],
-            "team_name": t["team_name"],
-            "games": games,
-            "points_for_total": pf,
-            "points_against_total": pa,
-            "points_for_avg": pf / games,
-            "points_against_avg": pa / games,
-            "efg": efg,
-            "ts": ts,
-            "off_rtg": off_rtg,
-            "def_rtg": def_rtg,
-            "pace": pace,
-            "tov_pct": tov_pct,
-            "ft_rate": ft_rate,
-        }
-        result.append(summary)
-
-    # 依照 OffRtg 排序，看哪隊進攻效率最強
-    result.sort(key=lambda x: (x["off_rtg"] or 0), reverse=True)
+        "ft_rate": safe_div(fta, fga),
+        # 防守端 four factors：對手的 eFG% / TOV%（每個對手回合）/ FT Rate
+        "opp_efg": safe_div(
+            totals["opp_fgm"].to_numpy() + 0.5 * totals["opp_three_pm"].to_numpy(), opp_fga),
+        "opp_tov_pct": safe_div(totals["opp_tov"].to_numpy(), poss_against),
+        "opp_ft_rate": safe_div(totals["opp_fta"].to_numpy(), opp_fga),
+        # OREB% = OREB / (OREB + 對手 DREB)；DRB% = DREB / (DREB + 對手 OREB)
+        "oreb_pct": safe_div(oreb, oreb + totals["opp_dreb"].to_numpy()),
+        "drb_pct": safe_div(dreb, dreb + totals["opp_oreb"].to_numpy()),
+        # 場均分差
+        "margin_avg": (pf - pa) / games,
+    })
+
+    # 依照 OffRtg 排序，看哪隊進攻效率最強（stable：一樣的維持原本順序）
+    order = result["off_rtg"].fillna(0).sort_values(ascending=False, kind="stable").index
+    return result.loc[order].reset_index(drop=True)
+
+
+def to_records(frame):
+    """DataFrame → list[dict]，NaN 變 None、數字都是 Python 原生型別（json.dump 用）。"""
+    return frame.astype(object).where(frame.notna(), None).to_dict("records")
+
+
+def compute_advanced(rebuild=False):
+    """
+    用 team_stats_raw 更新累計狀態，再重寫 team_advanced.json：
+      - 沒有狀態（或 rebuild）：讀整張表、整欄加總重建
+      - 有 stats_crawler 的變動記錄：只讀記錄裡那幾場的 rows 換進去（跟表的大小無關）
+      - 沒有記錄、表也沒被改過：直接用狀態
+      - 沒有記錄、表卻被改過（手動改 / git checkout）：讀整張表逐場比對 digest
+    """
+    changes = storage.pending_changes("team_stats_raw")
+    stamp = storage.source_stamp("team_stats_raw")
+    state = None if rebuild else TeamTotals.load()
+
+    if state is None:
+        df = load_team_stats()
+        if df.empty:
+            return
+        print(f"重新加總 {len(df)} 筆隊伍數據")
+        state = TeamTotals.build(df)
+        changed = len(state.game_ids)
+    elif changes is not None and not changes["all"]:
+        game_ids = changes["game_ids"]
+        changed = state.replace_frame(load_team_stats(game_ids), game_ids)
+        print(f"累計狀態更新：記錄裡的 {len(game_ids)} 場，{changed} 場有變動")
+    elif changes is None and stamp == state.source:
+        changed = 0
+        print("team_stats_raw 沒有變動")
+    else:
+        df = load_team_stats()
+        if df.empty:
+            return
+        changed = state.sync(df)
+        print(f"累計狀態更新（整張表比對）：{changed} 場有變動")
+
+    if changed or state.source != stamp:
+        state.source = stamp
+        state.save()
+    storage.clear_changes("team_stats_raw")
+    write_outputs(state)
+
+
+def apply_game_rows(updates):
+    """
+    只把有變化的比賽換進累計狀態，然後重寫 team_advanced.json（live_poller 每輪呼叫）。
+    updates：{game_id: 這場的 team rows（extract_game()["team"]）}
+    還沒有狀態檔時改成 compute_advanced()，從 team_stats_raw 整個加總一次。
+    """
+    state = TeamTotals.load()
+    if state is None:
+        compute_advanced()
+        return
+
+    changed = state.replace_games(updates)
+    # 呼叫端剛把這幾場寫進 team_stats_raw：檔案的改變已經換進狀態了，不用再整張比對
+    stamp = storage.source_stamp("team_stats_raw")
+    if changed or state.source != stamp:
+        state.source = stamp
+        state.save()
+    write_outputs(state)
+
+
+def write_outputs(state):
+    """累計狀態 → 指標 → data/team_advanced.json（+ Parquet），並印出排行榜。"""
+    result = to_records(compute_metrics(state.totals_frame()))
 
     # 存成 JSON
     OUTPUT_PATH.parent.mkdir(parents=True, exist_ok=True)
     with OUTPUT_PATH.open("w", encoding="utf-8") as f:
         json.dump(result, f, ensure_ascii=False, indent=2)
+    storage.write_table("team_advanced", result)
 
     # 在終端機印出簡單排行榜（含 OffRtg、DefRtg、Pace、TOV%、FT Rate）
     print(f"已將進階數據寫入 {OUTPUT_PATH}\n")
@@ -198,6 +610,9 @@ def compute_advanced():
         ))
 
 
-
 if __name__ == "__main__":
-    compute_advanced()
+    parser = argparse.ArgumentParser(description="計算球隊進階數據")
+    parser.add_argument("--rebuild", action="store_true",
+                        help=f"忽略 {STATE_PATH}，從 team_stats_raw 全部重新加總")
+    args = parser.parse_args()
+    compute_advanced(rebuild=args.rebuild)
@@ -0,0 +1,538 @@
+# http_client.py
+# 功能：所有 TPBL 爬蟲共用的 HTTP client
+# 1. 一個共用的 requests.Session + 連線池（keep-alive，不用每個 request 都重新 TCP/TLS 握手）
+# 2. 統一的 User-Agent、Accept-Encoding（gzip/deflate）與 timeout
+# 3. 每個 request 的耗時與傳輸量都記在計數器裡（也分 endpoint 記 latency histogram），
+#    爬完可以印出來看，或由 telemetry.py 寫成 run report / Prometheus textfile
+# 4. 磁碟快取（data/.http_cache）：依 URL 存 response，過期後用 ETag / Last-Modified 重新驗證
+# 5. 失敗自動重試（指數 backoff + jitter，429/503 會照 Retry-After 等）、
+#    錯誤率太高時用 circuit breaker 暫停整個 crawl、依延遲自動調整同時進行的 request 數
+
+from bisect import bisect_left
+from collections import deque
+from email.utils import parsedate_to_datetime
+import hashlib
+import json
+import os
+from pathlib import Path
+import random
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+DEFAULT_TIMEOUT = 10
+
+# API 根網址；設環境變數 TPBL_API_BASE 可以改打本機的 replay_server.py（測試 / benchmark 用）
+API_BASE = os.environ.get("TPBL_API_BASE", "https://api.tpbl.basketball/api").rstrip("/")
+
+# ===== 磁碟快取設定 =====
+CACHE_DIR = Path("data/.http_cache")
+CACHE_MAX_BYTES = 200 * 1024 * 1024  # 超過就依 LRU 刪掉最久沒用的
+
+# 設環境變數 TPBL_NO_CACHE=1 或呼叫 set_cache_enabled(False) 可以整個跳過快取
+cache_enabled = os.environ.get("TPBL_NO_CACHE", "") in ("", "0")
+
+# 各 endpoint 的預設 TTL（秒）；第一個符合的 pattern 生效
+# 單場 stats 預設很短（可能是進行中的比賽），已完成的比賽由呼叫端傳 ttl=FINISHED_GAME_TTL
+FINISHED_GAME_TTL = 30 * 24 * 3600
+ENDPOINT_TTLS = [
+    (re.compile(r"/games/\d+/stats"), 60),
+    (re.compile(r"/seasons/\d+/games"), 10 * 60),
+    (re.compile(r"/games/stats/players"), 60 * 60),
+    (re.compile(r"/divisions/\d+/players"), 24 * 3600),
+]
+DEFAULT_TTL = 5 * 60
+
+# 連線池大小：要 >= 爬蟲同時進行的 request 數，不然多出來的連線用完就被丟掉
+POOL_MAXSIZE = 16
+
+# ===== 重試設定 =====
+MAX_RETRIES = 4
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+BACKOFF_BASE = 0.5    # 第 n 次重試最多等 BACKOFF_BASE * 2**n 秒（full jitter）
+BACKOFF_MAX = 30.0
+RETRY_AFTER_MAX = 120.0  # 伺服器要求等太久就只等這麼多
+
+HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
+        "AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/120.0 Safari/537.36"
+    ),
+    "Accept": "application/json",
+    "Accept-Encoding": "gzip, deflate",
+    "Connection": "keep-alive",
+}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+# latency histogram 的上界（秒）；跟 Prometheus 的 le 一樣，最後還有一格 +Inf
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_API_PATH = urlsplit(API_BASE).path
+
+
+def endpoint_of(url):
+    """URL → endpoint 名稱：去掉 API 根路徑與 query，數字 id 換成 {id}（例如 /games/{id}/stats）。"""
+    path = urlsplit(url).path
+    if path.startswith(_API_PATH):
+        path = path[len(_API_PATH):]
+    return re.sub(r"/\d+(?=/|$)", "/{id}", path) or "/"
+
+
+def percentile(values, q):
+    """nearest-rank 百分位數；沒有資料回傳 0。"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[k]
+
+
+class RequestStats:
+    """累計 request 次數、耗時與傳輸量（thread-safe）；有給 url 的話也分 endpoint 記一份。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.requests = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.wire_bytes = 0   # 實際在網路上傳的 bytes（壓縮後）
+        self.body_bytes = 0   # 解壓後的 body 大小
+        self.cache_hits = 0   # 快取還沒過期，完全沒打 API
+        self.revalidated = 0  # 過期但伺服器回 304，沿用快取內容
+        self.retries = 0
+        self.latencies = []   # 每個 request 的秒數，算 p50 / p99 用
+        self.endpoints = {}   # endpoint → 同樣的計數器 + latency histogram
+
+    def _endpoint(self, url):
+        name = endpoint_of(url) if url else "(unknown)"
+        if name not in self.endpoints:
+            self.endpoints[name] = {
+                "requests": 0, "errors": 0, "retries": 0, "cache_hits": 0, "revalidated": 0,
+                "wire_bytes": 0, "body_bytes": 0, "total_seconds": 0.0, "max_seconds": 0.0,
+                "latencies": [],
+                "buckets": [0] * (len(LATENCY_BUCKETS) + 1),   # 不累積；snapshot 時才轉成累積
+            }
+        return self.endpoints[name]
+
+    def record(self, seconds, wire_bytes=0, body_bytes=0, error=False, url=None):
+        with self._lock:
+            self.requests += 1
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+            self.wire_bytes += wire_bytes
+            self.body_bytes += body_bytes
+            self.latencies.append(seconds)
+            if error:
+                self.errors += 1
+
+            c = self._endpoint(url)
+            c["requests"] += 1
+            c["total_seconds"] += seconds
+            c["max_seconds"] = max(c["max_seconds"], seconds)
+            c["wire_bytes"] += wire_bytes
+            c["body_bytes"] += body_bytes
+            c["latencies"].append(seconds)
+            c["buckets"][bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            if error:
+                c["errors"] += 1
+
+    def _count(self, attr, url):
+        with self._lock:
+            setattr(self, attr, getattr(self, attr) + 1)
+            self._endpoint(url)[attr] += 1
+
+    def record_cache_hit(self, url=None):
+        self._count("cache_hits", url)
+
+    def record_revalidated(self, url=None):
+        self._count("revalidated", url)
+
+    def record_retry(self, url=None):
+        self._count("retries", url)
+
+    def snapshot(self):
+        with self._lock:
+            avg = self.total_seconds / self.requests if self.requests else 0.0
+            endpoints = {}
+            for name, c in sorted(self.endpoints.items()):
+                cumulative, histogram = 0, {}   # {"0.025": 累積次數, ..., "+Inf": 總次數}
+                for le, n in zip(LATENCY_BUCKETS + ("+Inf",), c["buckets"]):
+                    cumulative += n
+                    histogram[str(le)] = cumulative
+                endpoints[name] = {
+                    **{k: v for k, v in c.items() if k not in ("latencies", "buckets")},
+                    "avg_seconds": c["total_seconds"] / c["requests"] if c["requests"] else 0.0,
+                    "p50_seconds": percentile(c["latencies"], 50),
+                    "p99_seconds": percentile(c["latencies"], 99),
+                    "histogram": histogram,
+                }
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "total_seconds": self.total_seconds,
+                "avg_seconds": avg,
+                "max_seconds": self.max_seconds,
+                "p50_seconds": percentile(self.latencies, 50),
+                "p99_seconds": percentile(self.latencies, 99),
+                "wire_bytes": self.wire_bytes,
+                "body_bytes": self.body_bytes,
+                "cache_hits": self.cache_hits,
+                "revalidated": self.revalidated,
+                "retries": self.retries,
+                "endpoints": endpoints,
+            }
+
+
+class CircuitBreaker:
+    """
+    看最近 window 個 request 的結果，失敗比例 >= failure_ratio 就「跳脫」：
+    接下來 cooldown 秒所有 request 都先暫停，讓 API 喘口氣。
+    暫停結束後重新累積樣本（half-open），還是一直失敗就會再跳一次。
+    """
+
+    def __init__(self, window=20, min_samples=10, failure_ratio=0.5, cooldown=30.0):
+        self.min_samples = min_samples
+        self.failure_ratio = failure_ratio
+        self.cooldown = cooldown
+        self.open_until = 0.0
+        self._results = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, ok):
+        with self._lock:
+            self._results.append(ok)
+            n = len(self._results)
+            failures = n - sum(self._results)
+            now = time.monotonic()
+            if n >= self.min_samples and failures / n >= self.failure_ratio and now >= self.open_until:
+                self.open_until = now + self.cooldown
+                self._results.clear()
+                print(f"  ⛔ 最近 {n} 個 request 有 {failures} 個失敗，暫停 {self.cooldown:.0f} 秒")
+
+    def wait(self):
+        """breaker 跳脫中就睡到冷卻結束。"""
+        delay = self.open_until - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD 方式調整同時進行的 request 上限：
+      - 成功且延遲正常 → 上限慢慢 +1/limit（大約每一輪 +1）
+      - 失敗或延遲（EWMA）超過最低延遲的 tolerance 倍 → 上限砍半
+    砍半之後至少隔 decrease_interval 秒才會再砍，避免一次連砍好幾刀。
+    """
+
+    def __init__(self, initial=4, min_limit=1, max_limit=POOL_MAXSIZE,
+                 tolerance=2.0, decrease_interval=1.0):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.decrease_interval = decrease_interval
+        self.in_flight = 0
+        self.ewma = None
+        self.baseline = None
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= max(self.min_limit, int(self.limit)):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, seconds, ok):
+        with self._cond:
+            self.in_flight -= 1
+
+            self.ewma = seconds if self.ewma is None else 0.8 * self.ewma + 0.2 * seconds
+            # baseline = 看過最快的延遲，但讓它慢慢往上飄，伺服器整體變慢時才不會一直砍
+            self.baseline = seconds if self.baseline is None else min(seconds, self.baseline * 1.01)
+
+            now = time.monotonic()
+            slow = self.ewma > self.tolerance * self.baseline
+            if not ok or slow:
+                if now - self._last_decrease >= self.decrease_interval:
+                    self.limit = max(self.min_limit, self.limit / 2)
+                    self._last_decrease = now
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+            self._cond.notify_all()
+
+
+stats = RequestStats()
+breaker = CircuitBreaker()
+concurrency = AdaptiveConcurrency()
+
+
+def get_session():
+    """回傳共用的 Session（第一次呼叫時才建立）。"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_MAXSIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update(HEADERS)
+            _session = session
+        return _session
+
+
+def _wire_size(resp):
+    """盡量拿到壓縮前（網路上）的大小，拿不到就用解壓後的長度。"""
+    raw = getattr(resp, "raw", None)
+    try:
+        n = raw.tell()
+        if n:
+            return n
+    except Exception:
+        pass
+    return len(resp.content)
+
+
+# -------- 磁碟快取 --------
+
+_cache_lock = threading.Lock()
+
+
+def set_cache_enabled(enabled):
+    """開 / 關磁碟快取（例如爬蟲的 --no-cache 參數）。"""
+    global cache_enabled
+    cache_enabled = bool(enabled)
+
+
+def ttl_for(url):
+    """依 URL 找對應 endpoint 的 TTL。"""
+    for pattern, ttl in ENDPOINT_TTLS:
+        if pattern.search(url):
+            return ttl
+    return DEFAULT_TTL
+
+
+def _entry_ttl(entry, ttl):
+    """
+    快取項目實際的有效期限：這次要的 ttl 跟「寫入時用的 ttl」取小的。
+    例如比賽進行中（ttl 很短）存的單場 stats，比賽結束後用 FINISHED_GAME_TTL 讀，
+    還是會先問一次伺服器（304 / 200 之後才用長 TTL 重新存），不會把比賽中的數據當成最終結果放 30 天。
+    舊的快取項目沒有記 ttl，就當成這個 endpoint 的預設 TTL。
+    """
+    stored = entry.get("ttl")
+    if stored is None:
+        stored = ttl_for(entry.get("url", ""))
+    return min(ttl, stored)
+
+
+def _cache_path(url):
+    key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    return CACHE_DIR / f"{key}.json"
+
+
+def _cache_read(url):
+    path = _cache_path(url)
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if entry.get("url") != url:
+        return None
+    # 更新 mtime，LRU 淘汰時就知道它最近被用過
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return entry
+
+
+def _cache_write(url, entry):
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    path = _cache_path(url)
+    tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(entry, f, ensure_ascii=False)
+    os.replace(tmp, path)
+    _cache_evict()
+
+
+def _cache_evict():
+    """快取總大小超過 CACHE_MAX_BYTES 時，從最久沒用（mtime 最舊）的開始刪。"""
+    with _cache_lock:
+        files = []
+        total = 0
+        for p in CACHE_DIR.glob("*.json"):
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, p))
+            total += st.st_size
+
+        if total <= CACHE_MAX_BYTES:
+            return
+
+        files.sort()
+        for _, size, p in files:
+            if total <= CACHE_MAX_BYTES:
+                break
+            try:
+                p.unlink()
+                total -= size
+            except OSError:
+                pass
+
+
+def clear_cache():
+    """刪掉整個磁碟快取。"""
+    for p in CACHE_DIR.glob("*.json"):
+        p.unlink(missing_ok=True)
+
+
+# -------- 重試 --------
+
+def _retry_after(resp):
+    """解析 Retry-After（秒數或 HTTP 日期），沒有或看不懂就回傳 None。"""
+    if resp is None:
+        return None
+    value = resp.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def _retry_delay(attempt, resp):
+    """429/503 有 Retry-After 就照它，否則指數 backoff + full jitter。"""
+    delay = _retry_after(resp)
+    if delay is not None:
+        return min(delay, RETRY_AFTER_MAX)
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+# -------- 對外的 GET --------
+
+def get_json(url, params=None, timeout=DEFAULT_TIMEOUT, ttl=None, retries=MAX_RETRIES):
+    """
+    發送 GET 並回傳 JSON，4xx/5xx 會丟 requests.HTTPError。
+
+    有開快取時：
+      - 快取還在 TTL 內 → 直接回傳，不打 API（TTL 是這次的 ttl 跟寫入時的 ttl 取小的，見 _entry_ttl）
+      - 過期 → 帶 If-None-Match / If-Modified-Since 問伺服器，304 就沿用快取
+    ttl 沒給就依 ENDPOINT_TTLS 決定。
+    連線錯誤、429、5xx 最多重試 retries 次，全部失敗才丟錯。
+    """
+    full_url = requests.Request("GET", url, params=params).prepare().url
+    ttl = ttl_for(full_url) if ttl is None else ttl
+
+    entry = _cache_read(full_url) if cache_enabled else None
+    if entry is not None and time.time() - entry.get("stored_at", 0) < _entry_ttl(entry, ttl):
+        stats.record_cache_hit(full_url)
+        return entry["data"]
+
+    headers = {}
+    if entry is not None:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    attempt = 0
+    while True:
+        breaker.wait()
+        concurrency.acquire()
+        start = time.perf_counter()
+        resp = None
+        error = None
+        try:
+            resp = get_session().get(full_url, headers=headers, timeout=timeout)
+        except requests.RequestException as e:
+            error = e
+        seconds = time.perf_counter() - start
+
+        # 只有「暫時性」的錯誤（連線問題、429、5xx）算失敗並重試；404 之類直接往下丟錯
+        if error is not None:
+            transient = isinstance(error, (requests.ConnectionError, requests.Timeout))
+        else:
+            transient = resp.status_code in RETRY_STATUSES
+        concurrency.release(seconds, ok=not transient)
+        breaker.record(ok=not transient)
+
+        if not transient or attempt >= retries:
+            break
+
+        delay = _retry_delay(attempt, resp)
+        reason = type(error).__name__ if error is not None else f"HTTP {resp.status_code}"
+        stats.record(seconds, error=True, url=full_url)
+        stats.record_retry(full_url)
+        print(f"  ↻ {full_url} 失敗（{reason}），{delay:.1f} 秒後第 {attempt + 1} 次重試")
+        time.sleep(delay)
+        attempt += 1
+
+    try:
+        if error is not None:
+            raise error
+        if resp.status_code == 304 and entry is not None:
+            data = entry["data"]
+        else:
+            resp.raise_for_status()
+            data = resp.json()
+    except Exception:
+        stats.record(seconds, error=True, url=full_url)
+        raise
+
+    stats.record(
+        seconds,
+        wire_bytes=_wire_size(resp),
+        body_bytes=len(resp.content),
+        url=full_url,
+    )
+
+    if cache_enabled:
+        if resp.status_code == 304:
+            stats.record_revalidated(full_url)
+        else:
+            entry = {
+                "url": full_url,
+                "etag": resp.headers.get("ETag"),
+                "last_modified": resp.headers.get("Last-Modified"),
+                "data": data,
+            }
+        entry["stored_at"] = time.time()
+        entry["ttl"] = ttl   # 寫入當下用的 TTL（之後拿更長的 TTL 來讀也不會沿用）
+        _cache_write(full_url, entry)
+
+    return data
+
+
+def print_stats():
+    """在終端機印出目前累計的 request 統計。"""
+    s = stats.snapshot()
+    print(
+        f"HTTP：{s['requests']} 次 request（失敗 {s['errors']}），"
+        f"平均 {s['avg_seconds'] * 1000:.0f} ms，最慢 {s['max_seconds'] * 1000:.0f} ms，"
+        f"傳輸 {s['wire_bytes'] / 1024:.1f} KB（解壓後 {s['body_bytes'] / 1024:.1f} KB），"
+        f"快取命中 {s['cache_hits']}、304 重新驗證 {s['revalidated']}、重試 {s['retries']}"
+    )
@@ -0,0 +1,183 @@
+# live_poller.py
+# 功能：比賽進行中時持續更新數據（給 Dashboard 看接近即時的數字）
+# 1. 定期重抓賽程，找出目前 is_live 的比賽
+# 2. 只輪詢這幾場的 /games/{id}/stats，間隔會自動調整：
+#    有變化就縮短到 POLL_MIN，連續沒變化就慢慢拉長到 POLL_MAX
+# 3. 只有數據真的變了，才替換那一場的 rows（team_stats_raw / 分節 / 球員單場，SQLite 只 upsert 那一場），
+#    並把那一場換進球隊累計狀態、重寫 team_advanced.json，再重算兩隊的近況 team_rolling.json；
+#    沒變就什麼都不寫
+#
+# 用法：
+#   python src/live_poller.py            # 一直跑，Ctrl+C 結束
+#   python src/live_poller.py --once     # 只輪詢一輪（排程 / 測試用）
+
+import argparse
+import hashlib
+import json
+import time
+
+import analyze_team_advanced
+import http_client
+from raw_archive import RawArchive
+import schedule_crawler
+import stats_crawler
+import team_rolling
+import telemetry
+
+
+POLL_MIN = 10.0             # 秒：有變化時的輪詢間隔
+POLL_MAX = 60.0             # 秒：一直沒變化時最長拉到這麼久
+POLL_BACKOFF = 1.5          # 沒變化時間隔 * 1.5
+SCHEDULE_REFRESH = 120.0    # 秒：多久重抓一次賽程（找新開打 / 剛結束的比賽）
+IDLE_SLEEP = 300.0          # 秒：目前沒有比賽在打時，多久再看一次
+FINAL_POLL_RETRIES = 5      # 剛結束的比賽：終場數據最多再試幾輪，還是抓不到才放棄
+
+
+def rows_digest(parsed):
+    """單場解析結果的 hash，用來判斷這一輪數據有沒有變。"""
+    raw = json.dumps(parsed, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def refresh_schedule():
+    """
+    重抓目前賽季的賽程（一次 request 同時更新 schedule_raw.json 與 tpbl_crawler_raw.json），
+    回傳 stats_crawler 格式的 games。
+    """
+    season_id = schedule_crawler.CURRENT_SEASON_ID
+    all_games = schedule_crawler.crawl_all_games(season_ids=[season_id], refresh_all=True)
+    return schedule_crawler.to_game_rows([g for g in all_games if g["season_id"] == season_id])
+
+
+def poll_game(game_id, archive):
+    """抓單場最新 stats 並解析；失敗回傳 None。ttl=0 表示一定問伺服器（仍會用 ETag 省流量）。"""
+    url = stats_crawler.GAME_STATS_URL.format(game_id=game_id)
+    try:
+        stats_json = http_client.get_json(url, ttl=0)
+    except Exception as e:
+        print(f"  ⚠ 抓取比賽 {game_id} 失敗：{e}")
+        return None
+    archive.put(game_id, url, stats_json)
+    return stats_crawler.extract_game(game_id, stats_json)
+
+
+def apply_updates(games, updates):
+    """
+    把有變化的比賽 rows 換進既有輸出檔（其他比賽原封不動、SQLite 只 upsert 這幾場），
+    再只把這幾場換進球隊累計狀態、重寫 team_advanced.json（不用整個重新加總），
+    最後重算這幾場兩隊的近況（team_rolling.json）。
+    updates：{game_id: extract_game() 的結果}
+    """
+    stats_crawler.patch_outputs(updates, [g["id"] for g in games])
+    analyze_team_advanced.apply_game_rows(
+        {game_id: parsed["team"] for game_id, parsed in updates.items()})
+    team_rolling.update_teams(
+        {r["team_id"] for parsed in updates.values() for r in parsed["team"]})
+
+
+def run(once=False):
+    archive = RawArchive()
+    digests = {}         # game_id -> 上一輪數據的 hash
+    watching = set()     # 正在盯的比賽（包含剛結束、還要再抓最後一次的）
+    final_failures = {}  # game_id -> 已結束的比賽抓終場數據失敗了幾輪
+    games = []
+    interval = POLL_MIN
+    next_schedule = 0.0
+
+    while True:
+        now = time.monotonic()
+        if now >= next_schedule:
+            try:
+                games = refresh_schedule()
+            except Exception as e:
+                print(f"⚠ 重抓賽程失敗：{e}")
+            next_schedule = now + SCHEDULE_REFRESH
+
+            live_ids = {g["id"] for g in games if g.get("is_live")}
+            ended = watching - live_ids
+            just_ended = ended - set(final_failures)   # 還在重試終場數據的不用再印一次
+            if just_ended:
+                print(f"比賽結束：{sorted(just_ended)}（再抓最後一次）")
+            # 剛結束的比賽保留這一輪，拿到終場數據後再移除
+            watching = live_ids | ended
+            if live_ids:
+                print(f"進行中的比賽：{sorted(live_ids)}")
+
+        if not watching:
+            if once:
+                print("目前沒有進行中的比賽。")
+                return
+            print(f"目前沒有進行中的比賽，{IDLE_SLEEP:.0f} 秒後再看一次...")
+            telemetry.flush()
+            time.sleep(IDLE_SLEEP)
+            next_schedule = 0.0
+            continue
+
+        # 第一次看到的比賽，先用輸出檔裡現有的 rows 當基準，沒變就不用重寫
+        unseeded = [gid for gid in watching if gid not in digests]
+        if unseeded:
+            existing = stats_crawler.read_game_rows(unseeded)
+            for game_id in unseeded:
+                digests[game_id] = rows_digest(
+                    {name: existing[name].get(game_id, []) for name in existing}
+                )
+
+        updates = {}
+        fetched = set()
+        live_now = {g["id"] for g in games if g.get("is_live")}
+        by_id = {g["id"]: g for g in games}
+        for game_id in sorted(watching):
+            parsed = poll_game(game_id, archive)
+            if parsed is None:
+                continue
+            fetched.add(game_id)
+            stats_crawler.warn_missing_player_lines(by_id.get(game_id, {"id": game_id}), parsed)
+            digest = rows_digest(parsed)
+            if digests.get(game_id) != digest:
+                digests[game_id] = digest
+                updates[game_id] = parsed
+
+        # 已經結束的比賽成功抓到最後一次才不再盯；抓失敗就下一輪再試，最多 FINAL_POLL_RETRIES 輪
+        for game_id in watching - live_now:
+            if game_id not in fetched:
+                final_failures[game_id] = final_failures.get(game_id, 0) + 1
+                if final_failures[game_id] < FINAL_POLL_RETRIES:
+                    continue
+                print(
+                    f"⚠ 比賽 {game_id} 的終場數據連續 {FINAL_POLL_RETRIES} 輪都抓不到，先放棄"
+                    "（下次 stats_crawler.py --incremental 會再抓）"
+                )
+            watching.discard(game_id)
+            digests.pop(game_id, None)
+            final_failures.pop(game_id, None)
+
+        if updates:
+            print(f"{time.strftime('%H:%M:%S')} 有 {len(updates)} 場數據更新：{sorted(updates)}")
+            apply_updates(games, updates)
+            archive.save()
+            interval = POLL_MIN
+        else:
+            interval = min(POLL_MAX, interval * POLL_BACKOFF)
+        telemetry.flush()   # 每一輪都更新 run report / .prom，不用等程式結束
+
+        if once:
+            return
+
+        time.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="輪詢進行中的比賽，只更新有變化的數據")
+    parser.add_argument("--once", action="store_true", help="只輪詢一輪就結束")
+    args = parser.parse_args()
+
+    with telemetry.crawl_run("live_poller"):
+        try:
+            run(once=args.once)
+        except KeyboardInterrupt:
+            print("\n停止輪詢。")
+        http_client.print_stats()
+
+
+if __name__ == "__main__":
+    main()
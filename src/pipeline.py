@@ -0,0 +1,294 @@
+# pipeline.py
+# 功能：把整個資料流程串成一個 DAG，一個指令跑完
+#
+#   games (schedule_crawler) → team_stats (stats_crawler) → team_advanced (analyze_team_advanced)
+#                            │                             → team_rolling (team_rolling)
+#                            └ player_stats (player_stats_crawler) → player_advanced (player_advanced)
+#
+# games stage 每季只打一次 API，同時產生賽程表 schedule_raw.json 與 stats_crawler 用的 tpbl_crawler_raw.json
+#
+# 每個 stage 宣告自己的輸入 / 輸出檔，data/.pipeline_state.json 記錄上次跑完時
+# 輸入檔（含程式本身）的 sha256；輸入沒變、輸出也都還在就跳過。
+# 彼此沒有相依的分支（球隊線 / 球員線）會同時跑。
+#
+# 用法：
+#   python src/pipeline.py               # 爬蟲一律重跑，分析 stage 只在輸入有變時重跑
+#   python src/pipeline.py --offline     # 不跑爬蟲，只重算有變動的分析 stage
+#   python src/pipeline.py --force       # 全部重跑
+#   python src/pipeline.py --dry-run     # 只列出會跑哪些 stage
+
+import argparse
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import datetime
+import hashlib
+import json
+from pathlib import Path
+import subprocess
+import sys
+import time
+
+
+ROOT = Path(__file__).resolve().parent.parent
+SRC = ROOT / "src"
+STATE_PATH = ROOT / "data" / ".pipeline_state.json"
+
+MAX_PARALLEL_STAGES = 3
+
+
+@dataclass
+class Stage:
+    name: str
+    script: str                      # src/ 底下的檔名
+    inputs: list = field(default_factory=list)   # 相對 ROOT 的路徑
+    outputs: list = field(default_factory=list)
+    args: list = field(default_factory=list)
+    crawler: bool = False            # 會打 API 的 stage：資料來源在外面，沒辦法靠 hash 判斷
+
+    @property
+    def script_path(self):
+        return SRC / self.script
+
+    def input_paths(self):
+        # 程式本身也算輸入：改了計算邏輯就該重跑
+        return [self.script_path] + [ROOT / p for p in self.inputs]
+
+
+STAGES = [
+    Stage(
+        "games", "schedule_crawler.py",
+        outputs=["data/tpbl_crawler_raw.json", "data/schedule_raw.json"],
+        crawler=True,
+    ),
+    Stage(
+        "team_stats", "stats_crawler.py",
+        inputs=["data/tpbl_crawler_raw.json"],
+        outputs=[
+            "data/team_stats_raw.json",
+            "data/team_quarter_stats.json",
+            "data/player_game_logs.json",
+            "data/players_master_raw.json",
+        ],
+        args=["--incremental"],
+        crawler=True,
+    ),
+    Stage(
+        "team_advanced", "analyze_team_advanced.py",
+        inputs=["data/team_stats_raw.json"],
+        outputs=["data/team_advanced.json", "data/team_advanced_state.npz"],
+    ),
+    Stage(
+        "team_rolling", "team_rolling.py",
+        inputs=["data/team_stats_raw.json", "data/schedule_raw.json"],
+        outputs=["data/team_rolling.json"],
+    ),
+    Stage(
+        "player_stats", "player_stats_crawler.py",
+        inputs=["data/schedule_raw.json"],   # 分隊抓要先知道本季有哪些隊
+        outputs=["data/player_stats_raw.json"],
+        crawler=True,
+    ),
+    Stage(
+        "player_advanced", "player_advanced.py",
+        inputs=["data/player_stats_raw.json"],
+        outputs=["data/player_advanced.json", "data/player_percentiles.json"],
+    ),
+]
+
+
+# -------- hash / state --------
+
+def file_hash(path):
+    """檔案內容的 sha256；檔案不存在回傳 None。"""
+    if not path.exists():
+        return None
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def hash_files(paths):
+    return {str(p.relative_to(ROOT)): file_hash(p) for p in paths}
+
+
+def load_state():
+    if not STATE_PATH.exists():
+        return {}
+    with STATE_PATH.open("r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_state(state):
+    STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with STATE_PATH.open("w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2, sort_keys=True)
+
+
+def stale_reason(stage, state):
+    """回傳這個 stage 需要重跑的原因；不用重跑回傳 None。"""
+    prev = state.get(stage.name)
+    if prev is None:
+        return "沒有執行紀錄"
+
+    for p in stage.outputs:
+        if not (ROOT / p).exists():
+            return f"輸出 {p} 不存在"
+
+    current = hash_files(stage.input_paths())
+    for p, digest in current.items():
+        if prev.get("inputs", {}).get(p) != digest:
+            return f"輸入 {p} 有變動"
+
+    # 輸出被手動改過也重算，確保輸出跟輸入一致
+    for p, digest in hash_files([ROOT / p for p in stage.outputs]).items():
+        if prev.get("outputs", {}).get(p) != digest:
+            return f"輸出 {p} 跟上次不同"
+
+    return None
+
+
+# -------- DAG --------
+
+def build_dependencies(stages):
+    """依「誰的輸出是誰的輸入」推出相依關係：{stage_name: set(上游 stage_name)}"""
+    producer = {}
+    for st in stages:
+        for p in st.outputs:
+            producer[p] = st.name
+
+    deps = {}
+    for st in stages:
+        deps[st.name] = {producer[p] for p in st.inputs if p in producer and producer[p] != st.name}
+    return deps
+
+
+def run_stage(stage):
+    """用 subprocess 跑一個 stage（cwd = 專案根目錄），回傳 (returncode, 輸出文字, 秒數)。"""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, str(stage.script_path)] + stage.args,
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    output = result.stdout + (result.stderr or "")
+    return result.returncode, output, time.perf_counter() - start
+
+
+def run_pipeline(offline=False, force=False, dry_run=False, only=None):
+    stages = {st.name: st for st in STAGES}
+    deps = build_dependencies(STAGES)
+    state = load_state()
+
+    if only:
+        unknown = set(only) - set(stages)
+        if unknown:
+            print(f"不認識的 stage：{sorted(unknown)}，可用：{list(stages)}")
+            return False
+
+    pending = set(stages)
+    done = set()       # 成功或跳過
+    failed = set()
+    will_run = set()   # --dry-run 時判斷為「會執行」的 stage
+
+    def decide(st):
+        """回傳 (要不要跑, 原因)。"""
+        if only and st.name not in only:
+            return False, "不在 --only 指定範圍"
+        if force:
+            return True, "--force"
+        if st.crawler:
+            if offline:
+                return False, "--offline，不跑爬蟲"
+            return True, "爬蟲 stage 每次都跑"
+        # 上游跑過不代表輸入有變（爬蟲每次都跑，但資料常常一樣），一律看輸入檔的 hash
+        reason = stale_reason(st, state)
+        if reason:
+            return True, reason
+        if dry_run and deps[st.name] & will_run:
+            return False, "輸入目前沒變；上游跑完後輸入 hash 有變才會執行"
+        return False, "輸入沒變"
+
+    with ThreadPoolExecutor(max_workers=MAX_PARALLEL_STAGES) as pool:
+        running = {}  # future -> stage name
+
+        while pending or running:
+            # 把所有上游都完成的 stage 丟出去跑
+            for name in sorted(pending):
+                if deps[name] & failed:
+                    print(f"[{name}] 上游失敗，跳過")
+                    pending.discard(name)
+                    failed.add(name)
+                    continue
+                if not deps[name] <= done:
+                    continue
+
+                pending.discard(name)
+                st = stages[name]
+                should_run, reason = decide(st)
+                if not should_run or dry_run:
+                    mark = "會執行" if should_run else "跳過"
+                    print(f"[{name}] {mark}（{reason}）")
+                    done.add(name)
+                    if should_run:
+                        will_run.add(name)
+                    continue
+
+                print(f"[{name}] 開始執行 {st.script}（{reason}）")
+                running[pool.submit(run_stage, st)] = name
+
+            if not running:
+                if pending and not any(deps[n] <= done or deps[n] & failed for n in pending):
+                    print(f"DAG 有循環相依，無法執行：{sorted(pending)}")
+                    return False
+                continue
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                name = running.pop(fut)
+                st = stages[name]
+                code, output, seconds = fut.result()
+
+                # 平行跑的 stage 輸出整段印，避免交錯
+                for line in output.rstrip().splitlines():
+                    print(f"  [{name}] {line}")
+
+                if code != 0:
+                    print(f"[{name}] ❌ 失敗（exit {code}，{seconds:.1f}s）")
+                    failed.add(name)
+                    continue
+
+                print(f"[{name}] ✅ 完成（{seconds:.1f}s）")
+                done.add(name)
+                state[name] = {
+                    "inputs": hash_files(st.input_paths()),
+                    "outputs": hash_files([ROOT / p for p in st.outputs]),
+                    "finished_at": datetime.now().isoformat(timespec="seconds"),
+                }
+                save_state(state)
+
+    if failed:
+        print(f"\n有 stage 失敗：{sorted(failed)}")
+        return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TPBL 資料流程：依相依關係執行爬蟲與分析")
+    parser.add_argument("--offline", action="store_true", help="不跑爬蟲 stage")
+    parser.add_argument("--force", action="store_true", help="不管有沒有變動，全部重跑")
+    parser.add_argument("--dry-run", action="store_true", help="只列出會跑哪些 stage")
+    parser.add_argument("--only", nargs="+", metavar="STAGE",
+                        help=f"只跑指定的 stage（可用：{', '.join(st.name for st in STAGES)}）")
+    args = parser.parse_args()
+
+    ok = run_pipeline(
+        offline=args.offline, force=args.force, dry_run=args.dry_run, only=args.only
+    )
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
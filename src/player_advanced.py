@@ -1,199 +1,278 @@
 import json
 from pathlib import Path
 
+import numpy as np
+import pandas as pd
+
+import storage
+
 # 正確路徑統一寫這裡（raw → advanced 都放 data/）
 RAW_PATH = Path("data/player_stats_raw.json")   # 爬蟲輸出 raw 檔
 OUTPUT_PATH = Path("data/player_advanced.json")  # 本檔輸出進階數據
-
-
-def safe_div(n, d):
-    """安全除法：除以 0 或型態怪怪的就回傳 None。"""
+PERCENTILES_PATH = Path("data/player_percentiles.json")  # 各指標的聯盟百分位 / 排名
+
+# 計算只用到 player_stats 表的這些欄位（有 Parquet 時只讀這幾欄）
+INPUT_COLUMNS = [
+    "player_id", "player_name", "position", "team_id", "team_name", "game_count",
+    "avg_score", "avg_rebounds", "avg_assists", "avg_steals", "avg_blocks", "avg_turnovers",
+    "avg_field_goals_made", "avg_field_goals_attempted",
+    "avg_three_pointers_made", "avg_three_pointers_attempted",
+    "avg_free_throws_made", "avg_free_throws_attempted",
+    "avg_time_on_court", "avg_efficiency",
+    "acc_turnovers",
+    "pct_effective_field_goals_percentage", "pct_true_shooting_percentage",
+    "pct_turnovers_percentage",
+]
+
+
+# 場均 boxscore：輸出欄位 → player_stats 表的欄位（average_stats 的 key）
+AVG_COLUMNS = {
+    "pts": "avg_score",
+    "reb": "avg_rebounds",
+    "ast": "avg_assists",
+    "stl": "avg_steals",
+    "blk": "avg_blocks",
+    "tov": "avg_turnovers",
+    "fgm": "avg_field_goals_made",
+    "fga": "avg_field_goals_attempted",
+    "three_pm": "avg_three_pointers_made",
+    "three_pa": "avg_three_pointers_attempted",
+    "ftm": "avg_free_throws_made",
+    "fta": "avg_free_throws_attempted",
+}
+
+# 官方算好的百分比（字串，例如 "49.6"）：輸出欄位 → player_stats 表的欄位
+PCT_COLUMNS = {
+    "efg_official": "pct_effective_field_goals_percentage",
+    "ts_official": "pct_true_shooting_percentage",
+    "tov_pct_official": "pct_turnovers_percentage",
+}
+
+# 輸出欄位順序（跟 storage.SCHEMAS["player_advanced"] 一樣）
+OUTPUT_COLUMNS = [col for col, _ in storage.SCHEMAS["player_advanced"]]
+
+
+def safe_div(num, den):
+    """逐欄除法：分母是 0（或沒有值）的位置回傳 NaN（輸出時變成 None）。"""
+    num = np.asarray(num, dtype=np.float64)
+    den = np.asarray(den, dtype=np.float64)
+    out = np.full(np.broadcast(num, den).shape, np.nan)
+    np.divide(num, den, out=out, where=(den != 0) & ~np.isnan(den))
+    return out
+
+
+# 不轉成數字的欄位（id / 名字 / 場數維持 Python 原生值，有 None 也不會把整欄 int 變成 float）
+OBJECT_COLUMNS = ["player_id", "player_name", "position", "team_id", "team_name", "game_count"]
+
+# -------- 百分位 / 排名 --------
+
+# 要排名的指標：player_advanced 所有的數字欄位
+RANK_METRICS = [col for col, t in storage.SCHEMAS["player_advanced"] if t == "float"]
+
+# 越少越好的指標：排名 / 百分位反過來算（百分位一律是「贏過（或追平）池子裡多少 % 的人」）
+LOWER_IS_BETTER = {"tov", "tov_pct_official"}
+
+# 上場時間達標池：場均至少幾分鐘
+MIN_QUALIFIED_MPG = 10.0
+
+# API 的位置（player.meta.position）→ 比較用的位置組；雙位置算第一個位置
+POSITION_GROUPS = {
+    "PointGuard": "G",
+    "ShootingGuard": "G",
+    "PointGuardAndShootingGuard": "G",
+    "SmallForward": "F",
+    "SmallForwardAndPowerForward": "F",
+    "PowerForward": "F",
+    "Center": "C",
+}
+
+# 比較池：all = 全聯盟、position = 同位置組、qualified = 場均上場時間達標
+PERCENTILE_POOLS = ["all", "position", "qualified"]
+
+
+def load_players_frame():
+    """讀 player_stats 表計算用得到的欄位（有 Parquet 就只讀這幾欄），一位球員一列。"""
+    rows = storage.read_rows("player_stats", columns=INPUT_COLUMNS)
+    df = players_frame({c: [r.get(c) for r in rows] for c in INPUT_COLUMNS})
+    print(f"讀入 {len(df)} 筆球員 raw stats")
+    return df
+
+
+def _to_float(values):
+    """list → float64 array（None 變 NaN）；有字串之類的就逐個轉，轉不了的也是 NaN。"""
     try:
-        if d in (None, 0):
-            return None
-        return n / d
-    except Exception:
-        return None
-
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").to_numpy(dtype=np.float64)
 
-def load_raw_players():
-    with RAW_PATH.open("r", encoding="utf-8") as f:
-        data = json.load(f)
-    print(f"讀入 {len(data)} 筆球員 raw stats")
-    return data
 
-
-def compute_team_usage_totals(raw_players):
+def players_frame(columns):
     """
-    對每一隊，把隊上所有球員的「用球權相關數值」加總起來，
-    例如 FGA、FTA、TOV 等，之後算 usage ratio 會用到。
-    team_usage_totals[team_id] = {"fga": ..., "fta": ..., "tov": ...}
+    欄式的 player_stats 表 {欄位: list}（INPUT_COLUMNS）→ DataFrame，一位球員一列。
+    數據欄位整欄轉成 float64（None → NaN），百分比字串也在這裡轉成數字（例如 "49.6" → 49.6）。
     """
-    team_usage_totals = {}
+    return pd.DataFrame({
+        c: pd.Series(columns[c], dtype=object) if c in OBJECT_COLUMNS else _to_float(columns[c])
+        for c in INPUT_COLUMNS
+    })
 
-    for p in raw_players:
-        team = p.get("team")
 
-        # 有些球員可能沒有 team（team 為 None 或不是 dict），直接跳過
-        if not isinstance(team, dict):
-            continue
+def stat_column(df, col):
+    """數字欄位 → float64 array；沒有值（None）當 0 算。"""
+    values = df[col].to_numpy(dtype=np.float64)
+    return np.where(np.isnan(values), 0.0, values)
 
-        team_id = team.get("id")
-        if team_id is None:
-            continue
 
-        stats = p.get("accumulated_stats") or {}
+def pct_column(df, col):
+    """百分比（49.6）整欄轉成 0.496；沒有值或怪東西是 NaN（輸出時是 None）。"""
+    return df[col].to_numpy(dtype=np.float64) / 100.0
 
-        # ⚠ 這裡欄位名稱要依 raw JSON 實際 key 調整
-        fga = stats.get("fga", 0) or 0
-        fta = stats.get("fta", 0) or 0
-        tov = stats.get("turnovers", 0) or 0
 
-        if team_id not in team_usage_totals:
-            team_usage_totals[team_id] = {"fga": 0.0, "fta": 0.0, "tov": 0.0}
+def team_total_usage(df):
+    """
+    每位球員所屬球隊的「全隊使用回合」，沒有球隊的是 NaN。
+    用 team_id 分組一次（factorize），再用 np.bincount 依球員順序加總（跟一位一位相加結果完全一樣）。
 
-        team_usage_totals[team_id]["fga"] += float(fga)
-        team_usage_totals[team_id]["fta"] += float(fta)
-        team_usage_totals[team_id]["tov"] += float(tov)
+    ⚠ 全隊的 FGA / FTA 讀的是 accumulated_stats 的 "fga" / "fta"，API 實際上沒有這兩個 key
+      （是 field_goals_attempted …），所以一直是 0，全隊使用回合只有累計 TOV；維持一樣的結果。
+    """
+    codes, team_ids = pd.factorize(df["team_id"], sort=False)   # team_id 是 None → -1
+    has_team = codes >= 0
+    tov = stat_column(df, "acc_turnovers")
+    tov_sum = np.bincount(codes[has_team], weights=tov[has_team], minlength=len(team_ids))
 
-    return team_usage_totals
+    # 全隊使用回合 = FGA + 0.44 * FTA + TOV，前兩項是 0
+    usage = np.full(len(df), np.nan)
+    usage[has_team] = tov_sum[codes[has_team]]
+    return usage
 
 
-def pct_to_float(p):
-    """
-    把 "49.6" 這種百分比字串轉成 0.496
-    如果是 None 或怪東西就回傳 None
-    """
-    if p is None:
-        return None
-    try:
-        return float(p) / 100.0
-    except Exception:
-        return None
+def build_player_advanced_frame(df):
+    """players_frame() 的 DataFrame → 每位球員的進階數據（全部是整欄運算），欄位順序同 OUTPUT_COLUMNS。"""
+    out = pd.DataFrame({
+        # ===== 基本資訊 =====
+        "player_id": df["player_id"],
+        # 沒有名字（key 不存在、或 team 是 None）顯示 "N/A"
+        "player_name": df["player_name"].fillna("N/A"),
+        "team_id": df["team_id"],
+        "team_name": df["team_name"].fillna("N/A"),
+        "games": df["game_count"].fillna(0),
+        # time_on_court：這裡假設單位是「秒」，所以 /60 變成每場分鐘數
+        "min_pg": stat_column(df, "avg_time_on_court") / 60.0,
+    })
 
+    # ===== 場均數據（從 average_stats 抓）=====
+    for col, src in AVG_COLUMNS.items():
+        out[col] = stat_column(df, src)
+    # 官方給的效率值（場均）
+    out["eff_raw"] = stat_column(df, "avg_efficiency")
 
-def build_player_advanced(raw_players):
-    team_usage_totals = compute_team_usage_totals(raw_players)
-    result = []
+    # ===== 百分比（官方已算好，我們轉成 0.x）=====
+    for col, src in PCT_COLUMNS.items():
+        out[col] = pct_column(df, src)
 
-    for row in raw_players:
-        player = row.get("player") or {}
-        team = row.get("team") or {}
-        stats_avg = row.get("average_stats") or {}
-        stats_acc = row.get("accumulated_stats") or {}
-        pct = row.get("percentage_stats") or {}
+    # ===== 我們自算的其他進階數據 =====
+    pts, fga, fta, tov = out["pts"], out["fga"], out["fta"], out["tov"]
 
-        # ===== 基本資訊 =====
-        player_id = player.get("id")
-        player_name = player.get("name", "N/A")
+    # FTr（罰球率） = FTA / FGA
+    out["ft_rate"] = safe_div(fta, fga)
 
-        team_id = team.get("id")
-        team_name = team.get("name", "N/A")
+    # 3PAr（三分出手比例） = 3PA / FGA
+    out["three_par"] = safe_div(out["three_pa"], fga)
 
-        games = row.get("game_count", 0) or 0
+    # 個人使用回合（usage_base）
+    usage_base = fga + 0.44 * fta + tov
 
-        # ===== 場均數據（從 average_stats 抓）=====
-        # ⚠ 如果你的 key 實際不是這些（例如 "points" 而不是 "score"），這裡要自己改一下
-        pts = float(stats_avg.get("score", 0.0))
-        reb = float(stats_avg.get("rebounds", 0.0))
-        ast = float(stats_avg.get("assists", 0.0))
-        stl = float(stats_avg.get("steals", 0.0))
-        blk = float(stats_avg.get("blocks", 0.0))
-        tov = float(stats_avg.get("turnovers", 0.0))
+    # Usage share（個人用球權在全隊的比例）
+    out["usage_share"] = safe_div(usage_base, team_total_usage(df))
 
-        fgm = float(stats_avg.get("field_goals_made", 0.0))
-        fga = float(stats_avg.get("field_goals_attempted", 0.0))
+    # PPP（Points Per Possession，個人佔用回合的得分）
+    out["ppp"] = safe_div(pts, usage_base)
 
-        three_pm = float(stats_avg.get("three_pointers_made", 0.0))
-        three_pa = float(stats_avg.get("three_pointers_attempted", 0.0))
+    # 簡化版 PER / EFF：參考常見 EFF 算法
+    out["per_simple"] = (
+        pts + out["reb"] + out["ast"] + out["stl"] + out["blk"]
+        - (fga - out["fgm"])
+        - (fta - out["ftm"])
+        - tov
+    )
+    return out[OUTPUT_COLUMNS]
 
-        ftm = float(stats_avg.get("free_throws_made", 0.0))
-        fta = float(stats_avg.get("free_throws_attempted", 0.0))
 
-        # time_on_court：這裡假設單位是「秒」，所以 /60 變成每場分鐘數
-        time_on_court = float(stats_avg.get("time_on_court", 0.0))
-        min_per_game = time_on_court / 60.0
-
-        # 官方給的效率值（場均）
-        eff_raw = float(stats_avg.get("efficiency", 0.0))
-
-        # ===== 百分比（官方已算好，我們轉成 0.x）=====
-        efg = pct_to_float(pct.get("effective_field_goals_percentage"))
-        ts = pct_to_float(pct.get("true_shooting_percentage"))
-        tov_pct_official = pct_to_float(pct.get("turnovers_percentage"))
-
-        # ===== 我們自算的其他進階數據 =====
-
-        # FTr（罰球率） = FTA / FGA
-        ft_rate = safe_div(fta, fga)
-
-        # 3PAr（三分出手比例） = 3PA / FGA
-        three_par = safe_div(three_pa, fga)
-
-        # 個人使用回合（usage_base）
-        usage_base = fga + 0.44 * fta + tov
-
-        # 全隊使用回合（team_total_usage）＝隊上所有球員 FGA+0.44FTA+TOV 加總
-        team_totals = team_usage_totals.get(team_id) if team_id is not None else None
-        if isinstance(team_totals, dict):
-            team_total_usage = (
-                (team_totals.get("fga", 0) or 0)
-                + 0.44 * (team_totals.get("fta", 0) or 0)
-                + (team_totals.get("tov", 0) or 0)
-            )
-        else:
-            team_total_usage = None
-
-        # Usage share（個人用球權在全隊的比例）
-        usage_share = safe_div(usage_base, team_total_usage)
-
-        # PPP（Points Per Possession，個人佔用回合的得分）
-        ppp = safe_div(pts, usage_base)
-
-        # 簡化版 PER / EFF：參考常見 EFF 算法
-        per_simple = (
-            pts + reb + ast + stl + blk
-            - (fga - fgm)
-            - (fta - ftm)
-            - tov
-        )
+def pool_keys(advanced, positions):
+    """
+    每個比較池裡每位球員屬於哪一組（同一組的人互相比）；不在這個池子的球員是 None。
+    all 全部同一組、position 依位置組、qualified 只有場均上場時間達標的一組。
+    """
+    everyone = pd.Series("all", index=advanced.index, dtype=object)
+    return {
+        "all": everyone,
+        "position": positions.map(POSITION_GROUPS).astype(object).where(lambda s: s.notna(), None),
+        "qualified": everyone.where(advanced["min_pg"] >= MIN_QUALIFIED_MPG, None),
+    }
 
-        result.append(
-            {
-                "player_id": player_id,
-                "player_name": player_name,
-                "team_id": team_id,
-                "team_name": team_name,
-                "games": games,
-                "min_pg": min_per_game,
-                # 場均 boxscore
-                "pts": pts,
-                "reb": reb,
-                "ast": ast,
-                "stl": stl,
-                "blk": blk,
-                "tov": tov,
-                "fgm": fgm,
-                "fga": fga,
-                "three_pm": three_pm,
-                "three_pa": three_pa,
-                "ftm": ftm,
-                "fta": fta,
-                "eff_raw": eff_raw,
-                # 官方給的進階命中率
-                "efg_official": efg,
-                "ts_official": ts,
-                "tov_pct_official": tov_pct_official,
-                # 我們自己算的進階數據
-                "ft_rate": ft_rate,
-                "three_par": three_par,
-                "usage_share": usage_share,
-                "ppp": ppp,
-                "per_simple": per_simple,
-            }
-        )
 
-    return result
+def build_percentiles(advanced, positions):
+    """
+    build_player_advanced_frame 的結果 + 每位球員的位置（同順序）→ 百分位 / 排名表。
+    一位球員在一個比較池一列（不在池子裡就沒有那一列），每個指標兩欄：
+      {指標}_pct  ：池子裡數值比他差或一樣的人占幾 %（0~100，最好的是 100）
+      {指標}_rank ：池子裡第幾名（1 = 最好，同分同名次）
+    指標沒有值（None）的球員不參加那個指標的排名，百分位 / 名次也是 None。
+    分組排名一次整欄算完（groupby().rank），Dashboard 直接查表、不用每次排序。
+    """
+    base = pd.DataFrame({
+        "player_id": advanced["player_id"],
+        "player_name": advanced["player_name"],
+        "team_id": advanced["team_id"],
+        "team_name": advanced["team_name"],
+        "position": positions.astype(object).where(positions.notna(), None),
+        "position_group": positions.map(POSITION_GROUPS).astype(object).where(
+            lambda s: s.notna(), None),
+    })
+
+    frames = []
+    for pool, keys in pool_keys(advanced, positions).items():
+        in_pool = keys.notna()
+        keys = keys[in_pool]
+        out = base[in_pool].copy()
+        out["pool"] = pool
+        out["pool_size"] = keys.map(keys.value_counts()).astype(np.int64)
+
+        # 越少越好的指標先變號，全部變成「越大越好」，整張表一起排（每個池子只排兩次）
+        metrics = advanced.loc[in_pool, RANK_METRICS].astype(np.float64)
+        lower = [col for col in RANK_METRICS if col in LOWER_IS_BETTER]
+        metrics[lower] = -metrics[lower]
+        grouped = metrics.groupby(keys, sort=False)
+        pct = grouped.rank(method="max", pct=True) * 100
+        rank = grouped.rank(method="min", ascending=False).astype("Int64")
+        for col in RANK_METRICS:
+            out[f"{col}_pct"] = pct[col]
+            out[f"{col}_rank"] = rank[col]
+        frames.append(out)
+
+    columns = [col for col, _ in storage.SCHEMAS["player_percentiles"]]
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(frames, ignore_index=True)[columns]
+
+
+def to_records(frame):
+    """DataFrame → list[dict]，NaN / NA 變 None、數字都是 Python 原生型別（json.dump 用）。"""
+    names = list(frame.columns)
+    columns = []
+    for c in names:
+        values = frame[c].tolist()
+        if frame[c].dtype.kind != "O" and frame[c].isna().any():
+            values = [None if v is pd.NA or v != v else v for v in values]   # NaN != NaN
+        columns.append(values)
+    return [dict(zip(names, row)) for row in zip(*columns)]
+
+
+def build_player_advanced(raw_players):
+    """player_stats_raw.json 的巢狀資料 → 每位球員一個 dict 的進階數據。"""
+    df = players_frame(storage.player_stats_columns(raw_players, INPUT_COLUMNS))
+    return to_records(build_player_advanced_frame(df))
 
 
 def fmt(v, d=3):
@@ -212,13 +291,12 @@ def main():
         print(f"❌ 找不到 {RAW_PATH}，請先跑 player_stats_crawler.py 抓球員資料！")
         return
 
-    # 讀入 raw stats
-    with RAW_PATH.open("r", encoding="utf-8") as f:
-        raw_players = json.load(f)
-    print(f"讀入 {len(raw_players)} 筆球員 raw stats")
+    # 讀入 raw stats（攤平成一位球員一列）
+    players = load_players_frame()
 
     # 算進階數據
-    advanced = build_player_advanced(raw_players)
+    frame = build_player_advanced_frame(players)
+    advanced = to_records(frame)
 
     # 用官方 TS 排序（高→低）
     advanced.sort(
@@ -229,8 +307,16 @@ def main():
     OUTPUT_PATH.parent.mkdir(parents=True, exist_ok=True)
     with OUTPUT_PATH.open("w", encoding="utf-8") as f:
         json.dump(advanced, f, ensure_ascii=False, indent=2)
+    storage.write_table("player_advanced", advanced)
+
+    # 各指標的百分位 / 排名（全聯盟、同位置、上場時間達標）
+    percentiles = to_records(build_percentiles(frame, players["position"]))
+    with PERCENTILES_PATH.open("w", encoding="utf-8") as f:
+        json.dump(percentiles, f, ensure_ascii=False, indent=2)
+    storage.write_table("player_percentiles", percentiles)
 
-    print(f"已將球員進階數據寫入 {OUTPUT_PATH}\n")
+    print(f"已將球員進階數據寫入 {OUTPUT_PATH}")
+    print(f"已將百分位 / 排名寫入 {PERCENTILES_PATH}（{len(percentiles)} 筆）\n")
     print("全部球員（依 TS% 排序）：")
     for p in advanced:
         print(
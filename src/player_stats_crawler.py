@@ -1,27 +1,151 @@
-import requests
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 import json
+import os
 from pathlib import Path
 
-API_URL = "https://api.tpbl.basketball/api/games/stats/players?division_id=9"
+import http_client
+import player_advanced
+import schedule_crawler
+import storage
+import telemetry
+import warehouse
+
+API_URL = http_client.API_BASE + "/games/stats/players"
+DIVISION_ID = 9
 OUTPUT = Path("data/player_stats_raw.json")
 
-def fetch_player_stats():
-    headers = {
-        "User-Agent": "Mozilla/5.0"
-    }
+# 同時抓幾隊（聯盟 7 隊，一輪就抓完）
+MAX_WORKERS = 8
+
+# --fields 的選項：player_stats 表要留哪些欄位（None = 全部保留）
+FIELD_SETS = {
+    "all": None,
+    "advanced": player_advanced.INPUT_COLUMNS,
+}
+
+
+def season_team_ids(season_id=schedule_crawler.CURRENT_SEASON_ID):
+    """本季賽程裡出現過的球隊（只讀賽程表的三個欄位）；沒有賽程資料回傳空 list。"""
+    rows = storage.read_rows("schedule_raw", columns=["season_id", "home_team_id", "away_team_id"])
+    team_ids = set()
+    for r in rows:
+        if r.get("season_id") == season_id:
+            team_ids.update(t for t in (r.get("home_team_id"), r.get("away_team_id")) if t is not None)
+    return sorted(team_ids)
+
+
+def fetch_partition(team_id=None):
+    """抓一隊的球員場均；team_id 是 None 就是整個 division 一次抓。"""
+    params = {"division_id": DIVISION_ID}
+    if team_id is not None:
+        params["team_id"] = team_id
+    return http_client.get_json(API_URL, params=params)
+
+
+def _team_id(p):
+    return (p.get("team") or {}).get("id")
+
+
+def _dump_item(obj):
+    """一個元素的 JSON 文字，格式跟 json.dump(list, indent=2) 裡的元素一模一樣。"""
+    return "  " + json.dumps(obj, ensure_ascii=False, indent=2).replace("\n", "\n  ")
 
-    print("向 TPBL API 抓取球員場均 Stats 中...")
-    r = requests.get(API_URL, headers=headers, timeout=10)
-    r.raise_for_status()
 
-    data = r.json()
-    print(f"共抓取 {len(data)} 位球員的場均資料")
+def _stream_partitions(partitions, workers, fields, out_path):
+    """
+    平行抓 partitions（球隊 id；None = 整個 division），依順序一隊一隊寫進 out_path，
+    記憶體裡只留還沒輪到寫的那幾隊。回傳攤平後的 rows（給 Parquet / SQLite）。
+    API 沒有照 team_id 篩選時（第一隊的回應就包含了每一個要抓的隊伍），直接用那一份、不再抓其他隊；
+    只混了幾位別隊的球員（交易、team 是 None）不算，照樣一隊一隊用。
+    """
+    flat_rows = []   # 攤平後的 rows 很小，留著給 Parquet / SQLite
+    with out_path.open("w", encoding="utf-8") as out, \
+            ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [pool.submit(fetch_partition, t) for t in partitions]
+        out.write("[")
+        first = True
+        for i, (team_id, future) in enumerate(zip(partitions, futures)):
+            players = future.result()
+
+            # 第一隊就看得出 API 有沒有認 team_id：每一隊的球員都在裡面才是整個 division
+            if i == 0 and team_id is not None and {_team_id(p) for p in players} >= set(partitions):
+                print("⚠ API 沒有依 team_id 篩選，改用這次拿到的整個 division 名單")
+                for f in futures:
+                    f.cancel()
+                team_id = None
+
+            if fields is not None:
+                players = storage.project_player_stats(players, fields)
+            flat_rows.extend(storage.flatten_player_stats(players))
+            for p in players:
+                out.write("\n" if first else ",\n")
+                out.write(_dump_item(p))
+                first = False
+
+            if team_id is None:
+                break
+            print(f"  team {team_id}：{len(players)} 位球員")
+        out.write("]" if first else "\n]")
+    return flat_rows
+
+
+def fetch_player_stats(workers=MAX_WORKERS, fields=None, partitioned=True):
+    """
+    抓球員場均，寫 data/player_stats_raw.json（+ Parquet、SQLite）。
+
+    partitioned：True 時依本季的球隊分成多個 request 平行抓（?team_id=），
+                 依球隊順序一隊一隊寫進輸出檔，記憶體裡只留還沒輪到寫的那幾隊。
+                 下面幾種情況退回整個 division 一個 request：
+                   - 找不到賽程資料（不知道有哪些隊）
+                   - API 沒有照 team_id 篩選（第一隊的回應就有每一隊的球員）：直接用那一份
+                   - 每一隊都抓回空的（API 不認得 team_id、回 []）：整個重抓一次
+    fields：只保留 player_stats 表這些欄位對應的 key（例如 player_advanced.INPUT_COLUMNS），
+            None 就全部保留。
+
+    分隊抓的好處是記憶體：整個 division 一次抓時整份 response 要先全部留在記憶體裡才能寫檔
+    （replay_server 量的 tracemalloc 高峰：一次抓 6~8 MB、分隊 3.1 MB，球員 / 欄位越多差越多）；
+    速度跟一次抓差不多（20±10 ms 延遲：分隊 0.34~0.37 秒、一次抓 0.34~0.42 秒），
+    多出來的 request 由平行抓抵銷，不是為了比較快。
+    """
+    team_ids = season_team_ids() if partitioned else []
+    if team_ids:
+        print(f"向 TPBL API 抓取球員場均 Stats 中（{len(team_ids)} 隊，同時 {workers} 個 request）...")
+    else:
+        print("向 TPBL API 抓取球員場均 Stats 中...")
 
     OUTPUT.parent.mkdir(exist_ok=True)
-    with OUTPUT.open("w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    tmp = OUTPUT.with_name(OUTPUT.name + ".tmp")
+    flat_rows = _stream_partitions(team_ids or [None], workers, fields, tmp)
+    if team_ids and not flat_rows:
+        print("⚠ 每一隊都抓回 0 位球員（API 可能不認得 team_id），改成整個 division 一次抓")
+        flat_rows = _stream_partitions([None], workers, fields, tmp)
+    os.replace(tmp, OUTPUT)
+    print(f"共抓取 {len(flat_rows)} 位球員的場均資料")
+
+    # Parquet 存攤平後的 player_stats 表（player_advanced / Dashboard 只讀需要的欄位）
+    storage.write_table("player_stats", flat_rows)
+    warehouse.upsert_player_season_rows(flat_rows, season_id=schedule_crawler.CURRENT_SEASON_ID)
+    telemetry.record_rows("player_stats_raw", len(flat_rows))
 
     print(f"已寫入 {OUTPUT}")
+    http_client.print_stats()
 
 if __name__ == "__main__":
-    fetch_player_stats()
+    parser = argparse.ArgumentParser(description="抓 TPBL 球員場均 stats")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="不使用 data/.http_cache，全部重新向 API 抓")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS,
+                        help=f"同時抓幾隊（預設 {MAX_WORKERS}）")
+    parser.add_argument("--single", action="store_true",
+                        help="不分隊，整個 division 一個 request 抓完")
+    parser.add_argument("--fields", choices=sorted(FIELD_SETS), default="all",
+                        help="advanced：只留 player_advanced.py 用得到的欄位（檔案小很多，"
+                             "但 SQLite / Parquet 的其他欄位會是空的）")
+    args = parser.parse_args()
+    if args.no_cache:  # 沒加就照環境變數 TPBL_NO_CACHE
+        http_client.set_cache_enabled(False)
+
+    with telemetry.crawl_run("player_stats_crawler"):
+        fetch_player_stats(workers=args.workers, fields=FIELD_SETS[args.fields],
+                           partitioned=not args.single)
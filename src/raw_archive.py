@@ -0,0 +1,115 @@
+# raw_archive.py
+# 功能：把每一場 /games/{id}/stats 的原始 JSON 壓縮存檔（content-addressed）
+# 1. 每個 response 依內容算 sha256，存成 data/raw_archive/blobs/<sha256>.json.gz
+#    （有安裝 zstandard 的話改用 .json.zst，壓縮率更好）
+# 2. data/raw_archive/index.json 記錄 game_id -> blob，之後可以完全離線重新解析
+
+from datetime import datetime
+import gzip
+import hashlib
+import json
+import os
+from pathlib import Path
+import threading
+
+try:
+    import zstandard
+except ImportError:  # 沒裝就用 gzip
+    zstandard = None
+
+
+ARCHIVE_DIR = Path("data/raw_archive")
+
+
+def _encode(data):
+    """固定格式序列化，內容一樣 → bytes 一樣 → hash 一樣。"""
+    text = json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return text.encode("utf-8")
+
+
+def _compress(raw):
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=10).compress(raw)
+    return "gzip", gzip.compress(raw, compresslevel=9, mtime=0)
+
+
+def _decompress(codec, blob):
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("這個 blob 是 zstd 壓縮的，請先 pip install zstandard")
+        return zstandard.ZstdDecompressor().decompress(blob)
+    return gzip.decompress(blob)
+
+
+class RawArchive:
+    """
+    content-addressed 的原始 response 存檔。
+
+    put() 可以在多個 thread 同時呼叫；index 只在記憶體更新，
+    最後記得呼叫 save() 寫回 index.json。
+    """
+
+    SUFFIX = {"gzip": ".json.gz", "zstd": ".json.zst"}
+
+    def __init__(self, root=ARCHIVE_DIR):
+        self.root = Path(root)
+        self.blob_dir = self.root / "blobs"
+        self.index_path = self.root / "index.json"
+        self._lock = threading.Lock()
+
+        if self.index_path.exists():
+            with self.index_path.open("r", encoding="utf-8") as f:
+                self.index = json.load(f)
+        else:
+            self.index = {}
+
+    def _blob_path(self, digest, codec):
+        return self.blob_dir / f"{digest}{self.SUFFIX[codec]}"
+
+    def put(self, game_id, url, data):
+        """存一場比賽的原始 JSON，回傳內容的 sha256。相同內容不會重複寫檔。"""
+        raw = _encode(data)
+        digest = hashlib.sha256(raw).hexdigest()
+
+        old = self.index.get(str(game_id))
+        if old and old["sha256"] == digest:
+            return digest
+
+        codec, blob = _compress(raw)
+        path = self._blob_path(digest, codec)
+        if not path.exists():
+            self.blob_dir.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+            tmp.write_bytes(blob)
+            os.replace(tmp, path)
+
+        with self._lock:
+            self.index[str(game_id)] = {
+                "sha256": digest,
+                "codec": codec,
+                "url": url,
+                "fetched_at": datetime.now().isoformat(timespec="seconds"),
+                "bytes": len(raw),
+            }
+        return digest
+
+    def get(self, game_id):
+        """讀回某場比賽的原始 JSON，沒有存檔就回傳 None。"""
+        entry = self.index.get(str(game_id))
+        if entry is None:
+            return None
+        blob = self._blob_path(entry["sha256"], entry["codec"]).read_bytes()
+        return json.loads(_decompress(entry["codec"], blob).decode("utf-8"))
+
+    def game_ids(self):
+        """已存檔的 game_id（int，依數字排序）。"""
+        return sorted(int(k) for k in self.index)
+
+    def save(self):
+        """把 index 寫回 index.json（先寫暫存檔再 rename，避免寫到一半壞掉）。"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self.index_path.with_suffix(".tmp")
+        with self._lock:
+            with tmp.open("w", encoding="utf-8") as f:
+                json.dump(self.index, f, ensure_ascii=False, indent=2, sort_keys=True)
+        os.replace(tmp, self.index_path)
@@ -0,0 +1,314 @@
+# replay_server.py
+# 功能：本機的假 TPBL API，用錄下來的資料回應爬蟲，方便離線測試與量測爬蟲吞吐量
+#
+# 支援的路徑（跟官方 API 一樣放在 /api 底下）：
+#   /api/seasons
+#   /api/seasons/{id}/games
+#   /api/games/{id}/stats
+#   /api/divisions/{id}/players
+#   /api/games/stats/players        （認得 ?team_id=，只回傳那一隊的球員）
+#
+# 資料來源（依序找，找到就用）：
+#   1. --fixtures 目錄：路徑對應的 JSON 檔，例如 fixtures/games/1496/stats.json
+#   2. data/raw_archive：stats_crawler 存下來的 /games/{id}/stats 原始 JSON
+#   3. data/ 底下已經整理好的檔案，反推回 API 的原始格式
+#      （賽程 / 比分 / 隊伍全場數據 / 球員清單 / 球員場均）
+#
+# 可以模擬慢速與不穩定的伺服器：
+#   --latency-ms / --jitter-ms   每個 request 的延遲
+#   --error-rate                 回 500 的機率
+#   --rate-429                   回 429（附 Retry-After）的機率
+# 回應會帶 ETag（支援 If-None-Match → 304），client 有送 Accept-Encoding: gzip 就壓縮。
+#
+# 用法：
+#   python src/replay_server.py --port 8765 --latency-ms 50 --error-rate 0.05
+#   TPBL_API_BASE=http://127.0.0.1:8765/api python src/stats_crawler.py --no-cache
+
+import argparse
+import gzip
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+from pathlib import Path
+import random
+import re
+import threading
+import time
+from urllib.parse import parse_qsl, urlsplit
+
+from raw_archive import RawArchive
+import stats_crawler
+
+
+DATA_DIR = Path("data")
+DEFAULT_PORT = 8765
+RETRY_AFTER_SECONDS = 1
+
+
+def _load(path):
+    if not path.exists():
+        return None
+    with path.open("r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class FixtureStore:
+    """
+    把 API 路徑對應到要回傳的 JSON。
+
+    data/ 的檔案只在第一次用到時讀一次；同一個 store 可以給多個 thread 共用。
+    """
+
+    ROUTES = [
+        (re.compile(r"^/seasons$"), "seasons"),
+        (re.compile(r"^/seasons/(\d+)/games$"), "season_games"),
+        (re.compile(r"^/games/(\d+)/stats$"), "game_stats"),
+        (re.compile(r"^/divisions/(\d+)/players$"), "division_players"),
+        (re.compile(r"^/games/stats/players$"), "player_stats"),
+    ]
+
+    def __init__(self, data_dir=DATA_DIR, fixtures_dir=None):
+        self.data_dir = Path(data_dir)
+        self.fixtures_dir = Path(fixtures_dir) if fixtures_dir else None
+        self.archive = RawArchive(self.data_dir / "raw_archive")
+        self._lock = threading.Lock()
+        self._cache = {}
+
+    def _data(self, name):
+        """讀 data/{name}.json（只讀一次）。"""
+        with self._lock:
+            if name not in self._cache:
+                self._cache[name] = _load(self.data_dir / f"{name}.json")
+            return self._cache[name]
+
+    def _fixture(self, path):
+        if self.fixtures_dir is None:
+            return None
+        return _load(self.fixtures_dir / f"{path.strip('/')}.json")
+
+    def lookup(self, path, query=None):
+        """回傳 API 路徑（不含 /api 前綴）對應的 JSON；不認識的路徑回傳 None。"""
+        data = self._fixture(path)
+        if data is None:
+            for pattern, name in self.ROUTES:
+                m = pattern.match(path)
+                if m:
+                    data = getattr(self, name)(*(int(x) for x in m.groups()))
+                    break
+        return self._filter(path, data, query or {})
+
+    def _filter(self, path, data, query):
+        """query 參數：目前只有球員場均的 team_id 會影響內容（其他像 division_id 都忽略）。"""
+        if path == "/games/stats/players" and "team_id" in query and isinstance(data, list):
+            team_id = int(query["team_id"])
+            return [p for p in data if (p.get("team") or {}).get("id") == team_id]
+        return data
+
+    # -------- 各路徑：從 data/ 反推官方格式 --------
+
+    def _games(self):
+        """賽程（schedule_raw）+ 比分（tpbl_crawler_raw），依 game_id 合併。"""
+        schedule = self._data("schedule_raw") or []
+        scores = {g["id"]: g for g in self._data("tpbl_crawler_raw") or []}
+        games = [dict(scores.get(g["game_id"], {}), **g) for g in schedule]
+
+        # 只有比分、沒在賽程檔裡的比賽也要有
+        known = {g["game_id"] for g in schedule}
+        for gid, g in scores.items():
+            if gid not in known:
+                games.append(dict(g, game_id=gid))
+        return games
+
+    def seasons(self):
+        season_ids = sorted({g.get("season_id") or 2 for g in self._games()})
+        return [{"id": sid} for sid in season_ids]
+
+    def season_games(self, season_id):
+        result = []
+        for g in self._games():
+            if (g.get("season_id") or 2) != season_id:
+                continue
+
+            def team(side):
+                return {
+                    "id": g.get(f"{side}_team_id"),
+                    "name": g.get(f"{side}_team_name"),
+                    # tpbl_crawler 取 won / lost 較大的那個當比分，這裡只填 won 就好
+                    "won_score": g.get(f"{side}_score"),
+                    "lost_score": None,
+                    "meta": {
+                        "logo": g.get(f"{side}_team_logo"),
+                        "alt_name": g.get(f"{side}_team_alt_name"),
+                    },
+                }
+
+            time_str = g.get("time")
+            if isinstance(time_str, str) and len(time_str) == 5:
+                time_str += ":00"
+
+            result.append({
+                "id": g["game_id"],
+                "division_id": g.get("division_id"),
+                "code": g.get("code"),
+                "game_date": g.get("date"),
+                "game_time": time_str,
+                "gamed_at": g.get("datetime"),
+                "game_day_of_week": g.get("day_of_week"),
+                "venue": g.get("venue"),
+                "status": g.get("status"),
+                "is_live": g.get("is_live"),
+                "round": g.get("round"),
+                "home_team": team("home"),
+                "away_team": team("away"),
+                "meta": {
+                    "recap": g.get("recap_url"),
+                    "live_stream_url": g.get("live_stream_url"),
+                    "judgement_report": g.get("judgement_report_url"),
+                },
+            })
+        return result
+
+    def game_stats(self, game_id):
+        if str(game_id) in self.archive.index:
+            return self.archive.get(game_id)
+
+        # 沒有存檔：用 team_stats_raw 的全場數據組一個只有「第 4 節累積」的 rounds
+        rows = [r for r in self._data("team_stats_raw") or [] if r["game_id"] == game_id]
+        if not rows:
+            return {}
+
+        result = {}
+        for r in rows:
+            period = {
+                "total_won_score": r.get("points_for"),
+                "total_lost_score": r.get("points_against"),
+            }
+            for out_key, api_key in stats_crawler.BOX_FIELDS:
+                period[api_key] = r.get(out_key)
+            result[f"{r['team_side']}_team"] = {
+                "id": r.get("team_id"),
+                "name": r.get("team_name"),
+                "teams": {"rounds": {str(stats_crawler.REGULATION_PERIODS): period}},
+            }
+        return result
+
+    def division_players(self, division_id):
+        return self._data("players_master_raw") or []
+
+    def player_stats(self):
+        return self._data("player_stats_raw") or []
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive，跟真的 API 一樣可以重用連線
+    disable_nagle_algorithm = True  # header 跟 body 分開寫，不關 Nagle 每個 request 會多卡 ~40ms
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status, body=b"", headers=None):
+        self.send_response(status)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body and self.command != "HEAD":
+            self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        if server.latency or server.jitter:
+            time.sleep(max(0.0, server.latency + random.uniform(-server.jitter, server.jitter)))
+
+        roll = random.random()
+        if roll < server.rate_429:
+            self._send(429, b"Too Many Requests", {"Retry-After": str(RETRY_AFTER_SECONDS)})
+            return
+        if roll < server.rate_429 + server.error_rate:
+            self._send(500, b"Internal Server Error")
+            return
+
+        url = urlsplit(self.path)
+        path = url.path
+        if not path.startswith("/api/"):
+            self._send(404, b"Not Found")
+            return
+
+        data = server.store.lookup(path[len("/api"):], dict(parse_qsl(url.query)))
+        if data is None:
+            self._send(404, b"Not Found")
+            return
+
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self._send(304, headers={"ETag": etag})
+            return
+
+        headers = {"Content-Type": "application/json; charset=utf-8", "ETag": etag}
+        if "gzip" in (self.headers.get("Accept-Encoding") or ""):
+            body = gzip.compress(body, compresslevel=5)
+            headers["Content-Encoding"] = "gzip"
+        self._send(200, body, headers)
+
+    do_HEAD = do_GET
+
+
+def make_server(host="127.0.0.1", port=DEFAULT_PORT, data_dir=DATA_DIR, fixtures_dir=None,
+                latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, rate_429=0.0, verbose=False):
+    """
+    建立 server（還沒開始服務）。port=0 會自動挑一個空的 port，
+    實際位址看 server.server_address。
+    """
+    server = ThreadingHTTPServer((host, port), ReplayHandler)
+    server.daemon_threads = True
+    server.store = FixtureStore(data_dir, fixtures_dir)
+    server.latency = latency_ms / 1000
+    server.jitter = jitter_ms / 1000
+    server.error_rate = error_rate
+    server.rate_429 = rate_429
+    server.verbose = verbose
+    return server
+
+
+def start_in_thread(**kwargs):
+    """在背景 thread 啟動 server，回傳 (server, API base URL)。用完呼叫 server.shutdown()。"""
+    server = make_server(**kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}/api"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="用錄下來的資料模擬 TPBL API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--data-dir", default=str(DATA_DIR), help="data/ 目錄位置")
+    parser.add_argument("--fixtures", default=None,
+                        help="額外的 fixture 目錄（路徑對應 JSON 檔，優先使用）")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="每個 request 的延遲（毫秒）")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="延遲的隨機抖動（±毫秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="回 500 的機率（0~1）")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="回 429 的機率（0~1）")
+    parser.add_argument("--verbose", action="store_true", help="印出每個 request")
+    args = parser.parse_args()
+
+    server = make_server(
+        host=args.host, port=args.port, data_dir=args.data_dir, fixtures_dir=args.fixtures,
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate, rate_429=args.rate_429, verbose=args.verbose,
+    )
+    host, port = server.server_address[:2]
+    print(f"replay server 在 http://{host}:{port}/api 等待 request（Ctrl+C 結束）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n停止 replay server。")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,38 @@
 # tpbl_crawler_schedule.py
-# 功能：呼叫 TPBL 官方 API，把某幾季的全部賽程抓下來，
-#       轉成自己統一的格式，存成 data/games.json
+# 功能：呼叫 TPBL 官方 API，把所有賽季的全部賽程抓下來，
+#       轉成自己統一的格式（賽程資訊 + 比分，同一張表）：
+#       - 每一季各存一個 data/schedule/season_{id}.json（內容沒變就不重寫）
+#       - data/schedule/index.json 記錄每季的檔案、場數與內容 hash
+#       - 全部合併成 data/schedule_raw.json（Dashboard 讀這個）
+#       - 目前賽季另外輸出成 data/tpbl_crawler_raw.json（stats_crawler 讀這個）
+#       每季只打一次 API，兩個檔都由同一份正規化結果產生。
 
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import hashlib
 import json
-import time
 from pathlib import Path
 
-import requests
+import http_client
+import storage
+import telemetry
+import warehouse
 
 OUTPUT_PATH = Path("data/schedule_raw.json")
+GAMES_PATH = Path("data/tpbl_crawler_raw.json")
+SEASON_DIR = Path("data/schedule")
+INDEX_PATH = SEASON_DIR / "index.json"
 
-BASE_URL = "https://api.tpbl.basketball/api/seasons/{season_id}/games"
+BASE_URL = http_client.API_BASE + "/seasons/{season_id}/games"
+SEASONS_URL = http_client.API_BASE + "/seasons"
 
-HEADERS = {
-    "User-Agent": "ntu-im-tpbl-project/1.0 (course project)"
-}
+# 目前賽季：tpbl_crawler_raw.json / stats_crawler 只看這一季
+CURRENT_SEASON_ID = 2
+# 賽季清單 API 失敗時的備案
+DEFAULT_SEASON_IDS = [CURRENT_SEASON_ID]
+# 同時抓幾季
+MAX_PARALLEL_SEASONS = 4
 
 
 def fetch_games_for_season(season_id: int):
@@ -24,10 +42,7 @@ def fetch_games_for_season(season_id: int):
     會回傳 list[dict]，每個 dict 就是你剛剛貼的那種 game 物件。
     """
     url = BASE_URL.format(season_id=season_id)
-    resp = requests.get(url, headers=HEADERS, timeout=10)
-    resp.raise_for_status()
-
-    data = resp.json()
+    data = http_client.get_json(url)
 
     # 有些 API 會包成 {"data": [...]}，保險處理一下
     if isinstance(data, dict) and "data" in data:
@@ -35,12 +50,50 @@ def fetch_games_for_season(season_id: int):
     return data
 
 
+def discover_seasons():
+    """
+    問 /api/seasons 有哪些賽季，回傳排序後的 season_id list。
+    API 失敗或格式看不懂時，退回 DEFAULT_SEASON_IDS。
+    """
+    try:
+        data = http_client.get_json(SEASONS_URL)
+    except Exception as e:
+        print(f"⚠ 取得賽季清單失敗（{e}），改用預設賽季 {DEFAULT_SEASON_IDS}")
+        return list(DEFAULT_SEASON_IDS)
+
+    if isinstance(data, dict) and "data" in data:
+        data = data["data"]
+
+    season_ids = []
+    if isinstance(data, list):
+        for s in data:
+            if isinstance(s, dict) and isinstance(s.get("id"), int):
+                season_ids.append(s["id"])
+
+    if not season_ids:
+        print(f"⚠ 賽季清單是空的，改用預設賽季 {DEFAULT_SEASON_IDS}")
+        return list(DEFAULT_SEASON_IDS)
+    return sorted(set(season_ids))
+
+
+def pick_score(won, lost):
+    """
+    單場比分：官方 game JSON 的 team.won_score / team.lost_score 其中一個是這隊的得分，
+    取較大的那個；都沒有（未開打）就是 None。
+    """
+    if won is None and lost is None:
+        return None
+    # 有些 API 在比分未出來時可能傳 0 或 null
+    if won is None:
+        return lost
+    if lost is None:
+        return won
+    return max(won, lost)
+
+
 def normalize_game(raw_game: dict, season_id: int) -> dict:
     """
-    把官方 game JSON 轉成我們專案統一使用的欄位。
-    注意：目前這個 JSON 片段沒有看到單場比分欄位，
-    只有 team.won_score / team.lost_score，這看起來比較像球隊累積戰績，
-    所以暫時不填 home_score / away_score。
+    把官方 game JSON 轉成我們專案統一使用的欄位（賽程資訊 + 比分）。
     """
 
     home = raw_game.get("home_team") or {}
@@ -73,12 +126,14 @@ def normalize_game(raw_game: dict, season_id: int) -> dict:
         "home_team_name": home.get("name"),
         "home_team_logo": home_meta.get("logo"),
         "home_team_alt_name": home_meta.get("alt_name"),
+        "home_score": pick_score(home.get("won_score"), home.get("lost_score")),
 
         # 客隊資訊
         "away_team_id": away.get("id"),
         "away_team_name": away.get("name"),
         "away_team_logo": away_meta.get("logo"),
         "away_team_alt_name": away_meta.get("alt_name"),
+        "away_score": pick_score(away.get("won_score"), away.get("lost_score")),
 
         # 進階連結
         "recap_url": meta.get("recap"),
@@ -87,40 +142,203 @@ def normalize_game(raw_game: dict, season_id: int) -> dict:
     }
 
 
-def crawl_all_games():
+def to_game_rows(games):
     """
-    抓多個 season_id 的賽程，合併寫入一個 games.json
-    season_id 你可以之後自己再加。
-    目前先只抓你找到的 season 2。
+    統一賽程表 → tpbl_crawler_raw.json 的格式（stats_crawler / live_poller 用的比賽清單）。
+    time 用 "HH:MM:SS"（從 datetime 取），依日期、時間排序。
     """
-    season_ids = [2]  # 之後如果有 1, 3, 4... 就自己加進來
+    rows = []
+    for g in games:
+        dt = g.get("datetime")
+        rows.append({
+            "id": g["game_id"],
+            "code": g.get("code"),
+            "date": g.get("date"),
+            "time": dt[11:] if isinstance(dt, str) and len(dt) > 11 else None,
+            "datetime": dt,
+            "venue": g.get("venue"),
+            "status": g.get("status"),  # COMPLETED / UPCOMING
+            "is_live": g.get("is_live"),
+            "division_id": g.get("division_id"),
 
-    all_games = []
+            "home_team_id": g.get("home_team_id"),
+            "home_team_name": g.get("home_team_name"),
+            "home_score": g.get("home_score"),
+
+            "away_team_id": g.get("away_team_id"),
+            "away_team_name": g.get("away_team_name"),
+            "away_score": g.get("away_score"),
+        })
+
+    rows.sort(key=lambda x: (x["date"] or "", x["time"] or ""))
+    return rows
+
+
+def sort_key(g):
+    """依日期 & 時間排序，沒時間的排後面"""
+    return (g.get("date") or "", g.get("time") or "99:99")
+
+
+def season_path(season_id):
+    return SEASON_DIR / f"season_{season_id}.json"
+
+
+def load_index():
+    if not INDEX_PATH.exists():
+        return {}
+    with INDEX_PATH.open("r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_season_file(season_id):
+    path = season_path(season_id)
+    if not path.exists():
+        return None
+    with path.open("r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def is_season_finished(games):
+    """整季每場都已完成 → 這季的賽程不會再變，不用再打 API。"""
+    return bool(games) and all(g.get("status") == "COMPLETED" for g in games)
+
+
+def crawl_season(season_id):
+    """抓單一賽季並正規化，回傳排序後的 list[dict]。"""
+    print(f"抓取 season {season_id} 的賽程中...")
+    raw_games = fetch_games_for_season(season_id)
+    print(f"season {season_id} 共 {len(raw_games)} 場")
+
+    # 逐場正規化就好：整季一次轉成 DataFrame / pyarrow 欄位再攤平，光是把每個 dict 轉進去就比這個迴圈慢
+    games = [normalize_game(g, season_id) for g in raw_games]
+    games.sort(key=sort_key)
+    return games
+
+
+def write_season_file(season_id, games):
+    """
+    寫入 data/schedule/season_{id}.json。
+    回傳 (內容 hash, 是否真的有寫檔)；內容跟舊檔一樣就不動它。
+    """
+    text = json.dumps(games, ensure_ascii=False, indent=2)
+    digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    path = season_path(season_id)
+    if path.exists() and path.read_text(encoding="utf-8") == text:
+        return digest, False
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+    return digest, True
+
+
+def crawl_all_games(season_ids=None, refresh_all=False):
+    """
+    抓多個賽季的賽程（同時抓），每季各存一個檔，再合併成 schedule_raw.json；
+    目前賽季另外寫成 tpbl_crawler_raw.json。回傳合併後的統一賽程表。
+
+    season_ids：要抓哪些季；None 就自動問 API 有哪些季
+    refresh_all：False 時，已經整季打完的賽季直接沿用舊檔，不再打 API
+    沒有指定到、但之前抓過的賽季，沿用 season 檔一起合併，不會從 schedule_raw.json 消失。
+    """
+    if season_ids is None:
+        season_ids = discover_seasons()
+    print(f"賽季：{season_ids}")
+
+    index = load_index()
+    season_games = {}  # season_id -> games
+    to_crawl = []
 
     for sid in season_ids:
-        print(f"抓取 season {sid} 的賽程中...")
-        raw_games = fetch_games_for_season(sid)
-        print(f"season {sid} 共 {len(raw_games)} 場")
+        cached = load_season_file(sid)
+        if not refresh_all and cached is not None and is_season_finished(cached):
+            print(f"season {sid} 已全部完賽，沿用 {season_path(sid)}")
+            season_games[sid] = cached
+        else:
+            to_crawl.append(sid)
+
+    def safe_crawl(sid):
+        try:
+            return crawl_season(sid)
+        except Exception as e:
+            print(f"⚠ 抓取 season {sid} 失敗：{e}")
+            return None
 
-        for g in raw_games:
-            norm = normalize_game(g, sid)
-            all_games.append(norm)
+    with ThreadPoolExecutor(max_workers=max(1, min(MAX_PARALLEL_SEASONS, len(to_crawl)))) as pool:
+        for sid, games in zip(to_crawl, pool.map(safe_crawl, to_crawl)):
+            if games is None:
+                # 抓失敗就保留舊檔（如果有的話），不要把那季整個弄丟
+                cached = load_season_file(sid)
+                if cached is not None:
+                    season_games[sid] = cached
+                continue
 
-        # 禮貌休息一下，避免一直打 API
-        time.sleep(1)
+            digest, written = write_season_file(sid, games)
+            if written:
+                print(f"season {sid} 有更新，已寫入 {season_path(sid)}")
+            index[str(sid)] = {
+                "path": season_path(sid).as_posix(),
+                "games": len(games),
+                "sha1": digest,
+                "updated_at": (
+                    datetime.now().isoformat(timespec="seconds")
+                    if written or str(sid) not in index
+                    else index[str(sid)].get("updated_at")
+                ),
+            }
+            season_games[sid] = games
 
-    # 依日期 & 時間排序，沒時間的排後面
-    def sort_key(g):
-        return (g.get("date") or "", g.get("time") or "99:99")
+    SEASON_DIR.mkdir(parents=True, exist_ok=True)
+    with INDEX_PATH.open("w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, indent=2, sort_keys=True)
 
+    # 之前抓過、這次沒指定的賽季也要留在合併結果裡
+    for key in index:
+        sid = int(key)
+        if sid not in season_games:
+            cached = load_season_file(sid)
+            if cached is not None:
+                season_games[sid] = cached
+
+    # 合併所有賽季 → schedule_raw.json
+    all_games = []
+    for sid in sorted(season_games):
+        all_games.extend(season_games[sid])
     all_games.sort(key=sort_key)
 
     OUTPUT_PATH.parent.mkdir(parents=True, exist_ok=True)
     with OUTPUT_PATH.open("w", encoding="utf-8") as f:
         json.dump(all_games, f, ensure_ascii=False, indent=2)
+    storage.write_table("schedule_raw", all_games)
+    warehouse.upsert_games(all_games)
+    telemetry.record_rows("schedule_raw", len(all_games))
+
+    print(f"已寫入 {OUTPUT_PATH}，總共 {len(season_games)} 季、{len(all_games)} 場比賽")
 
-    print(f"已寫入 {OUTPUT_PATH}，總共 {len(all_games)} 場比賽")
+    # 目前賽季 → tpbl_crawler_raw.json（同一份資料，不用再打一次 API）
+    if CURRENT_SEASON_ID in season_games:
+        rows = to_game_rows(season_games[CURRENT_SEASON_ID])
+        with GAMES_PATH.open("w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+        storage.write_table("tpbl_crawler_raw", rows)
+        telemetry.record_rows("tpbl_crawler_raw", len(rows))
+        print(f"已寫入 {GAMES_PATH}（season {CURRENT_SEASON_ID}，{len(rows)} 場）")
+
+    return all_games
 
 
 if __name__ == "__main__":
-    crawl_all_games()
+    parser = argparse.ArgumentParser(description="抓 TPBL 賽程並存成 schedule_raw.json")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="不使用 data/.http_cache，全部重新向 API 抓")
+    parser.add_argument("--seasons", type=int, nargs="+",
+                        help="只抓指定的 season_id（預設自動從 API 找全部賽季）")
+    parser.add_argument("--refresh-all", action="store_true",
+                        help="已完賽的賽季也重新抓")
+    args = parser.parse_args()
+    if args.no_cache:  # 沒加就照環境變數 TPBL_NO_CACHE
+        http_client.set_cache_enabled(False)
+
+    with telemetry.crawl_run("schedule_crawler"):
+        crawl_all_games(season_ids=args.seasons, refresh_all=args.refresh_all)
+        http_client.print_stats()
@@ -1,25 +1,19 @@
 # schedule_viewer.py
-# 功能：讀取 data/games.json，提供簡單的賽程查詢（依日期、依隊伍）
+# 功能：從 SQLite 資料庫（data/tpbl.sqlite）提供簡單的賽程查詢（依日期、依隊伍）
 
-import json
-from pathlib import Path
-
-
-DATA_PATH = Path("data/games.json")
+import warehouse
 
 
 def load_games():
-    """從 data/games.json 載入全部比賽資料（list of dict）"""
-    if not DATA_PATH.exists():
-        print("找不到 data/games.json，請先執行 tpbl_crawler.py 抓資料。")
+    """從資料庫載入全部比賽資料（list of dict，已依日期、時間排序）"""
+    if not warehouse.has_rows("games"):
+        print(
+            f"{warehouse.DB_PATH} 裡沒有賽程資料，請先執行 schedule_crawler.py 抓資料"
+            "（或用 python src/warehouse.py 從現有的 JSON 建立）。"
+        )
         return []
 
-    with DATA_PATH.open("r", encoding="utf-8") as f:
-        games = json.load(f)
-
-    # 保險起見再依日期、時間排序一次
-    games.sort(key=lambda x: (x.get("date"), x.get("time")))
-    return games
+    return warehouse.games()
 
 
 def show_all_games(games):
@@ -43,13 +37,13 @@ def show_all_games(games):
 
         print(
             f"{date} {time} | "
-            f"{away} {score_text} {home} | {venue} | 狀態：{status} | ID={g['id']}"
+            f"{away} {score_text} {home} | {venue} | 狀態：{status} | ID={g['game_id']}"
         )
     print()
 
 
-def show_games_by_team(games):
-    """依隊伍關鍵字查詢賽程"""
+def show_games_by_team():
+    """依隊伍關鍵字查詢賽程（先找出符合的球隊，再用 team_id 索引查比賽）"""
     keyword = input("請輸入隊名關鍵字（例如：國王、夢想家）：").strip()
     if not keyword:
         print("關鍵字是空的，返回主選單。\n")
@@ -57,12 +51,11 @@ def show_games_by_team(games):
 
     keyword = keyword.lower()
 
-    filtered = []
-    for g in games:
-        home = g.get("home_team_name") or ""
-        away = g.get("away_team_name") or ""
-        if keyword in home.lower() or keyword in away.lower():
-            filtered.append(g)
+    filtered = {}
+    for team in warehouse.find_teams(keyword):
+        for g in warehouse.games(team_id=team["team_id"]):
+            filtered[g["game_id"]] = g
+    filtered = sorted(filtered.values(), key=lambda g: (g.get("date") or "", g.get("time") or ""))
 
     if not filtered:
         print(f"找不到包含「{keyword}」的隊伍賽程。\n")
@@ -87,7 +80,7 @@ def show_games_by_team(games):
 
         print(
             f"{date} {time} | "
-            f"{away} {score_text} {home} | {venue} | 狀態：{status} | ID={g['id']}"
+            f"{away} {score_text} {home} | {venue} | 狀態：{status} | ID={g['game_id']}"
         )
     print()
 
@@ -107,7 +100,7 @@ def main():
         if choice == "1":
             show_all_games(games)
         elif choice == "2":
-            show_games_by_team(games)
+            show_games_by_team()
         elif choice == "0":
             print("再見～")
             break
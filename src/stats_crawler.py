@@ -5,33 +5,81 @@
 # 3. 把每場比賽的「home/away 隊伍總數據」整理成一張表，存成 data/team_stats.json
 # 4. 另外抓 https://api.tpbl.basketball/api/divisions/9/players
 #    存成 data/players_master.json（球員基本資料，之後如果找到球員 stats API 可以 join）
-
+# 5. 每場的原始 stats JSON 都會壓縮存進 data/raw_archive，
+#    之後加新欄位時可以用 --reparse 直接從存檔重建，不用重爬
+# 6. 同一次解析也輸出每節的隊伍數據 data/team_quarter_stats.json（欄式 JSON）
+# 7. 以及每位球員的單場 box score data/player_game_logs.json（欄式 JSON，不用多打任何 API）
+# 8. 爬的過程中每場結果會先 append 到 data/stats_crawl.ndjson（定期存 checkpoint），
+#    中途當掉重跑會從上次進度繼續；全部爬完才一次「壓縮」成正式輸出檔（atomic 取代）
+#    ——壓縮是一筆一筆寫的，既有資料也先依比賽攤到暫存檔，記憶體用量不隨賽季變大
+
+import argparse
+from collections import deque
+import hashlib
+import itertools
 import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import os
 from pathlib import Path
+import tempfile
+import threading
 import time
 
-import requests
+import http_client
+from raw_archive import RawArchive
+import storage
+import telemetry
+import warehouse
 
 
 GAMES_PATH = Path("data/tpbl_crawler_raw.json")
-GAME_STATS_URL = "https://api.tpbl.basketball/api/games/{game_id}/stats"
-DIVISION_PLAYERS_URL = "https://api.tpbl.basketball/api/divisions/9/players"
+TEAM_STATS_PATH = Path("data/team_stats_raw.json")
+TEAM_QUARTERS_PATH = Path("data/team_quarter_stats.json")
+PLAYER_GAME_LOGS_PATH = Path("data/player_game_logs.json")
+# 增量模式用：記錄每場比賽上次抓到時的狀態 / 版本
+MANIFEST_PATH = Path("data/team_stats_manifest.json")
+# 爬到一半的進度：每場一行 NDJSON + checkpoint
+STREAM_PATH = Path("data/stats_crawl.ndjson")
+CHECKPOINT_PATH = Path("data/stats_crawl.checkpoint.json")
+CHECKPOINT_EVERY = 10  # 每幾場 fsync 一次並更新 checkpoint
+GAME_STATS_URL = http_client.API_BASE + "/games/{game_id}/stats"
+DIVISION_PLAYERS_URL = http_client.API_BASE + "/divisions/9/players"
+
+# 同時最多幾個 request 在路上（1 = 跟以前一樣一場一場抓）
+MAX_IN_FLIGHT = 4
+# 平均每秒最多打幾次 API（原本 sleep(0.2) ≈ 每秒 5 次）
+REQUESTS_PER_SECOND = 5.0
+
+
+# -------- 限速：token bucket --------
+
+class TokenBucket:
+    """
+    簡單的 token bucket 限速器（thread-safe）。
 
+    每秒補 rate 個 token，最多存 burst 個；每次 acquire() 拿走一個，
+    不夠就睡到有 token 為止。取代原本固定的 time.sleep(0.2)。
+    """
 
-# -------- 共用：簡單的 HTTP 請求 --------
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
 
-def http_get_json(url):
-    """發送 GET 並回傳 JSON，失敗時丟錯。"""
-    headers = {
-        "User-Agent": (
-            "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
-            "AppleWebKit/537.36 (KHTML, like Gecko) "
-            "Chrome/120.0 Safari/537.36"
-        )
-    }
-    resp = requests.get(url, headers=headers, timeout=10)
-    resp.raise_for_status()
-    return resp.json()
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            # 先預訂一個 token（可以變負數），等待時間在鎖外面睡
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+        if wait > 0:
+            time.sleep(wait)
 
 
 # -------- 讀取既有的 games.json --------
@@ -50,8 +98,195 @@ def load_games():
     return games
 
 
+# -------- 增量模式：manifest --------
+
+def game_version(game):
+    """
+    用賽程裡會隨比賽進行而改變的欄位算出一個版本字串。
+    只要狀態、比分或開賽時間有變，版本就會不同 → 需要重抓。
+    """
+    key = {
+        "status": game.get("status"),
+        "is_live": game.get("is_live"),
+        "home_score": game.get("home_score"),
+        "away_score": game.get("away_score"),
+        "datetime": game.get("datetime"),
+    }
+    raw = json.dumps(key, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+
+def load_manifest():
+    """載入 manifest：{game_id(str): {"status", "version", "rows"}}，沒有就回傳空 dict。"""
+    if not MANIFEST_PATH.exists():
+        return {}
+    with MANIFEST_PATH.open("r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest):
+    MANIFEST_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with MANIFEST_PATH.open("w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+
+class GameRows:
+    """
+    一張輸出表的 rows 依比賽分組，攤在暫存 NDJSON 檔（一行 = 一場的 rows），
+    記憶體裡只有 {game_id: [檔案位置, ...]}；get(game_id) 才把那一場讀回來。
+    rows 是依比賽連續排的（輸出檔本來就是），同一場被拆成好幾段也沒關係。
+    """
+
+    def __init__(self, rows, path):
+        self.path = Path(path)
+        self.offsets = {}
+        with self.path.open("wb") as f:
+            for game_id, group in itertools.groupby(rows, key=lambda r: r.get("game_id")):
+                self.offsets.setdefault(game_id, []).append(f.tell())
+                f.write((json.dumps(list(group), ensure_ascii=False) + "\n").encode("utf-8"))
+        self._file = self.path.open("rb")
+
+    def __contains__(self, game_id):
+        return game_id in self.offsets
+
+    def __iter__(self):
+        return iter(self.offsets)
+
+    def get(self, game_id, default=()):
+        if game_id not in self.offsets:
+            return list(default)
+        rows = []
+        for offset in self.offsets[game_id]:
+            self._file.seek(offset)
+            rows.extend(json.loads(self._file.readline().decode("utf-8")))
+        return rows
+
+    def close(self):
+        self._file.close()
+        self.path.unlink(missing_ok=True)
+
+
+def spill_existing_outputs(spill_dir):
+    """
+    既有的三張輸出表一筆一筆讀出來（storage.iter_json_rows），各自攤成 spill_dir 底下的 GameRows：
+    {"team": GameRows, "quarters": GameRows, "players": GameRows}。增量合併、或抓失敗時沿用舊資料用。
+    """
+    return {
+        key: GameRows(storage.iter_json_rows(name), Path(spill_dir) / f"{key}.ndjson")
+        for key, (name, _, _) in OUTPUT_TABLES.items()
+    }
+
+
+def read_game_rows(game_ids):
+    """
+    一筆一筆掃過三張輸出表，只留下 game_ids 這幾場的 rows：{"team": {game_id: rows}, ...}
+    （live_poller 拿來當剛開始盯的比賽的基準，不用整張表讀進來）。
+    """
+    wanted = set(game_ids)
+    found = {}
+    for key, (name, _, _) in OUTPUT_TABLES.items():
+        found[key] = {}
+        for row in storage.iter_json_rows(name):
+            if row.get("game_id") in wanted:
+                found[key].setdefault(row["game_id"], []).append(row)
+    return found
+
+
+def needs_fetch(game, manifest, existing_rows):
+    """新比賽、進行中的比賽、或版本跟上次不同的比賽才需要抓。"""
+    entry = manifest.get(str(game["id"]))
+    if entry is None:
+        return True
+    if game.get("is_live"):
+        return True
+    if entry.get("version") != game_version(game):
+        return True
+    # manifest 說有資料、但輸出檔裡卻沒有（例如被手動刪掉）：要補抓
+    if entry.get("rows") and game["id"] not in existing_rows:
+        return True
+    return False
+
+
 # -------- 解析 /games/{id}/stats 裡的隊伍最終統計 --------
 
+# 全場與每節共用的數據欄位：(輸出欄位, round 裡的 key)
+BOX_FIELDS = [
+    # 投籃相關
+    ("fgm", "field_goals_made"),
+    ("fga", "field_goals_attempted"),
+    ("fg_pct", "field_goals_percentage"),
+
+    ("two_pm", "two_pointers_made"),
+    ("two_pa", "two_pointers_attempted"),
+    ("two_pct", "two_pointers_percentage"),
+
+    ("three_pm", "three_pointers_made"),
+    ("three_pa", "three_pointers_attempted"),
+    ("three_pct", "three_pointers_percentage"),
+
+    ("ftm", "free_throws_made"),
+    ("fta", "free_throws_attempted"),
+    ("ft_pct", "free_throws_percentage"),
+
+    # 籃板、助攻、失誤等
+    ("reb", "rebounds"),
+    ("oreb", "offensive_rebounds"),
+    ("dreb", "defensive_rebounds"),
+    ("ast", "assists"),
+    ("stl", "steals"),
+    ("blk", "blocks"),
+    ("tov", "turnovers"),
+
+    # 其他進階用數據
+    ("pf", "personal_fouls"),
+    ("points_in_paint", "points_in_paint"),
+    ("second_chance_points", "second_chance_points"),
+    ("fast_break_points", "fast_break_points"),
+]
+
+# 每節表的欄位順序（欄式 JSON 依這個順序輸出）
+QUARTER_COLUMNS = [
+    "game_id", "team_side", "team_id", "period", "is_overtime",
+    "points", "points_against",
+] + [out_key for out_key, _ in BOX_FIELDS]
+
+REGULATION_PERIODS = 4
+
+# 球員單場欄位：(輸出欄位, API key)；key 跟 /games/stats/players 的 average_stats 一樣
+PLAYER_FIELDS = [
+    ("pts", "score"),
+    ("reb", "rebounds"),
+    ("oreb", "offensive_rebounds"),
+    ("dreb", "defensive_rebounds"),
+    ("ast", "assists"),
+    ("stl", "steals"),
+    ("blk", "blocks"),
+    ("tov", "turnovers"),
+    ("pf", "personal_fouls"),
+    ("fgm", "field_goals_made"),
+    ("fga", "field_goals_attempted"),
+    ("two_pm", "two_pointers_made"),
+    ("two_pa", "two_pointers_attempted"),
+    ("three_pm", "three_pointers_made"),
+    ("three_pa", "three_pointers_attempted"),
+    ("ftm", "free_throws_made"),
+    ("fta", "free_throws_attempted"),
+    ("time_on_court", "time_on_court"),  # 秒
+    ("plus_minus", "plus_minus"),
+    ("eff", "efficiency"),
+]
+
+PLAYER_LOG_COLUMNS = [
+    "game_id", "team_side", "team_id", "player_id", "player_name", "number",
+] + [out_key for out_key, _ in PLAYER_FIELDS]
+
+# extract_game 的 key → (storage 的表名, JSON 路徑, indent)；欄式 JSON 的欄位順序就是 storage.SCHEMAS
+OUTPUT_TABLES = {
+    "team": ("team_stats_raw", TEAM_STATS_PATH, 2),
+    "quarters": ("team_quarter_stats", TEAM_QUARTERS_PATH, None),
+    "players": ("player_game_logs", PLAYER_GAME_LOGS_PATH, None),
+}
+
 def extract_team_totals(game_id, stats_json):
     """
     從單場比賽的 stats_json 中，抽出 home / away 兩隊「全場總數據」。
@@ -121,78 +356,523 @@ def extract_team_totals(game_id, stats_json):
             # 比數：total_won_score / total_lost_score
             "points_for": g("total_won_score"),
             "points_against": g("total_lost_score"),
-
-            # 投籃相關
-            "fgm": g("field_goals_made"),
-            "fga": g("field_goals_attempted"),
-            "fg_pct": g("field_goals_percentage"),
-
-            "two_pm": g("two_pointers_made"),
-            "two_pa": g("two_pointers_attempted"),
-            "two_pct": g("two_pointers_percentage"),
-
-            "three_pm": g("three_pointers_made"),
-            "three_pa": g("three_pointers_attempted"),
-            "three_pct": g("three_pointers_percentage"),
-
-            "ftm": g("free_throws_made"),
-            "fta": g("free_throws_attempted"),
-            "ft_pct": g("free_throws_percentage"),
-
-            # 籃板、助攻、失誤等
-            "reb": g("rebounds"),
-            "oreb": g("offensive_rebounds"),
-            "dreb": g("defensive_rebounds"),
-            "ast": g("assists"),
-            "stl": g("steals"),
-            "blk": g("blocks"),
-            "tov": g("turnovers"),
-
-            # 其他進階用數據
-            "pf": g("personal_fouls"),
-            "points_in_paint": g("points_in_paint"),
-            "second_chance_points": g("second_chance_points"),
-            "fast_break_points": g("fast_break_points"),
         }
+        for out_key, api_key in BOX_FIELDS:
+            row[out_key] = g(api_key)
 
         results.append(row)
 
     return results
 
 
-def crawl_all_team_stats():
-    """對所有比賽抓 stats，產生 team_stats.json"""
-    games = load_games()
-    if not games:
-        return
+def extract_team_quarters(game_id, stats_json):
+    """
+    從單場 stats_json 抽出 home / away 兩隊「每一節」的數據（含延長賽）。
+
+    rounds 的 key 就是節次："1"~"4" 是正規四節，"5" 之後是延長賽。
+    每節的得分用 won_score / lost_score（單節），不是 total_xxx（累積）。
+    """
+    if not isinstance(stats_json, dict):
+        return []
+
+    results = []
 
-    all_rows = []
-    total_games = len(games)
+    for side in ("home_team", "away_team"):
+        team_root = stats_json.get(side)
+        if not team_root:
+            continue
 
-    for idx, g in enumerate(games, start=1):
-        game_id = g["id"]
-        print(f"[{idx}/{total_games}] 抓取比賽 {game_id} 的隊伍 stats...")
+        rounds_dict = (team_root.get("teams") or {}).get("rounds") or {}
 
-        url = GAME_STATS_URL.format(game_id=game_id)
         try:
-            stats_json = http_get_json(url)
-        except Exception as e:
-            print(f"  ⚠ 抓取比賽 {game_id} 失敗：{e}")
+            periods = sorted(rounds_dict.items(), key=lambda kv: int(kv[0]))
+        except (TypeError, ValueError):
+            # key 不是數字就整包放棄（跟 extract_team_totals 一樣）
             continue
 
-        rows = extract_team_totals(game_id, stats_json)
-        print(f"  取得 {len(rows)} 筆隊伍數據")
-        all_rows.extend(rows)
+        for key, period_stats in periods:
+            period = int(key)
+            row = {
+                "game_id": game_id,
+                "team_side": "home" if side == "home_team" else "away",
+                "team_id": team_root.get("id"),
+                "period": period,
+                "is_overtime": period > REGULATION_PERIODS,
+                "points": period_stats.get("won_score"),
+                "points_against": period_stats.get("lost_score"),
+            }
+            for out_key, api_key in BOX_FIELDS:
+                row[out_key] = period_stats.get(api_key)
+            results.append(row)
 
-        # 禮貌一點，避免對 API 太兇
-        time.sleep(0.2)
+    return results
 
-    out_path = Path("data/team_stats_raw.json")
-    out_path.parent.mkdir(parents=True, exist_ok=True)
-    with out_path.open("w", encoding="utf-8") as f:
-        json.dump(all_rows, f, ensure_ascii=False, indent=2)
 
-    print(f"\n共彙整 {len(all_rows)} 筆隊伍數據，已寫入 {out_path}")
+def _player_stats_source(entry):
+    """
+    找出單一球員 entry 裡放數據的 dict。
+    可能是 entry["stats"]、entry["rounds"]（分節，要加總）或直接攤平在 entry 上。
+    回傳 {api_key: 值}，找不到數據就回傳 None。
+    """
+    stats = entry.get("stats") if isinstance(entry.get("stats"), dict) else entry
+    rounds_dict = stats.get("rounds")
+
+    if isinstance(rounds_dict, dict) and rounds_dict:
+        # 分節資料：每個欄位都是可以相加的計數型數據，直接逐節加總成全場
+        totals = {}
+        for period_stats in rounds_dict.values():
+            if not isinstance(period_stats, dict):
+                continue
+            for _, api_key in PLAYER_FIELDS:
+                v = period_stats.get(api_key)
+                if isinstance(v, (int, float)):
+                    totals[api_key] = totals.get(api_key, 0) + v
+        return totals or None
+
+    if any(api_key in stats for _, api_key in PLAYER_FIELDS):
+        return stats
+    return None
+
+
+def extract_player_lines(game_id, stats_json):
+    """
+    從同一份 /games/{id}/stats 抽出每位球員的單場 box score。
+
+    每隊底下的 players 是 list，每個元素有球員資料（id / name / number，
+    有時包在 "player" 裡）和數據；沒上場（沒有數據）的球員不輸出。
+    實際的回應格式（rounds 分節）見 tests/fixtures/games/1496/stats.json。
+    """
+    if not isinstance(stats_json, dict):
+        return []
+
+    results = []
+
+    for side in ("home_team", "away_team"):
+        team_root = stats_json.get(side)
+        if not team_root:
+            continue
+
+        players = team_root.get("players") or []
+        if not isinstance(players, list):
+            continue
+
+        for entry in players:
+            if not isinstance(entry, dict):
+                continue
+
+            info = entry.get("player") if isinstance(entry.get("player"), dict) else entry
+            stats = _player_stats_source(entry)
+            if stats is None:
+                continue
+
+            row = {
+                "game_id": game_id,
+                "team_side": "home" if side == "home_team" else "away",
+                "team_id": team_root.get("id"),
+                "player_id": info.get("id"),
+                "player_name": info.get("name"),
+                "number": info.get("number", entry.get("number")),
+            }
+            for out_key, api_key in PLAYER_FIELDS:
+                row[out_key] = stats.get(api_key)
+            results.append(row)
+
+    return results
+
+
+def extract_game(game_id, stats_json):
+    """
+    一次解析單場 stats，回傳各張輸出表的 rows：
+    {"team": [...], "quarters": [...], "players": [...]}
+    """
+    return {
+        "team": extract_team_totals(game_id, stats_json),
+        "quarters": extract_team_quarters(game_id, stats_json),
+        "players": extract_player_lines(game_id, stats_json),
+    }
+
+
+def warn_missing_player_lines(game, parsed):
+    """
+    已經結束的比賽卻解析不出任何球員數據時印警告：
+    通常是 /games/{id}/stats 的 players 格式變了（格式見 tests/fixtures/games/1496/stats.json）。
+    """
+    finished = game.get("status") == "COMPLETED" and not game.get("is_live")
+    if finished and not parsed["players"]:
+        print(f"  ⚠ 比賽 {game['id']} 已經結束，但沒有解析出任何球員數據（players 格式可能變了）")
+
+
+def fetch_game_stats(game, limiter, archive=None):
+    """
+    抓單場比賽的 stats JSON（暫時性錯誤由 http_client 自動重試），
+    重試完還是失敗就回傳 None，不中斷整個 crawl。有給 archive 就順便存檔。
+    """
+    game_id = game["id"]
+    # 已完成的比賽數據不會再變，快取可以放很久；其他（進行中 / 未開打）用預設的短 TTL
+    finished = game.get("status") == "COMPLETED" and not game.get("is_live")
+    ttl = http_client.FINISHED_GAME_TTL if finished else None
+
+    limiter.acquire()
+    url = GAME_STATS_URL.format(game_id=game_id)
+    try:
+        stats_json = http_client.get_json(url, ttl=ttl)
+    except Exception as e:
+        print(f"  ⚠ 抓取比賽 {game_id} 失敗：{e}")
+        return None
+
+    if archive is not None:
+        archive.put(game_id, url, stats_json)
+    return stats_json
+
+
+def _atomic_write_json(path, obj, **dump_kwargs):
+    """先寫到暫存檔再 os.replace，寫到一半當掉也不會留下壞掉的正式檔。"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False, **dump_kwargs)
+    os.replace(tmp, path)
+
+
+def write_outputs(outputs, changed_ids=None, upsert=True):
+    """
+    寫出所有輸出表（每個檔都是 atomic 取代）：
+      - team → data/team_stats_raw.json（格式固定，方便比對）
+      - quarters → data/team_quarter_stats.json（欄式 JSON）
+      - players → data/player_game_logs.json（欄式 JSON）
+    outputs 的每張表可以是 list 或 iterator：一筆一筆寫（storage.TableWriter，JSON + Parquet），
+    全場隊伍數據每一批順便 upsert 進 SQLite，整張表不用同時在記憶體裡。
+    changed_ids：這次 rows 有換過 / 拿掉的比賽，記進 team_stats_raw 的變動記錄
+    （analyze_team_advanced 只讀這幾場）；None 表示整張表都可能變了。
+    upsert：False 時不碰 SQLite（呼叫端自己只 upsert 有變的比賽）。
+    """
+    storage.record_changes("team_stats_raw", changed_ids)
+    counts = {}
+    for key, (name, path, indent) in OUTPUT_TABLES.items():
+        on_batch = warehouse.upsert_team_game_stats if key == "team" and upsert else None
+        with storage.TableWriter(name, path, indent=indent, on_batch=on_batch) as writer:
+            for row in outputs[key]:
+                writer.write(row)
+        counts[key] = writer.count
+        telemetry.record_rows(name, writer.count)
+
+    print(
+        f"已寫入 {TEAM_STATS_PATH}（{counts['team']} 筆）、"
+        f"{TEAM_QUARTERS_PATH}（{counts['quarters']} 筆）、"
+        f"{PLAYER_GAME_LOGS_PATH}（{counts['players']} 筆）"
+    )
+
+
+def _patched_rows(rows, key, updates, game_ids):
+    """
+    既有的 rows（依比賽連續排）一場一場讀過去：updates 裡的比賽換成新的 rows，其他照舊；
+    還沒出現過的比賽依 game_ids 的順序插在後面第一場比它晚的比賽前面（不在 game_ids 裡的排最後）。
+    """
+    pos = {game_id: i for i, game_id in enumerate(game_ids)}
+    last = len(pos)
+    todo = deque(sorted(updates, key=lambda game_id: pos.get(game_id, last)))
+    written = set()
+
+    for game_id, group in itertools.groupby(rows, key=lambda r: r.get("game_id")):
+        if game_id in pos:
+            while todo and pos.get(todo[0], last) < pos[game_id]:
+                new_id = todo.popleft()
+                if new_id not in written:
+                    written.add(new_id)
+                    yield from updates[new_id][key]
+        if game_id not in updates:
+            yield from group
+        elif game_id not in written:
+            written.add(game_id)
+            yield from updates[game_id][key]
+
+    for new_id in todo:
+        if new_id not in written:
+            yield from updates[new_id][key]
+
+
+def patch_outputs(updates, game_ids):
+    """
+    只把 updates（{game_id: extract_game() 的結果}）這幾場換進三張輸出表，其他比賽原封不動：
+    既有的表邊讀邊寫（_patched_rows → write_outputs），不會整張表讀進記憶體。
+    game_ids：賽程順序，輸出檔裡還沒有的比賽照這個順序插進去。
+    SQLite 只 upsert 這幾場的全場隊伍數據，變動記錄也只記這幾場。
+    """
+    outputs = {
+        key: _patched_rows(storage.iter_json_rows(name), key, updates, game_ids)
+        for key, (name, _, _) in OUTPUT_TABLES.items()
+    }
+    write_outputs(outputs, changed_ids=list(updates), upsert=False)
+    warehouse.upsert_team_game_stats([r for parsed in updates.values() for r in parsed["team"]])
+
+
+# -------- 爬到一半的進度：NDJSON stream + checkpoint --------
+
+def scan_stream():
+    """
+    掃過上次沒爬完留下的 stats_crawl.ndjson，回傳 {game_id: (檔案位置, status, version, 全場 rows 數)}
+    （同一場有好幾行就用最後一行）；內容不留在記憶體裡，要用時再 read_stream_record。
+    最後一行如果只寫了一半（當掉時）就丟掉，並把檔案截到最後一個完整行。
+    """
+    if not STREAM_PATH.exists():
+        return {}
+
+    index = {}
+    good_bytes = 0
+    with STREAM_PATH.open("rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                record = json.loads(line.decode("utf-8"))
+            except ValueError:
+                break
+            index[record["game_id"]] = (
+                good_bytes, record["status"], record["version"], len(record["outputs"]["team"]))
+            good_bytes += len(line)
+
+    with STREAM_PATH.open("r+b") as f:
+        f.truncate(good_bytes)
+
+    return index
+
+
+def read_stream_record(f, offset):
+    """從打開的 stats_crawl.ndjson（binary）讀出 offset 那一行的 record。"""
+    f.seek(offset)
+    return json.loads(f.readline().decode("utf-8"))
+
+
+def write_checkpoint(stream, games_done):
+    """把 stream flush + fsync 到磁碟，並記錄目前進度。"""
+    stream.flush()
+    os.fsync(stream.fileno())
+    _atomic_write_json(
+        CHECKPOINT_PATH,
+        {
+            "games_done": games_done,
+            "bytes": stream.tell(),
+            "updated_at": datetime.now().isoformat(timespec="seconds"),
+        },
+        indent=2,
+    )
+
+
+def clear_stream():
+    STREAM_PATH.unlink(missing_ok=True)
+    CHECKPOINT_PATH.unlink(missing_ok=True)
+
+
+def merge_outputs(game_ids, fresh, existing):
+    """
+    依 game_ids 的順序合併每張輸出表：fresh(game_id) 回傳這場新的 extract_game 結果（沒有就 None），
+    沒有新資料的比賽沿用 existing（spill_existing_outputs）的 rows。
+    回傳 {"team": iterator, ...}，給 write_outputs 一筆一筆寫，不會整張表放在記憶體裡。
+    """
+    def rows(key):
+        for game_id in game_ids:
+            parsed = fresh(game_id)
+            yield from (parsed[key] if parsed is not None else existing[key].get(game_id))
+
+    return {key: rows(key) for key in OUTPUT_TABLES}
+
+
+def crawl_all_team_stats(max_in_flight=MAX_IN_FLIGHT, rate=REQUESTS_PER_SECOND,
+                         incremental=False, resume=True):
+    """
+    對所有比賽抓 stats，產生 team_stats.json（全場）、team_quarter_stats.json（每節）
+    與 player_game_logs.json（球員單場），三張表都來自同一次 request
+
+    max_in_flight：同時進行的 request 上限（同時最多只有這麼多場已送出、還沒處理完）
+    rate：token bucket 每秒允許的 request 數
+    incremental：True 時只抓新的 / 進行中 / 有變動的比賽，
+                 其他比賽直接沿用既有 team_stats_raw.json 的資料
+    resume：True 時如果上次沒爬完（stats_crawl.ndjson 還在），已經爬好的比賽就不再抓
+    輸出順序固定依 games 的順序，跟一場一場抓的結果完全相同。
+
+    記憶體用量不隨賽季變大：
+      - 一次只送出 max_in_flight 場，依序處理完一場才補送下一場，結果不會在記憶體裡排隊
+      - 每場解析完就 append 一行到 stats_crawl.ndjson，記憶體裡只記每場在檔案裡的位置
+      - 既有的輸出檔一筆一筆讀、依比賽攤到暫存檔（GameRows），不整份讀進來
+      - 壓縮時依賽程順序從 stream / 暫存檔一場一場讀回來，一筆一筆寫成正式輸出檔
+    """
+    games = load_games()
+    if not games:
+        return
+
+    STREAM_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=STREAM_PATH.parent) as spill_dir:
+        # 既有資料：增量模式拿來合併，完整模式拿來當抓失敗時的備援
+        existing = spill_existing_outputs(spill_dir)
+        try:
+            _crawl(games, existing, max_in_flight, rate, incremental, resume)
+        finally:
+            for rows in existing.values():
+                rows.close()
+
+
+def _crawl(games, existing, max_in_flight, rate, incremental, resume):
+    if incremental:
+        manifest = load_manifest()
+        to_fetch = [g for g in games if needs_fetch(g, manifest, existing["team"])]
+        print(f"增量模式：{len(games)} 場中有 {len(to_fetch)} 場需要重抓")
+    else:
+        manifest = {}
+        to_fetch = games
+
+    # 上次沒爬完：同一個版本的比賽已經在 stream 裡，就不用再抓
+    if not resume:
+        clear_stream()
+    streamed = scan_stream()
+    if streamed:
+        before = len(to_fetch)
+        to_fetch = [
+            g for g in to_fetch
+            if g["id"] not in streamed or streamed[g["id"]][2] != game_version(g)
+        ]
+        print(f"從上次的進度繼續：{before - len(to_fetch)} 場已經爬好，剩 {len(to_fetch)} 場")
+    done = len(streamed)
+
+    failed = []   # 重試後還是失敗的 game_id
+    total_games = len(to_fetch)
+    limiter = TokenBucket(rate)
+    archive = RawArchive()
+
+    with STREAM_PATH.open("ab") as stream, \
+            ThreadPoolExecutor(max_workers=max(1, max_in_flight)) as pool:
+        # 最多 max_in_flight 個 future 在路上；依賽程順序等最前面那一場，處理完再補送一場，
+        # 所以輸出順序不受完成先後影響，也不會一次把所有比賽都送出去
+        todo = iter(to_fetch)
+        in_flight = deque()
+
+        def submit_next():
+            g = next(todo, None)
+            if g is not None:
+                in_flight.append((g, pool.submit(fetch_game_stats, g, limiter, archive)))
+
+        for _ in range(max(1, max_in_flight)):
+            submit_next()
+
+        idx = 0
+        while in_flight:
+            g, future = in_flight.popleft()
+            stats_json = future.result()
+            submit_next()
+            idx += 1
+
+            game_id = g["id"]
+            print(f"[{idx}/{total_games}] 抓取比賽 {game_id} 的隊伍 stats...")
+            if stats_json is None:
+                failed.append(game_id)
+                continue
+
+            parsed = extract_game(game_id, stats_json)
+            del stats_json
+            print(
+                f"  取得 {len(parsed['team'])} 筆隊伍數據、{len(parsed['quarters'])} 筆分節數據、"
+                f"{len(parsed['players'])} 筆球員數據"
+            )
+            warn_missing_player_lines(g, parsed)
+
+            record = {
+                "game_id": game_id,
+                "status": g.get("status"),
+                "version": game_version(g),
+                "outputs": parsed,
+            }
+            streamed[game_id] = (stream.tell(), record["status"], record["version"], len(parsed["team"]))
+            stream.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+            done += 1
+
+            if idx % CHECKPOINT_EVERY == 0:
+                write_checkpoint(stream, done)
+                archive.save()
+
+        write_checkpoint(stream, done)
+
+    archive.save()
+
+    # ===== 壓縮：stream + 既有資料 → 正式輸出檔（依賽程順序一場一場讀、一筆一筆寫）=====
+    # 這次有抓到的用新資料，其餘沿用舊資料（抓失敗的比賽也保留舊資料，且不更新 manifest，下次會再試）
+    for game_id, (_, status, version, team_rows) in streamed.items():
+        manifest[str(game_id)] = {"status": status, "version": version, "rows": team_rows}
+
+    # 賽程裡已經不存在的比賽就從 manifest 移除（輸出檔裡也不會再有它們）
+    current_ids = {str(g["id"]) for g in games}
+    manifest = {k: v for k, v in manifest.items() if k in current_ids}
+    dropped = [game_id for game_id in existing["team"] if str(game_id) not in current_ids]
+
+    print()
+    with STREAM_PATH.open("rb") as stream:
+        def fresh(game_id):
+            if game_id not in streamed:
+                return None
+            return read_stream_record(stream, streamed[game_id][0])["outputs"]
+
+        outputs = merge_outputs([g["id"] for g in games], fresh, existing)
+        write_outputs(outputs, changed_ids=list(streamed) + dropped)
+    save_manifest(manifest)
+    clear_stream()
+
+    if failed:
+        print(
+            f"⚠ 有 {len(failed)} 場重試後仍失敗（沿用舊資料，下次 --incremental 會再抓）："
+            f"{failed}"
+        )
+
+
+def reparse_from_archive():
+    """
+    完全不打 API，從 data/raw_archive 的原始 JSON 重建 team_stats_raw.json、分節表與球員單場表。
+    順序跟爬蟲一樣依賽程排；賽程檔不在的話就依 game_id 排。
+
+    存檔不一定涵蓋所有比賽（--incremental 沒重抓的比賽不會進存檔）：沒有存檔的比賽沿用
+    既有輸出檔裡的 rows，不會因為重建就從輸出檔（跟 SQLite）裡消失；這些比賽的 id 會印出來。
+    """
+    archive = RawArchive()
+    archived_ids = set(archive.game_ids())
+    if not archived_ids:
+        print("data/raw_archive 裡沒有任何存檔，請先跑一次 stats_crawler.py。")
+        return
+
+    STREAM_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=STREAM_PATH.parent) as spill_dir:
+        existing = spill_existing_outputs(spill_dir)
+        try:
+            games = load_games()
+            if not games:
+                games = [{"id": game_id} for game_id in sorted(archived_ids | set(existing["team"]))]
+
+            missing = [g["id"] for g in games if g["id"] not in archived_ids]
+            kept = [game_id for game_id in missing if game_id in existing["team"]]
+            lost = [game_id for game_id in missing if game_id not in existing["team"]]
+            print(f"從 {len(games) - len(missing)} 場存檔重建：")
+            if kept:
+                print(f"⚠ 有 {len(kept)} 場沒有存檔，沿用既有輸出檔的資料：{kept}")
+            if lost:
+                print(f"有 {len(lost)} 場沒有存檔、輸出檔裡也沒有資料（還沒開打的比賽本來就沒有）：{lost}")
+
+            # 先一場一場解析、append 到暫存檔（跟爬蟲的 stream 一樣只記位置），再依賽程順序合併寫出
+            offsets = {}
+            with open(Path(spill_dir) / "reparsed.ndjson", "w+b") as parsed_file:
+                for g in games:
+                    if g["id"] not in archived_ids:
+                        continue
+                    parsed = extract_game(g["id"], archive.get(g["id"]))
+                    warn_missing_player_lines(g, parsed)
+                    offsets[g["id"]] = parsed_file.tell()
+                    record = {"game_id": g["id"], "outputs": parsed}
+                    parsed_file.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+
+                def fresh(game_id):
+                    if game_id not in offsets:
+                        return None
+                    return read_stream_record(parsed_file, offsets[game_id])["outputs"]
+
+                write_outputs(merge_outputs([g["id"] for g in games], fresh, existing))
+        finally:
+            for rows in existing.values():
+                rows.close()
 
 
 # -------- 抓聯盟球員清單 players_master --------
@@ -202,22 +882,53 @@ def crawl_division_players():
     呼叫 /api/divisions/9/players，存成 data/players_master.json。
     """
     print("抓取 division 9 的球員清單...")
-    data = http_get_json(DIVISION_PLAYERS_URL)
+    data = http_client.get_json(DIVISION_PLAYERS_URL)
 
     out_path = Path("data/players_master_raw.json")
     out_path.parent.mkdir(parents=True, exist_ok=True)
     with out_path.open("w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
+    warehouse.upsert_players(data)
+    telemetry.record_rows("players_master_raw", len(data))
 
     print(f"已將球員清單寫入 {out_path}")
 
 
 def main():
-    # 1. 抓所有比賽的隊伍總數據
-    crawl_all_team_stats()
+    parser = argparse.ArgumentParser(description="抓 TPBL 每場比賽的隊伍 stats")
+    parser.add_argument("--workers", type=int, default=MAX_IN_FLIGHT,
+                        help=f"同時進行的 request 上限（預設 {MAX_IN_FLIGHT}）")
+    parser.add_argument("--rate", type=float, default=REQUESTS_PER_SECOND,
+                        help=f"每秒最多幾個 request（預設 {REQUESTS_PER_SECOND}）")
+    parser.add_argument("--incremental", action="store_true",
+                        help="只抓新的 / 進行中 / 有變動的比賽，並合併進既有的 team_stats_raw.json")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="不使用 data/.http_cache，全部重新向 API 抓")
+    parser.add_argument("--fresh", action="store_true",
+                        help="忽略上次沒爬完的進度（data/stats_crawl.ndjson），從頭開始")
+    parser.add_argument("--reparse", action="store_true",
+                        help="不打 API，只從 data/raw_archive 重建 team_stats_raw.json")
+    args = parser.parse_args()
+    if args.no_cache:  # 沒加就照環境變數 TPBL_NO_CACHE
+        http_client.set_cache_enabled(False)
+
+    if args.reparse:
+        reparse_from_archive()
+        return
+
+    with telemetry.crawl_run("stats_crawler"):
+        # 1. 抓所有比賽的隊伍總數據
+        crawl_all_team_stats(
+            max_in_flight=args.workers,
+            rate=args.rate,
+            incremental=args.incremental,
+            resume=not args.fresh,
+        )
+
+        # 2. 抓聯盟球員清單（先有 roster，日後如果找到球員 stats API 可 join）
+        crawl_division_players()
 
-    # 2. 抓聯盟球員清單（先有 roster，日後如果找到球員 stats API 可 join）
-    crawl_division_players()
+        http_client.print_stats()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,669 @@
+# storage.py
+# 功能：data/ 底下各資料表的欄式存檔（Parquet）
+# 1. JSON 照舊寫（git diff 看得懂、舊程式也能讀），有安裝 pyarrow 時另外寫一份
+#    data/parquet/{name}.parquet，每張表的欄位型別明確寫在 SCHEMAS
+# 2. 讀的時候只讀需要的欄位；沒裝 pyarrow、還沒有 Parquet、或 Parquet 比 JSON 舊（JSON 被手動改過 /
+#    git checkout 過）就自動退回讀 JSON，結果一樣
+# 3. player_stats_raw.json 是巢狀的，Parquet 存攤平後的 player_stats 表（球員 / 球隊 / 場均 / 累計 / 命中率）
+#
+# 用法：
+#   python src/storage.py            # 把現有的 JSON 全部轉成 Parquet，並比較讀取時間
+
+import json
+import os
+from pathlib import Path
+import tempfile
+import time
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # 沒裝就只用 JSON
+    pa = None
+    pq = None
+
+
+DATA_DIR = Path("data")   # 從別的目錄呼叫（例如 app.py）可以改成絕對路徑
+
+# Parquet 每個 row group 的筆數：每個 group 有 game_id 的 min / max，只讀幾場比賽時可以整塊跳過
+ROW_GROUP_SIZE = 64 * 1024
+
+
+# -------- schema --------
+
+# 隊伍 box score 欄位（全場 / 每節共用），_pct 是官方給的字串（例如 "30.0"）
+BOX_COLUMNS = [
+    ("fgm", "int"), ("fga", "int"), ("fg_pct", "str"),
+    ("two_pm", "int"), ("two_pa", "int"), ("two_pct", "str"),
+    ("three_pm", "int"), ("three_pa", "int"), ("three_pct", "str"),
+    ("ftm", "int"), ("fta", "int"), ("ft_pct", "str"),
+    ("reb", "int"), ("oreb", "int"), ("dreb", "int"),
+    ("ast", "int"), ("stl", "int"), ("blk", "int"), ("tov", "int"),
+    ("pf", "int"), ("points_in_paint", "int"),
+    ("second_chance_points", "int"), ("fast_break_points", "int"),
+]
+
+# player_stats 表要攤平的 API key（場均 avg_*、累計 acc_*）
+PLAYER_STAT_KEYS = [
+    "score", "rebounds", "offensive_rebounds", "defensive_rebounds",
+    "assists", "steals", "blocks", "turnovers", "personal_fouls",
+    "field_goals_made", "field_goals_attempted",
+    "two_pointers_made", "two_pointers_attempted",
+    "three_pointers_made", "three_pointers_attempted",
+    "free_throws_made", "free_throws_attempted",
+    "time_on_court", "plus_minus", "efficiency",
+]
+PLAYER_PCT_KEYS = [
+    "field_goals_percentage", "two_pointers_percentage", "three_pointers_percentage",
+    "free_throws_percentage", "turnovers_percentage",
+    "effective_field_goals_percentage", "true_shooting_percentage",
+]
+
+# player_advanced 的數據欄位（player_percentiles 每個欄位再加 _pct / _rank）
+PLAYER_ADVANCED_METRICS = [
+    "pts", "reb", "ast", "stl", "blk", "tov", "fgm", "fga",
+    "three_pm", "three_pa", "ftm", "fta", "eff_raw",
+    "efg_official", "ts_official", "tov_pct_official",
+    "ft_rate", "three_par", "usage_share", "ppp", "per_simple",
+]
+
+SCHEMAS = {
+    "team_stats_raw": [
+        ("game_id", "int"), ("team_side", "str"), ("team_id", "int"), ("team_name", "str"),
+        ("points_for", "int"), ("points_against", "int"),
+    ] + BOX_COLUMNS,
+    "team_quarter_stats": [
+        ("game_id", "int"), ("team_side", "str"), ("team_id", "int"),
+        ("period", "int"), ("is_overtime", "bool"),
+        ("points", "int"), ("points_against", "int"),
+    ] + BOX_COLUMNS,
+    "player_game_logs": [
+        ("game_id", "int"), ("team_side", "str"), ("team_id", "int"),
+        ("player_id", "int"), ("player_name", "str"), ("number", "str"),
+        ("pts", "int"), ("reb", "int"), ("oreb", "int"), ("dreb", "int"),
+        ("ast", "int"), ("stl", "int"), ("blk", "int"), ("tov", "int"), ("pf", "int"),
+        ("fgm", "int"), ("fga", "int"), ("two_pm", "int"), ("two_pa", "int"),
+        ("three_pm", "int"), ("three_pa", "int"), ("ftm", "int"), ("fta", "int"),
+        ("time_on_court", "float"), ("plus_minus", "int"), ("eff", "float"),
+    ],
+    "schedule_raw": [
+        ("game_id", "int"), ("season_id", "int"), ("division_id", "int"), ("code", "str"),
+        ("date", "str"), ("time", "str"), ("datetime", "str"), ("day_of_week", "str"),
+        ("venue", "str"), ("status", "str"), ("is_live", "bool"), ("round", "int"),
+        ("home_team_id", "int"), ("home_team_name", "str"),
+        ("home_team_logo", "str"), ("home_team_alt_name", "str"), ("home_score", "int"),
+        ("away_team_id", "int"), ("away_team_name", "str"),
+        ("away_team_logo", "str"), ("away_team_alt_name", "str"), ("away_score", "int"),
+        ("recap_url", "str"), ("live_stream_url", "str"), ("judgement_report_url", "str"),
+    ],
+    "tpbl_crawler_raw": [
+        ("id", "int"), ("code", "str"), ("date", "str"), ("time", "str"), ("datetime", "str"),
+        ("venue", "str"), ("status", "str"), ("is_live", "bool"), ("division_id", "int"),
+        ("home_team_id", "int"), ("home_team_name", "str"), ("home_score", "int"),
+        ("away_team_id", "int"), ("away_team_name", "str"), ("away_score", "int"),
+    ],
+    "team_advanced": [
+        ("team_id", "int"), ("team_name", "str"), ("games", "int"),
+        ("points_for_total", "int"), ("points_against_total", "int"),
+        ("points_for_avg", "float"), ("points_against_avg", "float"),
+        ("efg", "float"), ("ts", "float"), ("off_rtg", "float"), ("def_rtg", "float"),
+        ("pace", "float"), ("tov_pct", "float"), ("ft_rate", "float"),
+        ("opp_efg", "float"), ("opp_tov_pct", "float"), ("opp_ft_rate", "float"),
+        ("oreb_pct", "float"), ("drb_pct", "float"), ("margin_avg", "float"),
+    ],
+    "team_rolling": [
+        ("team_id", "int"), ("team_name", "str"), ("game_id", "int"), ("date", "str"),
+        ("game_no", "int"), ("window", "int"), ("games", "int"),
+        ("date_from", "str"), ("date_to", "str"),
+    ] + [(c, "float") for c in ("off_rtg", "def_rtg", "net_rtg", "pace", "efg")],
+    "player_advanced": [
+        ("player_id", "int"), ("player_name", "str"), ("team_id", "int"), ("team_name", "str"),
+        ("games", "int"), ("min_pg", "float"),
+    ] + [(c, "float") for c in PLAYER_ADVANCED_METRICS],
+    "player_percentiles": [
+        ("player_id", "int"), ("player_name", "str"), ("team_id", "int"), ("team_name", "str"),
+        ("position", "str"), ("position_group", "str"), ("pool", "str"), ("pool_size", "int"),
+    ] + [
+        (f"{c}_{kind}", t)
+        for c in ["min_pg"] + PLAYER_ADVANCED_METRICS
+        for kind, t in (("pct", "float"), ("rank", "int"))
+    ],
+    "player_stats": [
+        ("player_id", "int"), ("player_name", "str"), ("number", "str"), ("position", "str"),
+        ("team_id", "int"), ("team_name", "str"), ("game_count", "int"),
+    ]
+    + [(f"avg_{k}", "float") for k in PLAYER_STAT_KEYS]
+    + [(f"acc_{k}", "int") for k in PLAYER_STAT_KEYS]
+    + [(f"pct_{k}", "str") for k in PLAYER_PCT_KEYS],
+}
+
+# 表名跟 JSON 檔名不一樣的（player_stats 對應巢狀的 player_stats_raw.json）
+JSON_NAMES = {"player_stats": "player_stats_raw"}
+
+# 欄式 JSON（{欄位: [...]}）的表
+COLUMNAR_JSON = {"team_quarter_stats", "player_game_logs"}
+
+
+def available():
+    """有沒有安裝 pyarrow。"""
+    return pa is not None
+
+
+def arrow_schema(name):
+    types = {"int": pa.int64(), "float": pa.float64(), "str": pa.string(), "bool": pa.bool_()}
+    return pa.schema([(col, types[t]) for col, t in SCHEMAS[name]])
+
+
+def json_path(name):
+    return DATA_DIR / f"{JSON_NAMES.get(name, name)}.json"
+
+
+def parquet_path(name):
+    return DATA_DIR / "parquet" / f"{name}.parquet"
+
+
+# -------- player_stats_raw（巢狀）↔ 攤平 --------
+
+# player_stats 表每一欄在巢狀 JSON 裡的位置
+PLAYER_STATS_PATHS = {
+    "player_id": ("player", "id"),
+    "player_name": ("player", "name"),
+    "number": ("player", "number"),
+    "position": ("player", "meta", "position"),
+    "team_id": ("team", "id"),
+    "team_name": ("team", "name"),
+    "game_count": ("game_count",),
+    **{f"avg_{k}": ("average_stats", k) for k in PLAYER_STAT_KEYS},
+    **{f"acc_{k}": ("accumulated_stats", k) for k in PLAYER_STAT_KEYS},
+    **{f"pct_{k}": ("percentage_stats", k) for k in PLAYER_PCT_KEYS},
+}
+
+
+def _dig(obj, path):
+    for key in path:
+        if not isinstance(obj, dict):
+            return None
+        obj = obj.get(key)
+    return obj
+
+
+def flatten_player_stats(raw_players):
+    """player_stats_raw.json 的巢狀結構 → player_stats 表的 rows。"""
+    return [
+        {col: _dig(p, path) for col, path in PLAYER_STATS_PATHS.items()}
+        for p in raw_players
+    ]
+
+
+def player_stats_columns(raw_players, columns):
+    """
+    巢狀 raw players → 欄式 {欄位: list}（只取 columns 這幾欄，值跟 flatten_player_stats 一樣）。
+    同一層的 dict（例如 average_stats）只取一次，整欄用 list comprehension 取值，不用一列一列組 dict。
+    """
+    parents = {(): raw_players}
+
+    def parent_objs(path):
+        if path not in parents:
+            objs = parent_objs(path[:-1])
+            parents[path] = [o.get(path[-1]) if isinstance(o, dict) else None for o in objs]
+        return parents[path]
+
+    out = {}
+    for col in columns:
+        path = PLAYER_STATS_PATHS[col]
+        key = path[-1]
+        out[col] = [o.get(key) if isinstance(o, dict) else None for o in parent_objs(path[:-1])]
+    return out
+
+
+def project_player_stats(raw_players, columns):
+    """
+    只留下 player_stats 表 columns 這幾欄對應的巢狀 key，其餘丟掉（結構不變，一樣是巢狀）。
+    原始資料沒有的 key 不會補 None，讓呼叫端的 .get(key, 預設值) 行為不變。
+    """
+    paths = [PLAYER_STATS_PATHS[c] for c in columns]
+    result = []
+    for p in raw_players:
+        out = {}
+        for path in paths:
+            src, dst = p, out
+            for key in path[:-1]:
+                src = src.get(key) if isinstance(src, dict) else None
+                if not isinstance(src, dict):
+                    break
+                dst = dst.setdefault(key, {})
+            else:
+                if path[-1] in src:
+                    dst[path[-1]] = src[path[-1]]
+        result.append(out)
+    return result
+
+
+def nest_player_stats(rows):
+    """
+    player_stats 表的 rows → 跟 player_stats_raw.json 一樣的巢狀結構（只含攤平過的欄位）。
+    值是 None 的 key 直接省略，讓呼叫端的 .get(key, 預設值) 跟讀 JSON 時行為一樣。
+    """
+    def pick(row, prefix, keys):
+        out = {}
+        for k in keys:
+            v = row.get(f"{prefix}{k}")
+            if v is not None:
+                out[k] = v
+        return out
+
+    result = []
+    for row in rows:
+        result.append({
+            "player": {"id": row.get("player_id"), "name": row.get("player_name"),
+                       "number": row.get("number"), "meta": {"position": row.get("position")}},
+            "team": {"id": row.get("team_id"), "name": row.get("team_name")},
+            "game_count": row.get("game_count"),
+            "average_stats": pick(row, "avg_", PLAYER_STAT_KEYS),
+            "accumulated_stats": pick(row, "acc_", PLAYER_STAT_KEYS),
+            "percentage_stats": pick(row, "pct_", PLAYER_PCT_KEYS),
+        })
+    return result
+
+
+# -------- 寫 --------
+
+def write_table(name, rows):
+    """
+    把 rows（list[dict]）依 SCHEMAS[name] 寫成 data/parquet/{name}.parquet。
+    沒裝 pyarrow 就什麼都不做；型別對不上時印警告並略過（JSON 還是正確的，讀的時候會退回 JSON）。
+    回傳是否有寫檔。
+    """
+    if pa is None:
+        return False
+    try:
+        table = pa.Table.from_pylist(rows, schema=arrow_schema(name))
+    except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+        print(f"⚠ {name} 轉 Parquet 失敗（{e}），這次只寫 JSON")
+        parquet_path(name).unlink(missing_ok=True)
+        return False
+
+    path = parquet_path(name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    pq.write_table(table, tmp, compression="zstd", row_group_size=ROW_GROUP_SIZE)
+    tmp.replace(path)
+    return True
+
+
+# -------- 一筆一筆寫（整張表不用同時在記憶體裡）--------
+
+class TableWriter:
+    """
+    一筆一筆寫一張表：JSON 跟 json.dump(rows 或 {欄位: list}, ensure_ascii=False, indent=indent)
+    一字不差，有 pyarrow 時另外每 ROW_GROUP_SIZE 筆寫一個 Parquet row group。
+    記憶體裡最多只有一批 rows；欄式 JSON 的每一欄先寫到暫存檔，close 時再接起來。
+    兩個檔都寫完才 os.replace（中途出錯舊檔不會被動到）；on_batch(rows) 每批呼叫一次（例如寫 SQLite）。
+
+        with TableWriter("team_stats_raw", indent=2) as writer:
+            for row in rows:
+                writer.write(row)
+        writer.count  # 寫了幾筆
+    """
+
+    def __init__(self, name, path=None, indent=None, on_batch=None):
+        self.name = name
+        self.path = Path(path) if path is not None else json_path(name)
+        self.indent = indent
+        self.on_batch = on_batch
+        self.count = 0
+        self._batch = []
+        self._tmp = self.path.with_name(self.path.name + ".tmp")
+        self._columns = None
+        self._spill_dir = None
+        self._parquet = None
+
+    def __enter__(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.name in COLUMNAR_JSON:
+            # 每一欄一個暫存檔（一行一個值），close 時再接成 {"欄位": [...], ...}
+            self._columns = [col for col, _ in SCHEMAS[self.name]]
+            self._spill_dir = tempfile.TemporaryDirectory(dir=self.path.parent)
+            self._spills = [
+                open(os.path.join(self._spill_dir.name, str(i)), "w", encoding="utf-8")
+                for i in range(len(self._columns))
+            ]
+        else:
+            self._json = self._tmp.open("w", encoding="utf-8")
+        if pa is not None:
+            self._parquet_tmp = parquet_path(self.name).with_suffix(".tmp")
+            self._parquet_tmp.parent.mkdir(parents=True, exist_ok=True)
+            self._parquet = pq.ParquetWriter(self._parquet_tmp, arrow_schema(self.name), compression="zstd")
+        return self
+
+    def write(self, row):
+        if self._columns is not None:
+            for f, col in zip(self._spills, self._columns):
+                f.write(json.dumps(row.get(col), ensure_ascii=False) + "\n")
+        else:
+            self._json.write(self._element(row))
+        self.count += 1
+        self._batch.append(row)
+        if len(self._batch) >= ROW_GROUP_SIZE:
+            self._flush()
+
+    def _element(self, row):
+        """一筆 row 在 JSON array 裡的文字（含前面的 "[" 或 ","），跟 json.dump 的縮排一樣。"""
+        text = json.dumps(row, ensure_ascii=False, indent=self.indent)
+        if self.indent is None:
+            return ("[" if self.count == 0 else ", ") + text
+        pad = " " * self.indent
+        return ("[\n" if self.count == 0 else ",\n") + pad + text.replace("\n", "\n" + pad)
+
+    def _flush(self):
+        if not self._batch:
+            return
+        if self._parquet is not None:
+            try:
+                self._parquet.write_table(
+                    pa.Table.from_pylist(self._batch, schema=arrow_schema(self.name)),
+                    row_group_size=ROW_GROUP_SIZE,
+                )
+            except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+                print(f"⚠ {self.name} 轉 Parquet 失敗（{e}），這次只寫 JSON")
+                self._drop_parquet()
+                parquet_path(self.name).unlink(missing_ok=True)
+        if self.on_batch is not None:
+            self.on_batch(self._batch)
+        self._batch = []
+
+    def _drop_parquet(self):
+        self._parquet.close()
+        self._parquet_tmp.unlink(missing_ok=True)
+        self._parquet = None
+
+    def _finish_json(self):
+        if self._columns is None:
+            if self.count == 0:
+                self._json.write("[]")
+            elif self.indent is None:
+                self._json.write("]")
+            else:
+                self._json.write("\n]")
+            self._json.close()
+            return
+
+        with self._tmp.open("w", encoding="utf-8") as out:
+            out.write("{")
+            for i, (f, col) in enumerate(zip(self._spills, self._columns)):
+                f.close()
+                out.write(("" if i == 0 else ", ") + json.dumps(col, ensure_ascii=False) + ": [")
+                with open(f.name, "r", encoding="utf-8") as values:
+                    for j, line in enumerate(values):
+                        out.write(("" if j == 0 else ", ") + line[:-1])
+                out.write("]")
+            out.write("}")
+        self._spill_dir.cleanup()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self._flush()
+            self._finish_json()
+            os.replace(self._tmp, self.path)
+            if self._parquet is not None:
+                self._parquet.close()
+                os.replace(self._parquet_tmp, parquet_path(self.name))
+            return False
+
+        # 出錯：暫存檔全部丟掉，正式檔維持原狀
+        if self._columns is None:
+            self._json.close()
+        else:
+            for f in self._spills:
+                f.close()
+            self._spill_dir.cleanup()
+        self._tmp.unlink(missing_ok=True)
+        if self._parquet is not None:
+            self._drop_parquet()
+        return False
+
+
+# -------- 讀 --------
+
+def _parquet_fresh(name):
+    """Parquet 存在、而且不比 JSON 舊（JSON 不存在也算）。"""
+    if pq is None:
+        return False
+    path = parquet_path(name)
+    if not path.exists():
+        return False
+    src = json_path(name)
+    return not src.exists() or path.stat().st_mtime >= src.stat().st_mtime
+
+
+def _read_json_rows(name):
+    src = json_path(name)
+    if not src.exists():
+        return []
+    with src.open("r", encoding="utf-8") as f:
+        data = json.load(f)
+    if name == "player_stats":
+        return flatten_player_stats(data)
+    if name in COLUMNAR_JSON:
+        names = list(data.keys())
+        return [dict(zip(names, values)) for values in zip(*data.values())]
+    if isinstance(data, dict):
+        data = [data]
+    return data
+
+
+class _JsonScanner:
+    """從檔案一段一段讀、一次 decode 一個 JSON 值（整份檔案不會一起進記憶體）。"""
+
+    def __init__(self, f, chunk_size=1 << 16):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        data = self.f.read(self.chunk_size)
+        if not data:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """跳過空白，回傳下一個字元（檔案結束回傳 ""）。"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, chars):
+        c = self.peek()
+        if not c or c not in chars:
+            raise ValueError(f"JSON 格式不對：預期 {chars!r}，讀到 {c!r}")
+        self.pos += 1
+        return c
+
+    def value(self):
+        self.peek()
+        # 數字（例如 "2400.0"）被切在這段的結尾會 decode 成別的值：先確定後面至少還有 64 個字
+        while not self.eof and len(self.buf) - self.pos < 64:
+            self._fill()
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            if end == len(self.buf) and not self.eof and self._fill():
+                continue
+            self.pos = end
+            return obj
+
+
+def iter_json_rows(name):
+    """
+    一筆一筆讀一張表的 JSON（值跟 _read_json_rows 一樣），整份檔案不會一起進記憶體；
+    欄式 JSON 先把每一欄拆到暫存檔，再一列一列接回來。不支援巢狀的 player_stats。檔案不存在就什麼都不回傳。
+    """
+    src = json_path(name)
+    if not src.exists():
+        return
+    with src.open("r", encoding="utf-8") as f:
+        scanner = _JsonScanner(f)
+        if name not in COLUMNAR_JSON:
+            scanner.expect("[")
+            if scanner.peek() == "]":
+                return
+            while True:
+                yield scanner.value()
+                if scanner.expect(",]") == "]":
+                    return
+
+        with tempfile.TemporaryDirectory(dir=src.parent) as spill_dir:
+            names = []
+            scanner.expect("{")
+            if scanner.peek() != "}":
+                while True:
+                    names.append(scanner.value())
+                    scanner.expect(":")
+                    scanner.expect("[")
+                    with open(os.path.join(spill_dir, str(len(names))), "w", encoding="utf-8") as out:
+                        if scanner.peek() != "]":
+                            while True:
+                                out.write(json.dumps(scanner.value(), ensure_ascii=False) + "\n")
+                                if scanner.expect(",]") == "]":
+                                    break
+                        else:
+                            scanner.expect("]")
+                    if scanner.expect(",}") == "}":
+                        break
+
+            files = [open(os.path.join(spill_dir, str(i + 1)), "r", encoding="utf-8") for i in range(len(names))]
+            try:
+                for lines in zip(*files):
+                    yield dict(zip(names, (json.loads(line) for line in lines)))
+            finally:
+                for fh in files:
+                    fh.close()
+
+
+def read_rows(name, columns=None):
+    """
+    讀一張表，回傳 list[dict]；columns 給了就只讀（只回傳）這些欄位。
+    Parquet 可用就只讀需要的欄位，否則讀 JSON。值都是 Python 原生型別（int / float / str / None）。
+    """
+    if _parquet_fresh(name):
+        return pq.read_table(parquet_path(name), columns=columns).to_pylist()
+
+    rows = _read_json_rows(name)
+    if columns is None:
+        return rows
+    return [{c: r.get(c) for c in columns} for r in rows]
+
+
+def read_frame(name, columns=None, game_ids=None):
+    """
+    讀一張表成 pandas DataFrame，columns 給了就只讀這些欄位；檔案不存在回傳空表。
+    game_ids 給了就只要這幾場比賽的 rows（Parquet 用 filter 讀，不把整張表轉成 DataFrame）。
+    """
+    import pandas as pd
+
+    if _parquet_fresh(name):
+        filters = None if game_ids is None else [("game_id", "in", list(game_ids))]
+        return pq.read_table(parquet_path(name), columns=columns, filters=filters).to_pandas()
+
+    rows = _read_json_rows(name)
+    df = pd.DataFrame(rows)
+    if game_ids is not None and not df.empty:
+        df = df[df["game_id"].isin(list(game_ids))].reset_index(drop=True)
+    if columns is not None and not df.empty:
+        df = df[[c for c in columns if c in df.columns]]
+    return df
+
+
+# -------- 變動記錄：哪些比賽的 rows 變了（給增量計算用）--------
+
+def changes_path(name):
+    return DATA_DIR / f"{JSON_NAMES.get(name, name)}.changes.json"
+
+
+def record_changes(name, game_ids=None):
+    """
+    記下 name 這張表有哪些比賽的 rows 被換過 / 拿掉（寫表的程式呼叫，例如 stats_crawler）；
+    game_ids=None 表示整張表都可能變了。跟還沒被處理掉的記錄合併，處理完由讀的一方 clear_changes。
+    """
+    pending = pending_changes(name) or {"all": False, "game_ids": []}
+    if game_ids is None:
+        pending = {"all": True, "game_ids": []}
+    elif not pending["all"]:
+        pending["game_ids"] = sorted(set(pending["game_ids"]) | set(game_ids))
+
+    path = changes_path(name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(pending, f)
+    tmp.replace(path)
+
+
+def pending_changes(name):
+    """還沒處理的變動記錄 {"all": bool, "game_ids": [...]}；沒有記錄回傳 None。"""
+    path = changes_path(name)
+    if not path.exists():
+        return None
+    with path.open("r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def clear_changes(name):
+    changes_path(name).unlink(missing_ok=True)
+
+
+def source_stamp(name):
+    """JSON 檔的 (mtime_ns, 大小)，用來發現沒有留下變動記錄的修改（手動改檔 / git checkout）；沒有檔案回傳 None。"""
+    src = json_path(name)
+    if not src.exists():
+        return None
+    stat = src.stat()
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+# -------- 把現有 JSON 全部轉成 Parquet --------
+
+def convert_all():
+    if pa is None:
+        print("沒有安裝 pyarrow，請先 pip install pyarrow")
+        return
+
+    print(f"{'表':<20} {'JSON':>10} {'Parquet':>10} {'讀 JSON':>10} {'讀 Parquet':>12}")
+    for name in SCHEMAS:
+        src = json_path(name)
+        if not src.exists():
+            continue
+
+        start = time.perf_counter()
+        rows = _read_json_rows(name)
+        json_seconds = time.perf_counter() - start
+
+        if not write_table(name, rows):
+            continue
+        start = time.perf_counter()
+        pq.read_table(parquet_path(name)).to_pylist()
+        parquet_seconds = time.perf_counter() - start
+
+        print(
+            f"{name:<20} {src.stat().st_size / 1024:>8.1f}KB "
+            f"{parquet_path(name).stat().st_size / 1024:>8.1f}KB "
+            f"{json_seconds * 1000:>8.1f}ms {parquet_seconds * 1000:>10.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    convert_all()
@@ -0,0 +1,258 @@
+# team_rolling.py
+# 功能：球隊「最近 N 場」、「某段日期」的 OffRtg / DefRtg / Net / Pace / eFG%（近況）
+#
+# 每隊的比賽依日期排好，需要的欄位各做一次累加（prefix sum，整張表 O(n) 建一次）；
+# 任何一段比賽的加總 = 兩個累加值相減，所以查一個視窗是 O(1)（日期區間多一次二分搜尋），
+# Dashboard 拉 slider 不用每次重新加總。
+# 回合數用同一場對手配好的數據（analyze_team_advanced.pair_opponents），校正係數跟 team_advanced.json 一樣，
+# 視窗涵蓋整季時數字會跟 team_advanced.json 完全相同。
+#
+# 輸出 data/team_rolling.json：每隊每場比賽打完當下的最近 N 場（ROLLING_WINDOWS）數據，畫近況走勢用。
+#
+# 用法：
+#   python src/team_rolling.py
+
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import analyze_team_advanced
+from analyze_team_advanced import possessions, safe_div
+import storage
+
+OUTPUT_PATH = Path("data/team_rolling.json")
+
+# 預先算好的視窗：最近幾場
+ROLLING_WINDOWS = (5, 10)
+
+# 要做 prefix sum 的欄位（都是整數，相減不會有小數誤差）
+WINDOW_COLUMNS = [
+    "points_for", "points_against", "fgm", "three_pm", "fga", "fta", "oreb", "tov",
+    "opp_fga", "opp_fta", "opp_oreb", "opp_tov",
+]
+
+
+def load_team_games():
+    """
+    每場每隊一列：team_stats_raw 配好同一場的對手（opp_*），再從賽程表補上 date / time。
+    沒有資料回傳空的 DataFrame。
+    """
+    rows = storage.read_rows("team_stats_raw", columns=analyze_team_advanced.INPUT_COLUMNS)
+    if not rows:
+        return pd.DataFrame()
+
+    games = analyze_team_advanced.pair_opponents(pd.DataFrame(rows))
+    schedule = pd.DataFrame(
+        storage.read_rows("schedule_raw", columns=["game_id", "date", "time"]),
+        columns=["game_id", "date", "time"],
+    ).drop_duplicates("game_id")
+    return games.merge(schedule, on="game_id", how="left")
+
+
+class TeamWindows:
+    """
+    每隊依比賽日期排好的 prefix sum，查任意一段比賽的球隊數據。
+
+    rows 依（球隊第一次出現的順序, date, time, game_id）排好，同一隊的比賽是連續的一段
+    [starts[t], ends[t])；prefix[c][i] = 前 i 列的 c 加總（prefix[c][0] = 0），
+    第 s ~ e-1 列的加總就是 prefix[c][e] − prefix[c][s]。
+    沒有日期的比賽排在該隊最前面（跟賽程表的排序一樣）。
+    """
+
+    def __init__(self, games):
+        codes, team_ids = pd.factorize(games["team_id"], sort=False, use_na_sentinel=False)
+        _, first_rows = np.unique(codes, return_index=True)
+        self.team_ids = np.asarray(team_ids, dtype=object)
+        self.team_names = games["team_name"].to_numpy()[first_rows]
+
+        frame = games.assign(
+            _team=codes,
+            date=games["date"].fillna(""),
+            time=games["time"].fillna("99:99"),
+        ).sort_values(["_team", "date", "time", "game_id"], kind="stable")
+
+        counts = np.bincount(codes, minlength=len(team_ids))
+        self.ends = np.cumsum(counts)
+        self.starts = self.ends - counts
+        self.game_ids = frame["game_id"].to_numpy()
+        self.dates = frame["date"].to_numpy(dtype=object)
+        # (球隊, 日期名次) 合成一個整數鍵：rows 已依 (_team, date) 排好，所以整條是遞增的，
+        # 每隊「某天以前有幾列」就是一次 searchsorted，不用逐隊跑
+        self.unique_dates = np.unique(self.dates.astype(str))
+        self._date_keys = (frame["_team"].to_numpy(dtype=np.int64) * (len(self.unique_dates) + 1)
+                           + np.searchsorted(self.unique_dates, self.dates.astype(str)))
+        self.prefix = {
+            c: np.concatenate([[0], np.cumsum(frame[c].fillna(0).to_numpy(dtype=np.int64))])
+            for c in WINDOW_COLUMNS
+        }
+
+        # 整季的 possessions → 跟 team_advanced.json 同一個 Pace 校正係數
+        whole = self._sums(self.starts, self.ends)
+        self.scale = analyze_team_advanced.pace_scale(
+            counts, possessions(whole["fga"], whole["fta"], whole["oreb"], whole["tov"]))
+
+    def _sums(self, starts, ends):
+        """每個視窗 [starts[i], ends[i]) 的各欄加總（float，算指標用）。"""
+        return {c: (p[ends] - p[starts]).astype(np.float64) for c, p in self.prefix.items()}
+
+    def _dates_at(self, idx, valid):
+        return np.where(valid, self.dates[np.clip(idx, 0, max(len(self.dates) - 1, 0))], None)
+
+    def ratings(self, teams, starts, ends):
+        """
+        一次算很多個視窗（全部是整欄運算）：第 i 個視窗是球隊 teams[i]（球隊編號）的第 starts[i] ~ ends[i]-1 列。
+        回傳 DataFrame：team_id, team_name, games, date_from, date_to, off_rtg, def_rtg, net_rtg, pace, efg
+        """
+        teams = np.asarray(teams)
+        starts = np.asarray(starts)
+        ends = np.asarray(ends)
+        games = ends - starts
+        s = self._sums(starts, ends)
+
+        poss_for = possessions(s["fga"], s["fta"], s["oreb"], s["tov"]) * self.scale
+        poss_against = possessions(s["opp_fga"], s["opp_fta"], s["opp_oreb"], s["opp_tov"]) * self.scale
+        off_rtg = safe_div(s["points_for"] * 100, poss_for)
+        def_rtg = safe_div(s["points_against"] * 100, poss_against)
+
+        return pd.DataFrame({
+            "team_id": self.team_ids[teams],
+            "team_name": self.team_names[teams],
+            "games": games,
+            "date_from": self._dates_at(starts, games > 0),
+            "date_to": self._dates_at(ends - 1, games > 0),
+            "off_rtg": off_rtg,
+            "def_rtg": def_rtg,
+            "net_rtg": off_rtg - def_rtg,
+            "pace": safe_div(poss_for, games),
+            "efg": safe_div(s["fgm"] + 0.5 * s["three_pm"], s["fga"]),
+        })
+
+    def _rows_before(self, date, side):
+        """每隊日期 < date（side="left"）或 <= date（side="right"）的列數，加上該隊的起點 = 全表的列號。"""
+        rank = np.searchsorted(self.unique_dates, date, side=side)
+        keys = np.arange(len(self.team_ids), dtype=np.int64) * (len(self.unique_dates) + 1) + rank
+        return np.searchsorted(self._date_keys, keys, side="left")
+
+    def _ends_as_of(self, date):
+        """每隊「date 當天（含）以前」的最後一列 + 1。"""
+        return self._rows_before(date, "right")
+
+    # -------- 查詢（Dashboard 用）--------
+
+    def last_n(self, n, as_of=None):
+        """每隊最近 n 場（as_of："YYYY-MM-DD"，只看這天以前打的）；不到 n 場就用全部。"""
+        ends = self.ends if as_of is None else self._ends_as_of(as_of)
+        starts = np.maximum(self.starts, ends - n)
+        return self.ratings(np.arange(len(self.team_ids)), starts, ends)
+
+    def date_range(self, date_from=None, date_to=None):
+        """每隊在 date_from ~ date_to（"YYYY-MM-DD"，含頭尾；None = 不限）之間的比賽。"""
+        starts = self.starts
+        if date_from is not None:
+            starts = self._rows_before(date_from, "left")
+        ends = self.ends if date_to is None else self._ends_as_of(date_to)
+        return self.ratings(np.arange(len(self.team_ids)), starts, np.maximum(starts, ends))
+
+    def season(self):
+        return self.ratings(np.arange(len(self.team_ids)), self.starts, self.ends)
+
+    def rolling_table(self, windows=ROLLING_WINDOWS, teams=None):
+        """
+        每隊每場比賽打完當下的最近 N 場數據（每個 N 一組），一次整欄算完。
+        多了 game_id / date / game_no（這是該隊第幾場）/ window 欄位。
+        teams：只算這幾隊（球隊編號），None = 全部。
+        """
+        if teams is None:
+            teams = np.arange(len(self.team_ids))
+        counts = self.ends[teams] - self.starts[teams]
+        team_of_row = np.repeat(teams, counts)
+        # 每隊的第幾場（從 0 起）→ 全表的列號
+        game_no = np.arange(len(team_of_row)) - np.repeat(np.cumsum(counts) - counts, counts)
+        ends = self.starts[team_of_row] + game_no + 1
+        frames = []
+        for n in windows:
+            frame = self.ratings(team_of_row, np.maximum(self.starts[team_of_row], ends - n), ends)
+            frame.insert(2, "game_id", self.game_ids[ends - 1])
+            frame.insert(3, "date", self.dates[ends - 1])
+            frame.insert(4, "game_no", game_no + 1)
+            frame.insert(5, "window", n)
+            frames.append(frame)
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
+
+
+def load_windows():
+    """讀資料建好 TeamWindows；沒有資料回傳 None。"""
+    games = load_team_games()
+    if games.empty:
+        return None
+    return TeamWindows(games)
+
+
+def write_rolling(table):
+    OUTPUT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with OUTPUT_PATH.open("w", encoding="utf-8") as f:
+        json.dump(table, f, ensure_ascii=False, indent=2)
+    storage.write_table("team_rolling", table)
+    print(f"已將近況數據寫入 {OUTPUT_PATH}（{len(table)} 筆）\n")
+
+
+def update_teams(team_ids):
+    """
+    只重算 team_ids 這幾隊的近況、換進 team_rolling.json，其他隊的 rows 照舊（live_poller 每輪呼叫）。
+    Pace 校正係數是全聯盟一起算的，其他隊的數字要等下一次 build_rolling 才會跟著新係數更新
+    （差距只在係數的小數點後幾位）。還沒有 team_rolling.json 時改成 build_rolling()。
+    """
+    if not OUTPUT_PATH.exists():
+        build_rolling()
+        return
+    windows = load_windows()
+    if windows is None:
+        return
+
+    codes = {team_id: code for code, team_id in enumerate(windows.team_ids)}
+    teams = np.array(sorted(codes[t] for t in set(team_ids) if t in codes), dtype=np.int64)
+    fresh = windows.rolling_table(teams=teams)
+    old = pd.DataFrame(storage.read_rows("team_rolling"))
+    if not old.empty:
+        old = old[old["team_id"].isin(codes) & ~old["team_id"].isin(fresh["team_id"])]
+        fresh = pd.concat([old, fresh], ignore_index=True)
+
+    # 排序跟 rolling_table 一樣：window → 球隊（第一次出現的順序）→ 第幾場
+    fresh = fresh.assign(_team=fresh["team_id"].map(codes)).sort_values(
+        ["window", "_team", "game_no"], kind="stable").drop(columns="_team")
+    write_rolling(analyze_team_advanced.to_records(fresh))
+
+
+def build_rolling():
+    windows = load_windows()
+    if windows is None:
+        print("找不到 data/team_stats_raw.json，請先跑 stats_crawler.py")
+        return
+
+    write_rolling(analyze_team_advanced.to_records(windows.rolling_table()))
+
+    n = ROLLING_WINDOWS[0]
+    recent = windows.last_n(n).sort_values("net_rtg", ascending=False, kind="stable")
+    print(f"=== 最近 {n} 場（依 Net 排序） ===")
+    print("{:<10} {:<12} {:>5} {:>8} {:>8} {:>8} {:>8} {:>8}".format(
+        "TeamID", "Team", "G", "OffRtg", "DefRtg", "Net", "Pace", "eFG%"
+    ))
+    for t in analyze_team_advanced.to_records(recent):
+        print("{:<10} {:<12} {:>5} {:>8.1f} {:>8.1f} {:>8.1f} {:>8.1f} {:>8.3f}".format(
+            t["team_id"],
+            t["team_name"][:10],
+            t["games"],
+            t["off_rtg"] or 0,
+            t["def_rtg"] or 0,
+            t["net_rtg"] or 0,
+            t["pace"] or 0,
+            t["efg"] or 0,
+        ))
+
+
+if __name__ == "__main__":
+    build_rolling()
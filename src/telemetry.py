@@ -0,0 +1,238 @@
+# telemetry.py
+# 功能：每次爬完寫一份結構化的執行紀錄，看爬蟲的時間花在哪、API 有沒有變慢
+#   data/telemetry/{crawler}.json   run report：總耗時、成功與否、各 endpoint 的 request 數 / 錯誤 /
+#                                   重試 / 快取 / 傳輸量 / p50 / p99 / latency histogram、各表產出筆數
+#   data/telemetry/{crawler}.prom   同樣的數字，Prometheus textfile 格式（給 node_exporter 的 textfile collector）
+# 每次都跟上一次的 report 比：某個 endpoint 的 p50 變成 DEGRADED_RATIO 倍以上就印警告，也記在 report 裡。
+#
+# 用法（爬蟲的 main）：
+#   with telemetry.crawl_run("stats_crawler"):
+#       ...
+#       telemetry.record_rows("team_stats_raw", len(rows))
+#
+# 設環境變數 TPBL_TELEMETRY_DIR 可以改輸出目錄（例如直接寫到 node_exporter 的 textfile 目錄）。
+
+from contextlib import contextmanager
+from datetime import datetime
+import json
+import os
+from pathlib import Path
+import threading
+import time
+
+import http_client
+
+TELEMETRY_DIR = Path(os.environ.get("TPBL_TELEMETRY_DIR", "data/telemetry"))
+
+# p50 比上一次慢這麼多倍就算變慢；request 太少的 endpoint 不比（樣本不夠，波動太大）
+DEGRADED_RATIO = 2.0
+DEGRADED_MIN_REQUESTS = 5
+
+_rows = {}
+_rows_lock = threading.Lock()
+_current = None   # 進行中的 run：(crawler, started_at, perf_counter 起點, 上一次的 report)
+
+
+def record_rows(table, n):
+    """記錄這次產出幾筆資料（同一張表寫好幾次就累加）。"""
+    with _rows_lock:
+        _rows[table] = _rows.get(table, 0) + n
+
+
+def reset():
+    """清掉 request 統計與產出筆數，開始一次新的 run。"""
+    http_client.stats.reset()
+    with _rows_lock:
+        _rows.clear()
+
+
+def report_path(crawler):
+    return TELEMETRY_DIR / f"{crawler}.json"
+
+
+def prom_path(crawler):
+    return TELEMETRY_DIR / f"{crawler}.prom"
+
+
+def load_report(crawler):
+    path = report_path(crawler)
+    if not path.exists():
+        return None
+    with path.open("r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def find_degraded(endpoints, previous):
+    """跟上一次的 report 比，回傳 p50 變慢 DEGRADED_RATIO 倍以上的 endpoint。"""
+    if not previous:
+        return []
+    degraded = []
+    for name, e in endpoints.items():
+        old = (previous.get("http") or {}).get("endpoints", {}).get(name)
+        if not old or min(e["requests"], old["requests"]) < DEGRADED_MIN_REQUESTS:
+            continue
+        if old["p50_seconds"] > 0 and e["p50_seconds"] >= DEGRADED_RATIO * old["p50_seconds"]:
+            degraded.append({
+                "endpoint": name,
+                "p50_seconds": e["p50_seconds"],
+                "previous_p50_seconds": old["p50_seconds"],
+            })
+    return degraded
+
+
+def build_report(crawler, started_at, duration, status, error=None, previous=None):
+    http = http_client.stats.snapshot()
+    with _rows_lock:
+        rows = dict(sorted(_rows.items()))
+    return {
+        "crawler": crawler,
+        "started_at": datetime.fromtimestamp(started_at).isoformat(timespec="seconds"),
+        "finished_at": datetime.fromtimestamp(started_at + duration).isoformat(timespec="seconds"),
+        "duration_seconds": round(duration, 3),
+        "status": status,          # ok / failed / interrupted；還在跑（flush）是 running
+        "error": error,
+        "http": http,
+        "rows": rows,
+        "degraded": find_degraded(http["endpoints"], previous),
+    }
+
+
+# -------- Prometheus textfile --------
+
+def _label_value(v):
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{k}="{_label_value(v)}"' for k, v in labels.items()) + "}"
+
+
+# 每個 endpoint 一個數字的 metric：(名稱, report 裡的 key, 說明)
+ENDPOINT_METRICS = [
+    ("tpbl_crawl_http_requests", "requests", "這次 run 的 request 數（含失敗）"),
+    ("tpbl_crawl_http_errors", "errors", "失敗的 request 數"),
+    ("tpbl_crawl_http_retries", "retries", "重試次數"),
+    ("tpbl_crawl_http_cache_hits", "cache_hits", "磁碟快取命中（沒打 API）"),
+    ("tpbl_crawl_http_revalidated", "revalidated", "伺服器回 304、沿用快取的次數"),
+    ("tpbl_crawl_http_wire_bytes", "wire_bytes", "網路上傳輸的 bytes（壓縮後）"),
+    ("tpbl_crawl_http_body_bytes", "body_bytes", "解壓後的 response 大小"),
+    ("tpbl_crawl_http_p50_seconds", "p50_seconds", "request 延遲 p50"),
+    ("tpbl_crawl_http_p99_seconds", "p99_seconds", "request 延遲 p99"),
+]
+
+
+def to_prometheus(report):
+    """run report → Prometheus textfile 內容。數字都是「最後一次 run」的值，所以型別用 gauge。"""
+    crawler = report["crawler"]
+    endpoints = report["http"]["endpoints"]
+    lines = []
+
+    def family(name, mtype, help_text):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {mtype}")
+
+    family("tpbl_crawl_success", "gauge", "最後一次 run 是否成功（1 / 0；還在跑算 1）")
+    ok = report["status"] in ("ok", "running")
+    lines.append(f"tpbl_crawl_success{_labels(crawler=crawler)} {int(ok)}")
+    family("tpbl_crawl_duration_seconds", "gauge", "最後一次 run 的總耗時")
+    lines.append(f"tpbl_crawl_duration_seconds{_labels(crawler=crawler)} {report['duration_seconds']}")
+    family("tpbl_crawl_last_run_timestamp_seconds", "gauge", "最後一次 run 結束的時間（unix time）")
+    finished = datetime.fromisoformat(report["finished_at"]).timestamp()
+    lines.append(f"tpbl_crawl_last_run_timestamp_seconds{_labels(crawler=crawler)} {finished:.0f}")
+
+    for name, key, help_text in ENDPOINT_METRICS:
+        family(name, "gauge", help_text)
+        for endpoint, e in endpoints.items():
+            lines.append(f"{name}{_labels(crawler=crawler, endpoint=endpoint)} {e[key]}")
+
+    name = "tpbl_crawl_http_request_duration_seconds"
+    family(name, "histogram", "request 延遲分布")
+    for endpoint, e in endpoints.items():
+        for le, count in e["histogram"].items():
+            lines.append(f"{name}_bucket{_labels(crawler=crawler, endpoint=endpoint, le=le)} {count}")
+        lines.append(f"{name}_sum{_labels(crawler=crawler, endpoint=endpoint)} {e['total_seconds']}")
+        lines.append(f"{name}_count{_labels(crawler=crawler, endpoint=endpoint)} {e['requests']}")
+
+    family("tpbl_crawl_latency_degraded", "gauge",
+           f"p50 比上一次 run 慢 {DEGRADED_RATIO:g} 倍以上的 endpoint（1 / 0）")
+    degraded = {d["endpoint"] for d in report["degraded"]}
+    for endpoint in endpoints:
+        lines.append(
+            f"tpbl_crawl_latency_degraded{_labels(crawler=crawler, endpoint=endpoint)} "
+            f"{int(endpoint in degraded)}"
+        )
+
+    family("tpbl_crawl_rows", "gauge", "這次 run 各表產出的筆數")
+    for table, n in report["rows"].items():
+        lines.append(f"tpbl_crawl_rows{_labels(crawler=crawler, table=table)} {n}")
+
+    return "\n".join(lines) + "\n"
+
+
+# -------- 寫檔 --------
+
+def _atomic_write(path, text):
+    """先寫暫存檔再 os.replace，node_exporter 不會讀到寫一半的檔案。"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def write_report(report):
+    crawler = report["crawler"]
+    _atomic_write(report_path(crawler), json.dumps(report, ensure_ascii=False, indent=2))
+    _atomic_write(prom_path(crawler), to_prometheus(report))
+
+
+def print_endpoints(report):
+    """在終端機印出每個 endpoint 的 request 數與延遲，以及變慢的 endpoint。"""
+    for name, e in report["http"]["endpoints"].items():
+        print(
+            f"  {name:<28} {e['requests']:>5} req  p50 {e['p50_seconds'] * 1000:>6.0f} ms  "
+            f"p99 {e['p99_seconds'] * 1000:>6.0f} ms  錯誤 {e['errors']}、重試 {e['retries']}"
+        )
+    for d in report["degraded"]:
+        print(
+            f"⚠ {d['endpoint']} 變慢了：p50 {d['previous_p50_seconds'] * 1000:.0f} ms → "
+            f"{d['p50_seconds'] * 1000:.0f} ms"
+        )
+
+
+@contextmanager
+def crawl_run(crawler):
+    """
+    包住一次爬蟲執行：開始時清掉統計，結束（包含丟錯、Ctrl+C）時寫 run report 與 .prom。
+    例外會照常往外丟。
+    """
+    global _current
+    reset()
+    # 先讀上一次的 report 再開始：中途 flush 會蓋掉它，變慢要跟「上一次 run」比
+    _current = (crawler, time.time(), time.perf_counter(), load_report(crawler))
+    status, error = "ok", None
+    try:
+        yield
+    except KeyboardInterrupt:
+        status, error = "interrupted", "KeyboardInterrupt"
+        raise
+    except Exception as e:
+        status, error = "failed", f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        report = _finish(status, error)
+        _current = None
+        print_endpoints(report)
+        print(f"執行紀錄已寫入 {report_path(crawler)}、{prom_path(crawler)}")
+
+
+def flush():
+    """跑很久的程式（live_poller）中途先寫一次目前為止的 report（status = running）。"""
+    if _current is not None:
+        _finish("running", None)
+
+
+def _finish(status, error):
+    crawler, started_at, start, previous = _current
+    report = build_report(crawler, started_at, time.perf_counter() - start, status, error, previous)
+    write_report(report)
+    return report
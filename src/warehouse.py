@@ -0,0 +1,325 @@
+# warehouse.py
+# 功能：把爬下來的資料存進 SQLite（data/tpbl.sqlite），查詢走索引，不用每次掃整個 JSON
+#
+# 資料表：
+#   games               每場比賽（賽程 + 比分），key = game_id
+#   team_game_stats     每場每隊的全場數據，key = (game_id, team_side)
+#   players             球員基本資料（名單、位置、身高體重、照片），key = player_id
+#   player_season_stats 球員整季場均 / 累計 / 命中率，key = (season_id, player_id)
+# 索引：team_id、date、status、player_id
+#
+# 爬蟲寫完 JSON 後會呼叫 upsert_*()：同一個 key 就更新，新的就新增（增量爬也不會重複）。
+# 欄位定義沿用 storage.SCHEMAS，兩邊不會對不上。
+#
+# 用法：
+#   python src/warehouse.py          # 從 data/ 現有的 JSON 重建 / 補齊整個資料庫
+
+from contextlib import closing
+from datetime import datetime
+import json
+from pathlib import Path
+import sqlite3
+
+import storage
+
+
+DB_PATH = Path("data/tpbl.sqlite")   # 從別的目錄呼叫（例如 app.py）可以改成絕對路徑
+
+SQL_TYPES = {"int": "INTEGER", "float": "REAL", "str": "TEXT", "bool": "INTEGER"}
+
+# 資料表 → (欄位定義, primary key)
+TABLES = {
+    "games": (storage.SCHEMAS["schedule_raw"], ("game_id",)),
+    "team_game_stats": (storage.SCHEMAS["team_stats_raw"], ("game_id", "team_side")),
+    "players": (
+        [
+            ("player_id", "int"), ("name", "str"), ("number", "str"),
+            ("team_id", "int"), ("team_name", "str"),
+            ("position", "str"), ("alt_name", "str"), ("birthday", "str"),
+            ("height", "int"), ("weight", "int"), ("img_url", "str"),
+        ],
+        ("player_id",),
+    ),
+    "player_season_stats": (
+        [("season_id", "int")] + [
+            (col, t) for col, t in storage.SCHEMAS["player_stats"]
+            if col not in ("player_name", "number", "position")   # 這些放 players 表
+        ],
+        ("season_id", "player_id"),
+    ),
+}
+
+INDEXES = [
+    ("games", "date"),
+    ("games", "status"),
+    ("games", "home_team_id"),
+    ("games", "away_team_id"),
+    ("team_game_stats", "team_id"),
+    ("players", "team_id"),
+    ("player_season_stats", "player_id"),
+    ("player_season_stats", "team_id"),
+]
+
+
+def _columns(table):
+    return [col for col, _ in TABLES[table][0]]
+
+
+def _create_schema(conn):
+    for table, (columns, key) in TABLES.items():
+        cols = ", ".join(f"{col} {SQL_TYPES[t]}" for col, t in columns)
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} "
+            f"({cols}, updated_at TEXT, PRIMARY KEY ({', '.join(key)}))"
+        )
+    for table, col in INDEXES:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{col} ON {table} ({col})")
+
+
+def exists():
+    return DB_PATH.exists()
+
+
+def has_rows(table):
+    """
+    資料庫在、而且這張表至少有一筆資料。
+    各爬蟲只寫自己的表（例如只跑過 schedule_crawler 時 players 是空的），讀取端要看的是那張表有沒有資料，
+    不能只看資料庫檔案在不在。
+    """
+    if not exists():
+        return False
+    try:
+        return bool(_query(f"SELECT 1 FROM {table} LIMIT 1"))
+    except sqlite3.OperationalError:   # 舊的資料庫還沒有這張表
+        return False
+
+
+# 這個 process 已經建過 schema 的資料庫（寫入端只在第一次寫的時候跑 DDL）
+_schema_ready = set()
+
+
+def connect():
+    """
+    寫入用：開資料庫（沒有就建立），回傳 sqlite3.Connection，row 可以用欄位名取值。
+    用 WAL 模式，pipeline 平行跑的爬蟲同時寫入時會排隊而不是報錯。
+    WAL 設定與 CREATE TABLE / INDEX 每個 process 只在第一次開的時候跑。
+    """
+    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+    key = DB_PATH.resolve()
+    if not DB_PATH.exists():   # 被刪掉重建的話要重新建 schema
+        _schema_ready.discard(key)
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    conn.row_factory = sqlite3.Row
+    if key not in _schema_ready:
+        conn.execute("PRAGMA journal_mode=WAL")   # 寫進資料庫檔，之後的連線都是 WAL
+        with conn:
+            _create_schema(conn)
+        _schema_ready.add(key)
+    return conn
+
+
+def connect_readonly():
+    """
+    查詢用：唯讀開啟，不跑 PRAGMA / DDL（Dashboard 每次 rerun 都會查）。
+    資料庫不存在會丟 sqlite3.OperationalError，呼叫前先用 exists() / has_rows() 確認。
+    """
+    conn = sqlite3.connect(f"{DB_PATH.resolve().as_uri()}?mode=ro", uri=True, timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _upsert(table, rows):
+    """rows（list[dict]）依 primary key upsert 進 table，回傳筆數。"""
+    columns = _columns(table)
+    key = TABLES[table][1]
+    updates = ", ".join(f"{c} = excluded.{c}" for c in columns + ["updated_at"] if c not in key)
+    sql = (
+        f"INSERT INTO {table} ({', '.join(columns)}, updated_at) "
+        f"VALUES ({', '.join('?' for _ in columns)}, ?) "
+        f"ON CONFLICT ({', '.join(key)}) DO UPDATE SET {updates}"
+    )
+    now = datetime.now().isoformat(timespec="seconds")
+    values = [[r.get(c) for c in columns] + [now] for r in rows]
+
+    with closing(connect()) as conn, conn:   # 第二個 conn：整批同一個 transaction
+        conn.executemany(sql, values)
+    return len(values)
+
+
+# -------- 寫入（爬蟲呼叫）--------
+
+def upsert_games(games):
+    """schedule_crawler 的統一賽程表（schedule_raw.json 的 rows）。"""
+    return _upsert("games", games)
+
+
+def upsert_team_game_stats(rows):
+    """stats_crawler 的全場隊伍數據（team_stats_raw.json 的 rows）。"""
+    return _upsert("team_game_stats", rows)
+
+
+def upsert_players(master_players):
+    """/divisions/{id}/players 的原始名單（players_master_raw.json）。"""
+    rows = []
+    for p in master_players:
+        meta = p.get("meta") or {}
+        team = p.get("team") or {}
+        images = p.get("images") or []
+
+        # 照片優先用 key == "md"，沒有就第一張
+        img_url = next((img.get("url") for img in images if img.get("key") == "md"), None)
+        if not img_url and images:
+            img_url = images[0].get("url")
+
+        rows.append({
+            "player_id": p.get("id"),
+            "name": p.get("name"),
+            "number": p.get("number"),
+            "team_id": team.get("id"),
+            "team_name": team.get("name"),
+            "position": meta.get("position"),
+            "alt_name": meta.get("alt_name"),
+            "birthday": meta.get("birthday"),
+            "height": meta.get("height"),
+            "weight": meta.get("weight"),
+            "img_url": img_url,
+        })
+    return _upsert("players", rows)
+
+
+def upsert_player_season_stats(raw_players, season_id):
+    """/games/stats/players 的球員整季數據（player_stats_raw.json）。"""
+    return upsert_player_season_rows(storage.flatten_player_stats(raw_players), season_id)
+
+
+def upsert_player_season_rows(rows, season_id):
+    """已經攤平成 player_stats 表的 rows（storage.flatten_player_stats 的結果）。"""
+    return _upsert("player_season_stats", [dict(r, season_id=season_id) for r in rows])
+
+
+# -------- 查詢（schedule_viewer / app.py 用）--------
+
+def _query(sql, params=()):
+    with closing(connect_readonly()) as conn:
+        return [dict(r) for r in conn.execute(sql, params)]
+
+
+def _fix_games(rows):
+    for r in rows:
+        if r.get("is_live") is not None:
+            r["is_live"] = bool(r["is_live"])
+    return rows
+
+
+def games(team_id=None, status=None, date_from=None, date_to=None, season_id=None):
+    """
+    查比賽，依日期、時間排序。條件都是選填：
+      team_id：主隊或客隊是這隊（走 home_team_id / away_team_id 索引）
+      status：例如 "COMPLETED"
+      date_from / date_to："YYYY-MM-DD"，含頭尾
+    """
+    where, params = [], []
+    if team_id is not None:
+        where.append("(home_team_id = ? OR away_team_id = ?)")
+        params += [team_id, team_id]
+    if status is not None:
+        where.append("status = ?")
+        params.append(status)
+    if date_from is not None:
+        where.append("date >= ?")
+        params.append(date_from)
+    if date_to is not None:
+        where.append("date <= ?")
+        params.append(date_to)
+    if season_id is not None:
+        where.append("season_id = ?")
+        params.append(season_id)
+
+    sql = "SELECT * FROM games"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY date, time"
+    return _fix_games(_query(sql, params))
+
+
+def teams():
+    """所有出現過的球隊：list[{"team_id", "team_name"}]，依 team_id 排序。"""
+    return _query(
+        "SELECT home_team_id AS team_id, home_team_name AS team_name FROM games "
+        "UNION SELECT away_team_id, away_team_name FROM games "
+        "ORDER BY team_id"
+    )
+
+
+def find_teams(keyword):
+    """隊名包含關鍵字（不分大小寫）的球隊。"""
+    keyword = keyword.lower()
+    return [t for t in teams() if keyword in (t["team_name"] or "").lower()]
+
+
+def team_game_stats(team_id):
+    """某隊每場的全場數據，依比賽日期排序。"""
+    return _query(
+        "SELECT s.* FROM team_game_stats s LEFT JOIN games g USING (game_id) "
+        "WHERE s.team_id = ? ORDER BY g.date, g.time, s.game_id",
+        (team_id,),
+    )
+
+
+def players(team_id=None):
+    """球員基本資料，可以只查某隊。"""
+    if team_id is None:
+        return _query("SELECT * FROM players ORDER BY player_id")
+    return _query("SELECT * FROM players WHERE team_id = ? ORDER BY player_id", (team_id,))
+
+
+def player_season_stats(player_id=None, season_id=None):
+    """球員整季數據（場均 avg_* / 累計 acc_* / 命中率 pct_*）。"""
+    where, params = [], []
+    if player_id is not None:
+        where.append("player_id = ?")
+        params.append(player_id)
+    if season_id is not None:
+        where.append("season_id = ?")
+        params.append(season_id)
+    sql = "SELECT * FROM player_season_stats"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return _query(sql + " ORDER BY season_id, player_id", params)
+
+
+# -------- 從 data/ 的 JSON 重建 --------
+
+def _load_json(path):
+    if not path.exists():
+        return None
+    with path.open("r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def rebuild(season_id):
+    """
+    把 data/ 現有的 JSON 全部 upsert 進資料庫（已經有的會更新，不會重複）。
+    season_id：player_stats_raw.json 是哪一季的數據（檔案本身沒有記錄）
+    """
+    data_dir = DB_PATH.parent
+    loaders = [
+        ("games", data_dir / "schedule_raw.json", upsert_games),
+        ("team_game_stats", data_dir / "team_stats_raw.json", upsert_team_game_stats),
+        ("players", data_dir / "players_master_raw.json", upsert_players),
+        ("player_season_stats", data_dir / "player_stats_raw.json",
+         lambda d: upsert_player_season_stats(d, season_id)),
+    ]
+    for table, path, load in loaders:
+        data = _load_json(path)
+        if data is None:
+            print(f"略過 {table}：找不到 {path}")
+            continue
+        print(f"{table}：{load(data)} 筆（來自 {path}）")
+    print(f"已更新 {DB_PATH}")
+
+
+if __name__ == "__main__":
+    import schedule_crawler  # 只有這裡用到；放最上面會循環 import
+
+    rebuild(schedule_crawler.CURRENT_SEASON_ID)
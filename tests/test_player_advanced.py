@@ -0,0 +1,61 @@
+# test_player_advanced.py
+# player_advanced 的基本資訊欄位：沒有名字 / 沒有球隊的球員要顯示 "N/A"（跟逐筆計算的舊版一樣）
+#
+# 用法（在專案根目錄）：
+#   python -m pytest -q
+
+from pathlib import Path
+import sys
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+import player_advanced  # noqa: E402
+import storage  # noqa: E402
+
+
+def raw_player(player_id, player=None, team=None, **extra):
+    """最小的一筆 player_stats_raw：數據只給幾個，其他 key 不存在。"""
+    return dict(
+        {
+            "player": {"id": player_id, **(player or {})},
+            "team": team,
+            "game_count": 3,
+            "average_stats": {"score": 10.0, "field_goals_attempted": 8.0, "turnovers": 1.0},
+            "accumulated_stats": {"turnovers": 3},
+        },
+        **extra,
+    )
+
+
+def build(raw_players):
+    return {p["player_id"]: p for p in player_advanced.build_player_advanced(raw_players)}
+
+
+def test_names_default_to_na():
+    result = build([
+        raw_player(1, {"name": "王小明"}, {"id": 10, "name": "新北國王"}),
+        raw_player(2, team=None),                          # team 是 None
+        raw_player(3, {"name": "李大華"}, {"id": 10}),     # team 沒有 name
+        {"player": {"id": 4}, "game_count": 1},            # 連 team key 都沒有
+    ])
+
+    assert result[1]["player_name"] == "王小明"
+    assert result[1]["team_name"] == "新北國王"
+    assert result[2]["player_name"] == "N/A"
+    assert result[2]["team_name"] == "N/A"
+    assert result[2]["team_id"] is None
+    assert result[3]["player_name"] == "李大華"
+    assert result[3]["team_name"] == "N/A"
+    assert result[4]["player_name"] == "N/A"
+    assert result[4]["team_name"] == "N/A"
+
+
+def test_percentiles_keep_na_names():
+    raw = [raw_player(1, {"name": "王小明"}, {"id": 10, "name": "新北國王"}), raw_player(2, team=None)]
+    df = player_advanced.players_frame(storage.player_stats_columns(raw, player_advanced.INPUT_COLUMNS))
+    frame = player_advanced.build_player_advanced_frame(df)
+    percentiles = player_advanced.to_records(player_advanced.build_percentiles(frame, df["position"]))
+
+    names = {(p["player_id"], p["player_name"], p["team_name"]) for p in percentiles}
+    assert names == {(1, "王小明", "新北國王"), (2, "N/A", "N/A")}
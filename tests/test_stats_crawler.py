@@ -0,0 +1,59 @@
+# test_stats_crawler.py
+# stats_crawler 解析 /games/{id}/stats：同一份回應要抽出球隊全場、分節與球員單場數據
+#
+# fixtures/games/1496/stats.json 是一場比賽的 /games/{id}/stats 回應（目錄結構跟
+# replay_server.py --fixtures 一樣，可以直接拿來餵 replay server）。
+#
+# 用法（在專案根目錄）：
+#   python -m pytest -q
+
+import json
+from pathlib import Path
+import sys
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+import stats_crawler  # noqa: E402
+
+FIXTURE = Path(__file__).resolve().parent / "fixtures" / "games" / "1496" / "stats.json"
+
+
+def load_fixture():
+    with FIXTURE.open("r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_fixture_yields_player_lines():
+    parsed = stats_crawler.extract_game(1496, load_fixture())
+
+    assert len(parsed["team"]) == 2
+    assert len(parsed["quarters"]) == 8
+    # 每隊 5 位有上場；沒有數據的替補不輸出
+    assert len(parsed["players"]) == 10
+    assert {p["team_side"] for p in parsed["players"]} == {"home", "away"}
+    assert all(p["player_id"] is not None and p["player_name"] for p in parsed["players"])
+
+
+def test_player_lines_sum_rounds_to_team_score():
+    parsed = stats_crawler.extract_game(1496, load_fixture())
+
+    for team in parsed["team"]:
+        players = [p for p in parsed["players"] if p["team_id"] == team["team_id"]]
+        assert sum(p["pts"] for p in players) == team["points_for"]
+        # 各節加總：上場 4 節 × 600 秒
+        assert all(p["time_on_court"] == 2400 for p in players)
+
+
+def test_warns_when_finished_game_has_no_player_lines(capsys):
+    payload = load_fixture()
+    for side in ("home_team", "away_team"):
+        payload[side]["players"] = []
+    parsed = stats_crawler.extract_game(1496, payload)
+
+    stats_crawler.warn_missing_player_lines({"id": 1496, "status": "COMPLETED"}, parsed)
+    assert "1496" in capsys.readouterr().out
+
+    # 還沒結束的比賽沒有球員數據是正常的
+    stats_crawler.warn_missing_player_lines({"id": 1496, "status": "UPCOMING"}, parsed)
+    assert capsys.readouterr().out == ""